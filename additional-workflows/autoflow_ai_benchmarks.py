@@ -0,0 +1,741 @@
+# AUTOFLOW AI - OFFLINE BENCHMARK SUITE
+# =====================================
+# Reproducible benchmarks for the AutoFlow AI API hot paths. Everything runs offline: the
+# Anthropic and OpenAI clients are deterministic fakes, Redis is fakeredis (with its lua extra, for the K9X lease scripts) and the database is SQLite.
+#
+#   pytest autoflow_ai_benchmarks.py --benchmark-autosave          # per-call timings, saved per commit
+#   python autoflow_ai_benchmarks.py load -c 1 8 32 -o load.json    # throughput and p50/p99 per endpoint
+#   python autoflow_ai_benchmarks.py compare base.json head.json    # flag regressions between commits
+#   python autoflow_ai_benchmarks.py corpus -s 1 10 100 -o corpus.json  # template parse/convert/index scaling
+#   python autoflow_ai_benchmarks.py prompts -o prompts.json         # grounded prompt tokens and max_tokens
+
+import os
+import sys
+import json
+import re
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+import itertools
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from contextlib import ExitStack
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from unittest import mock
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("ANTHROPIC_API_KEY", "offline-benchmark")
+
+import httpx
+import pytest
+import fakeredis
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import autoflow_ai_unified_implementation as autoflow
+
+# ============================================================================
+# SECTION 1: DETERMINISTIC FAKE SERVICES
+# ============================================================================
+
+BENCHMARK_DESCRIPTIONS = [
+    "Create a workflow that sends email when form is submitted",
+    "Summarize new Gmail messages with AI and post them to Slack",
+    "Sync new Stripe customers into a Google Sheet every hour",
+    "Classify support tickets and route urgent ones to on-call",
+    "Generate social media captions for new blog posts",
+    "Enrich inbound leads and create HubSpot contacts",
+    "Transcribe uploaded audio and store notes in Notion",
+    "Monitor competitor pricing pages and alert on changes"
+]
+
+def fake_workflow(description: str, node_count: Optional[int] = None) -> Dict:
+    '''Build the workflow the fake model returns for a description, identical on every run'''
+
+    rng = random.Random(hashlib.sha256(description.encode()).hexdigest())
+    node_count = node_count or rng.randint(3, 8)
+    node_types = autoflow.AutoFlowConfig.WORKFLOW_NODE_TYPES
+
+    nodes = [{"type": "trigger", "name": "Trigger", "config": {"source": "webhook"}}]
+    for i in range(1, node_count):
+        node_type = rng.choice(node_types[1:])
+        nodes.append({
+            "type": node_type,
+            "name": f"{node_type.replace('_', ' ').title()} {i}",
+            "config": {"retries": rng.randint(0, 3), "timeout_seconds": rng.choice([10, 30, 60])}
+        })
+
+    return {
+        "nodes": nodes,
+        "connections": [{"from": i, "to": i + 1} for i in range(node_count - 1)],
+        "metadata": {"description": description}
+    }
+
+def tokenize(text: str, chars_per_token: int = 4) -> List[str]:
+    '''Split text into pseudo-tokens of roughly the size the real tokenizer produces'''
+    return [text[i:i + chars_per_token] for i in range(0, len(text), chars_per_token)]
+
+class FakeAnthropicClient:
+    '''Deterministic stand-in for AsyncAnthropic with configurable latency and token streaming'''
+
+    def __init__(self, latency_ms: float = 0, tokens_per_second: float = 0):
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.calls = 0
+        self.messages = SimpleNamespace(create=self._create)
+
+    async def _create(self, model: str, max_tokens: int, messages: List[Dict], system: str = "", stream: bool = False, **kwargs):
+        self.calls += 1
+        description = messages[-1]["content"]
+        text = json.dumps(fake_workflow(description))
+        tokens = tokenize(text)[:max_tokens]
+        usage = SimpleNamespace(input_tokens=len(tokenize(system + description)), output_tokens=len(tokens))
+
+        if stream:
+            return self._stream(model, tokens, usage)
+
+        await asyncio.sleep(self.latency_ms / 1000 + self._generation_seconds(len(tokens)))
+        return SimpleNamespace(
+            id=f"msg_fake_{self.calls}",
+            model=model,
+            content=[SimpleNamespace(type="text", text="".join(tokens))],
+            stop_reason="end_turn" if len(tokens) < max_tokens else "max_tokens",
+            usage=usage
+        )
+
+    async def _stream(self, model: str, tokens: List[str], usage: SimpleNamespace):
+        await asyncio.sleep(self.latency_ms / 1000)
+        yield SimpleNamespace(type="message_start", message=SimpleNamespace(model=model, usage=usage))
+        for token in tokens:
+            await asyncio.sleep(self._generation_seconds(1))
+            yield SimpleNamespace(type="content_block_delta", index=0, delta=SimpleNamespace(type="text_delta", text=token))
+        yield SimpleNamespace(type="message_stop")
+
+    def _generation_seconds(self, token_count: int) -> float:
+        return token_count / self.tokens_per_second if self.tokens_per_second else 0
+
+class FakeOpenAIClient:
+    '''Deterministic stand-in for AsyncOpenAI chat completions, same workflows as the Anthropic fake'''
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: List[Dict], max_tokens: int = 2000, **kwargs):
+        self.calls += 1
+        tokens = tokenize(json.dumps(fake_workflow(messages[-1]["content"])))[:max_tokens]
+        await asyncio.sleep(self.latency_ms / 1000)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, finish_reason="stop", message=SimpleNamespace(role="assistant", content="".join(tokens)))],
+            usage=SimpleNamespace(
+                prompt_tokens=sum(len(tokenize(message["content"])) for message in messages),
+                completion_tokens=len(tokens)
+            )
+        )
+
+# ============================================================================
+# SECTION 2: OFFLINE APPLICATION HARNESS
+# ============================================================================
+
+class OfflineAutoFlow:
+    '''Wire the FastAPI app to the fake model, fakeredis and a throwaway SQLite database'''
+
+    def __init__(self, latency_ms: float = 0, tokens_per_second: float = 0, seed_workflows: int = 100, seed_sessions: int = 100):
+        self.llm = FakeAnthropicClient(latency_ms, tokens_per_second)
+        self.openai_llm = FakeOpenAIClient(latency_ms)
+        self.redis_server = fakeredis.FakeServer()
+        self.seed_workflows = seed_workflows
+        self.seed_sessions = seed_sessions
+        self.session_ids: List[str] = []
+        self._stack = ExitStack()
+
+    def __enter__(self) -> "OfflineAutoFlow":
+        workdir = self._stack.enter_context(tempfile.TemporaryDirectory(prefix="autoflow-bench-"))
+        engine = create_engine(f"sqlite:///{workdir}/autoflow.db", connect_args={"check_same_thread": False})
+        autoflow.Base.metadata.create_all(engine)
+        self._stack.callback(engine.dispose)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        self._stack.enter_context(mock.patch.object(autoflow, "AsyncAnthropic", lambda **kwargs: self.llm))
+        self._stack.enter_context(mock.patch.object(autoflow.openai, "AsyncOpenAI", lambda **kwargs: self.openai_llm))
+        self._stack.enter_context(mock.patch.object(
+            autoflow.redis.Redis, "from_url", lambda url, **kwargs: fakeredis.FakeRedis(server=self.redis_server)
+        ))
+        self._stack.enter_context(mock.patch.object(autoflow, "k9x_session_store", autoflow.ShardedSessionStore(
+            {"bench": fakeredis.FakeRedis(server=self.redis_server)}
+        )))
+        autoflow.app.dependency_overrides[autoflow.get_db] = self._get_db
+        self._stack.callback(autoflow.app.dependency_overrides.pop, autoflow.get_db, None)
+
+        self._seed()
+        self.client = self._stack.enter_context(TestClient(autoflow.app))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _get_db(self):
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _seed(self):
+        db = self.SessionLocal()
+        for tier in ("starter", "pro", "enterprise"):
+            db.add(autoflow.User(email=f"{tier}@bench.local", name=tier.title(), tier=tier))
+        for i in range(self.seed_workflows):
+            description = BENCHMARK_DESCRIPTIONS[i % len(BENCHMARK_DESCRIPTIONS)]
+            reactflow_data = autoflow.ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(fake_workflow(description))
+            db.add(autoflow.Workflow(
+                user_id=1 + i % 3,
+                name=f"Benchmark workflow {i}",
+                description=description,
+                nodes=reactflow_data["nodes"],
+                connections=reactflow_data["edges"],
+                ai_generated=True
+            ))
+        db.commit()
+        db.close()
+
+        async def start_sessions():
+            optimizer = autoflow.K9XQuantumOptimizer()
+            for i in range(self.seed_sessions):
+                result = await optimizer.start_conversation(1 + i % 3, BENCHMARK_DESCRIPTIONS[i % len(BENCHMARK_DESCRIPTIONS)])
+                self.session_ids.append(result["session_id"])
+
+        asyncio.run(start_sessions())
+
+    def request_for(self, endpoint: str, i: int) -> Tuple[str, str, Optional[Dict]]:
+        '''Return the (method, path, json body) of the i-th request against an endpoint'''
+
+        description = BENCHMARK_DESCRIPTIONS[i % len(BENCHMARK_DESCRIPTIONS)]
+        workflow_id = 1 + i % self.seed_workflows
+
+        if endpoint == "generate":
+            return "POST", "/api/workflows/generate", {"user_id": 1 + i % 3, "description": description}
+        if endpoint == "generate_batch":
+            items = [{"description": BENCHMARK_DESCRIPTIONS[(i + k) % len(BENCHMARK_DESCRIPTIONS)]} for k in range(10)]
+            return "POST", "/api/workflows/generate/batch", {"user_id": 1 + i % 3, "items": items}
+        if endpoint == "generate_job":
+            return "POST", "/api/workflows/generate/jobs", {"user_id": 1 + i % 3, "description": description}
+        if endpoint == "get_reactflow":
+            return "GET", f"/api/workflows/{workflow_id}/reactflow", None
+        if endpoint == "save_reactflow":
+            reactflow_data = autoflow.ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(fake_workflow(description))
+            return "POST", f"/api/workflows/{workflow_id}/save-reactflow", reactflow_data
+        if endpoint == "list_workflows":
+            return "GET", f"/api/users/{1 + i % 3}/workflows?limit=50", None
+        if endpoint == "k9x_start":
+            return "POST", "/api/k9x/conversation/start", {"user_id": 1 + i % 3, "initial_request": description}
+        if endpoint == "k9x_continue":
+            session_id = self.session_ids[i % len(self.session_ids)]
+            return "POST", "/api/k9x/conversation/continue", {"session_id": session_id, "responses": {"audience": "founders"}}
+        raise KeyError(endpoint)
+
+BENCHMARK_ENDPOINTS = ["generate", "generate_batch", "generate_job", "get_reactflow", "save_reactflow", "list_workflows", "k9x_start", "k9x_continue"]
+
+# ============================================================================
+# SECTION 3: PYTEST-BENCHMARK SUITE
+# ============================================================================
+
+@pytest.fixture(scope="module")
+def offline_autoflow():
+    latency_ms = float(os.getenv("AUTOFLOW_BENCH_LLM_LATENCY_MS", "0"))
+    with OfflineAutoFlow(latency_ms=latency_ms) as harness:
+        yield harness
+
+class TestApiBenchmarks:
+    '''Per-call timings for each API hot path'''
+
+    @pytest.mark.parametrize("endpoint", BENCHMARK_ENDPOINTS)
+    def test_endpoint(self, benchmark, offline_autoflow, endpoint):
+        counter = itertools.count()
+
+        def call():
+            method, path, body = offline_autoflow.request_for(endpoint, next(counter))
+            return offline_autoflow.client.request(method, path, json=body)
+
+        response = benchmark(call)
+        assert response.status_code in (200, 202)
+
+    @pytest.mark.parametrize("encoding", ["identity"] + autoflow.response_compressor.encodings)
+    def test_get_reactflow_encoded(self, benchmark, offline_autoflow, encoding):
+        counter = itertools.count()
+
+        def call():
+            method, path, _ = offline_autoflow.request_for("get_reactflow", next(counter))
+            return offline_autoflow.client.request(method, path, headers={"Accept-Encoding": encoding})
+
+        response = benchmark(call)
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize("node_count", [10, 100, 1000])
+    def test_convert_ai_workflow_to_reactflow(self, benchmark, node_count):
+        workflow = fake_workflow(BENCHMARK_DESCRIPTIONS[0], node_count=node_count)
+        reactflow_data = benchmark(autoflow.ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow, workflow)
+        assert len(reactflow_data["nodes"]) == node_count
+
+    @pytest.mark.parametrize("node_count", [1000, 5000])
+    @pytest.mark.parametrize("media_type", ["application/json", "application/msgpack"])
+    def test_reactflow_serialization(self, benchmark, media_type, node_count):
+        codecs = {
+            "application/json": (lambda payload: json.dumps(payload, separators=(",", ":")).encode(), json.loads),
+            "application/msgpack": (autoflow.ReactFlowColumnarCodec.pack, autoflow.ReactFlowColumnarCodec.unpack)
+        }
+        encode, decode = codecs[media_type]
+        reactflow_data = autoflow.ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(fake_workflow(BENCHMARK_DESCRIPTIONS[0], node_count=node_count))
+        benchmark.extra_info["bytes"] = len(encode(reactflow_data))
+        assert benchmark(lambda: decode(encode(reactflow_data))) == reactflow_data
+
+# ============================================================================
+# SECTION 4: LOAD DRIVER
+# ============================================================================
+
+def percentile(values: List[float], pct: float) -> float:
+    '''Nearest-rank percentile of an unsorted sample'''
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+async def run_load(harness: OfflineAutoFlow, endpoint: str, concurrency: int, total_requests: int) -> Dict:
+    '''Drive one endpoint with a fixed number of concurrent in-process clients'''
+
+    transport = httpx.ASGITransport(app=autoflow.app)
+    latencies = []
+    errors = 0
+    request_numbers = iter(range(total_requests))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://autoflow.bench") as client:
+        async def worker():
+            nonlocal errors
+            for i in request_numbers:
+                method, path, body = harness.request_for(endpoint, i)
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3)
+    }
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_load_suite(endpoints: List[str], concurrency_levels: List[int], total_requests: int, latency_ms: float, tokens_per_second: float) -> Dict:
+    '''Run every endpoint at every concurrency level and collect a comparable report'''
+
+    results = []
+    with OfflineAutoFlow(latency_ms=latency_ms, tokens_per_second=tokens_per_second) as harness:
+        for endpoint in endpoints:
+            for concurrency in concurrency_levels:
+                results.append(asyncio.run(run_load(harness, endpoint, concurrency, total_requests)))
+
+    return {
+        "commit": current_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "llm_latency_ms": latency_ms,
+            "llm_tokens_per_second": tokens_per_second,
+            "requests_per_level": total_requests
+        },
+        "results": results
+    }
+
+def compare_reports(base: Dict, head: Dict, threshold: float) -> List[str]:
+    '''List (endpoint, concurrency) pairs whose p99 or throughput regressed beyond the threshold'''
+
+    base_results = {(r["endpoint"], r["concurrency"]): r for r in base["results"]}
+    regressions = []
+    for result in head["results"]:
+        previous = base_results.get((result["endpoint"], result["concurrency"]))
+        if previous is None:
+            continue
+        p99_change = result["p99_ms"] / previous["p99_ms"] - 1 if previous["p99_ms"] else 0
+        throughput_change = result["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0
+        line = (f"{result['endpoint']:<16} c={result['concurrency']:<4} "
+                f"p99 {previous['p99_ms']:.2f} -> {result['p99_ms']:.2f} ms ({p99_change:+.1%})  "
+                f"rps {previous['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} ({throughput_change:+.1%})")
+        print(line)
+        if p99_change > threshold or throughput_change < -threshold:
+            regressions.append(line)
+    return regressions
+
+# ============================================================================
+# SECTION 5: TEMPLATE CORPUS BENCHMARK
+# ============================================================================
+
+def load_corpus_sources(directories: List[str]) -> List[Dict]:
+    '''Read the raw template texts plus the node ids that scaled copies will perturb'''
+
+    sources = []
+    for _, path in autoflow.N8NTemplateCorpus.iter_template_files(directories):
+        with open(path, encoding="utf-8", errors="replace") as template_file:
+            text = template_file.read()
+        template = autoflow.N8NTemplateCorpus.parse_template(text)
+        if template is None:
+            continue
+        node_ids = sorted({node["id"] for node in template["nodes"] if node.get("id")}, key=len, reverse=True)
+        sources.append({
+            "name": os.path.splitext(os.path.basename(path))[0],
+            "text": text,
+            "bytes": len(text.encode("utf-8")),
+            "id_pattern": re.compile("|".join(map(re.escape, node_ids))) if node_ids else None
+        })
+    return sources
+
+def scaled_corpus(sources: List[Dict], factor: int):
+    '''Yield (name, text, bytes) for factor copies of the corpus, each copy with fresh deterministic node ids'''
+
+    for copy in range(factor):
+        for source in sources:
+            if copy == 0 or source["id_pattern"] is None:
+                yield source["name"], source["text"], source["bytes"]
+                continue
+            text = source["id_pattern"].sub(lambda match: str(uuid.uuid5(uuid.NAMESPACE_OID, f"{match.group(0)}:{copy}")), source["text"])
+            yield f"{source['name']} #{copy}", text, len(text.encode("utf-8"))
+
+def measure_corpus_scale(sources: List[Dict], factor: int) -> Dict:
+    '''Time parse, conversion and indexing over a scaled corpus, then measure index memory in a second pass'''
+
+    parse_seconds = convert_seconds = index_seconds = 0.0
+    total_bytes = templates = nodes = edges = 0
+    index = autoflow.TemplateIndex()
+
+    for name, text, size in scaled_corpus(sources, factor):
+        started = time.perf_counter()
+        template = autoflow.N8NTemplateCorpus.parse_template(text, name=name)
+        parsed = time.perf_counter()
+        reactflow_data = autoflow.ReactFlowWorkflowEditor.convert_n8n_template_to_reactflow(template)
+        converted = time.perf_counter()
+        index.add(template)
+        indexed = time.perf_counter()
+
+        parse_seconds += parsed - started
+        convert_seconds += converted - parsed
+        index_seconds += indexed - converted
+        total_bytes += size
+        templates += 1
+        nodes += len(reactflow_data["nodes"])
+        edges += len(reactflow_data["edges"])
+    del index
+
+    # tracemalloc slows allocation-heavy code several-fold, so memory gets its own pass
+    tracemalloc.start()
+    index = autoflow.TemplateIndex()
+    for name, text, _ in scaled_corpus(sources, factor):
+        index.add(autoflow.N8NTemplateCorpus.parse_template(text, name=name))
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "factor": factor,
+        "templates": templates,
+        "bytes": total_bytes,
+        "nodes": nodes,
+        "edges": edges,
+        "parse_seconds": round(parse_seconds, 4),
+        "parse_mb_per_second": round(total_bytes / 1e6 / parse_seconds, 2),
+        "convert_seconds": round(convert_seconds, 4),
+        "convert_templates_per_second": round(templates / convert_seconds, 1),
+        "convert_nodes_per_second": round(nodes / convert_seconds, 1),
+        "index_build_seconds": round(index_seconds, 4),
+        "index_terms": len(index.postings),
+        "index_retained_bytes": retained_bytes,
+        "index_peak_bytes": peak_bytes
+    }
+
+def synthetic_graph(node_count: int, seed: int = 7) -> Tuple[List[Dict], List[Dict]]:
+    '''Random DAG shaped like a workflow: a spanning tree plus ~30% cross edges'''
+
+    rng = random.Random(seed)
+    nodes = [{"id": f"node_{i}"} for i in range(node_count)]
+    edges = [{"source": f"node_{rng.randrange(i)}", "target": f"node_{i}"} for i in range(1, node_count)]
+    for _ in range(int(node_count * 0.3)):
+        source, target = sorted(rng.sample(range(node_count), 2)) if node_count > 1 else (0, 0)
+        edges.append({"source": f"node_{source}", "target": f"node_{target}"})
+    return nodes, edges
+
+def measure_layout(node_count: int, repeats: int = 5) -> Dict:
+    nodes, edges = synthetic_graph(node_count)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        autoflow.ReactFlowWorkflowEditor.auto_layout(nodes, edges)
+        timings.append(time.perf_counter() - started)
+    return {"nodes": node_count, "edges": len(edges), "best_seconds": round(min(timings), 6)}
+
+def run_corpus_suite(directories: List[str], scales: List[int], layout_sizes: List[int]) -> Dict:
+    sources = load_corpus_sources(directories)
+    return {
+        "commit": current_commit(),
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {
+            "directories": directories,
+            "templates": len(sources),
+            "bytes": sum(source["bytes"] for source in sources)
+        },
+        "scales": [measure_corpus_scale(sources, factor) for factor in scales],
+        "layout": [measure_layout(node_count) for node_count in layout_sizes]
+    }
+
+class TestTemplatePipelineBenchmarks:
+    '''Per-pass timings of the template pipeline over the unscaled corpus'''
+
+    @pytest.fixture(scope="class")
+    def corpus_sources(self):
+        return load_corpus_sources(autoflow.AutoFlowConfig.TEMPLATE_DIRECTORIES)
+
+    def test_parse_corpus(self, benchmark, corpus_sources):
+        templates = benchmark(lambda: [autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in corpus_sources])
+        assert all(templates)
+
+    def test_convert_corpus(self, benchmark, corpus_sources):
+        templates = [autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in corpus_sources]
+        benchmark(lambda: [autoflow.ReactFlowWorkflowEditor.convert_n8n_template_to_reactflow(template) for template in templates])
+
+    def test_deduplicate_corpus(self, benchmark, corpus_sources):
+        templates = [autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in corpus_sources]
+        variants = benchmark(autoflow.TemplateVariantIndex.deduplicate, templates)
+        assert len(variants.canonical_templates()) <= len(templates)
+
+    def test_build_template_index(self, benchmark, corpus_sources):
+        templates = [autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in corpus_sources]
+        index = benchmark(autoflow.TemplateIndex.build, templates)
+        assert len(index.documents) == len(templates)
+
+    def test_classify_corpus(self, benchmark, corpus_sources):
+        templates = [autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in corpus_sources]
+        classifier = autoflow.TemplateCategoryClassifier().fit(templates)
+        labels = benchmark(classifier.classify, templates)
+        assert len(labels) == len(templates)
+
+    def test_similarity_search(self, benchmark, corpus_sources):
+        templates = [autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in corpus_sources]
+        documents = [autoflow.template_vector_document(template) for template in templates]
+        vectorizer = autoflow.HashedTfidfVectorizer(autoflow.AutoFlowConfig.VECTOR_DIMENSIONS).fit(documents)
+        index = autoflow.VectorIndex(vectorizer.dimensions)
+        index.upsert(list(range(len(documents))), vectorizer.transform(documents))
+        results = benchmark(lambda: index.search(vectorizer.transform(documents[:1]), 5))
+        assert results[0][0][0] == 0
+
+def run_prompt_suite(directories: List[str], baseline_max_tokens: int = 2000) -> Dict:
+    '''Prompt tokens and output budget per benchmark description, grounded vs the flat baseline'''
+    library = autoflow.TemplateLibrary(directories)
+    library.load()
+    builder = autoflow.GenerationPromptBuilder(
+        library,
+        examples=autoflow.AutoFlowConfig.GENERATION_PROMPT_EXAMPLES,
+        prompt_token_budget=autoflow.AutoFlowConfig.GENERATION_PROMPT_TOKEN_BUDGET,
+        tokens_per_node=autoflow.AutoFlowConfig.GENERATION_OUTPUT_TOKENS_PER_NODE,
+        min_output_tokens=autoflow.AutoFlowConfig.GENERATION_MIN_OUTPUT_TOKENS,
+        max_output_tokens=autoflow.AutoFlowConfig.GENERATION_MAX_OUTPUT_TOKENS
+    )
+    prompts = []
+    for description in BENCHMARK_DESCRIPTIONS:
+        started = time.perf_counter()
+        prompt = asyncio.run(builder.build(description))
+        prompts.append({
+            "description": description,
+            "prompt_tokens": prompt["prompt_tokens"],
+            "max_tokens": prompt["max_tokens"],
+            "examples": prompt["examples"],
+            "build_ms": (time.perf_counter() - started) * 1000
+        })
+    return {"commit": current_commit(), "baseline_max_tokens": baseline_max_tokens, "prompts": prompts}
+
+COMPRESSION_PATHS = {
+    "get_reactflow": lambda harness, i: f"/api/workflows/{1 + i % harness.seed_workflows}/reactflow",
+    "list_templates": lambda harness, i: "/api/templates",
+    "export": lambda harness, i: f"/api/workflows/export?user_id={1 + i % 3}"
+}
+
+def run_compression_suite(requests_per_case: int, node_count: int) -> Dict:
+    '''Bytes on the wire and server CPU per request for each endpoint and Accept-Encoding'''
+    results = []
+    with OfflineAutoFlow(seed_sessions=0) as harness:
+        db = harness.SessionLocal()
+        for workflow in db.query(autoflow.Workflow):
+            reactflow_data = autoflow.ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(
+                fake_workflow(workflow.description, node_count=node_count)
+            )
+            workflow.nodes, workflow.connections = reactflow_data["nodes"], reactflow_data["edges"]
+        db.commit()
+        db.close()
+        for name, path_for in COMPRESSION_PATHS.items():
+            for encoding in ["identity"] + autoflow.response_compressor.encodings:
+                wire_bytes = 0
+                cpu_started, started = time.process_time(), time.perf_counter()
+                for i in range(requests_per_case):
+                    with harness.client.stream("GET", path_for(harness, i), headers={"Accept-Encoding": encoding}) as response:
+                        raw = b"".join(response.iter_raw())
+                    wire_bytes += len(raw)
+                results.append({
+                    "endpoint": name,
+                    "encoding": encoding,
+                    "wire_bytes_per_request": wire_bytes / requests_per_case,
+                    "cpu_ms_per_request": (time.process_time() - cpu_started) * 1000 / requests_per_case,
+                    "wall_ms_per_request": (time.perf_counter() - started) * 1000 / requests_per_case
+                })
+        results.append({"compressor": autoflow.response_compressor.metrics()})
+    return {"commit": current_commit(), "node_count": node_count, "results": results}
+
+class TestExecutionBenchmarks:
+    '''Plan compilation, plan cache lookups and execution of synthetic workflow graphs'''
+    @pytest.mark.parametrize("node_count", [100, 1000])
+    def test_compile_plan(self, benchmark, node_count):
+        nodes, edges = synthetic_graph(node_count)
+        engine = autoflow.WorkflowExecutionEngine(autoflow.stub_node_handlers(), max_concurrency=64, node_timeout_seconds=10)
+        plan = benchmark(engine.compile, nodes, edges)
+        assert len(plan.node_ids) == node_count
+
+    def test_cached_plan_lookup(self, benchmark):
+        nodes, edges = synthetic_graph(1000)
+        engine = autoflow.WorkflowExecutionEngine(autoflow.stub_node_handlers(), max_concurrency=64, node_timeout_seconds=10)
+        engine.plan_for(1, "v1", lambda: (nodes, edges))
+        plan = benchmark(engine.plan_for, 1, "v1", lambda: (nodes, edges))
+        assert engine.plan_cache.compiles == 1 and len(plan.node_ids) == 1000
+
+    @pytest.mark.parametrize("node_count", [100, 1000])
+    def test_execute_plan(self, benchmark, node_count):
+        nodes, edges = synthetic_graph(node_count)
+        engine = autoflow.WorkflowExecutionEngine(autoflow.stub_node_handlers(), max_concurrency=64, node_timeout_seconds=10)
+        plan = engine.compile(nodes, edges)
+        result = benchmark(lambda: asyncio.run(engine.execute(plan)))
+        assert result["status"] == "succeeded"
+
+    def test_execute_plan_warm_cache(self, benchmark):
+        nodes, edges = synthetic_graph(1000)
+        engine = autoflow.WorkflowExecutionEngine(autoflow.stub_node_handlers(), max_concurrency=64, node_timeout_seconds=10,
+                                                  output_cache=autoflow.NodeOutputCache(10000))
+        plan = engine.compile(nodes, edges)
+        asyncio.run(engine.execute(plan))
+        result = benchmark(lambda: asyncio.run(engine.execute(plan)))
+        assert result["cached_nodes"] == 1000
+
+class TestPromptBenchmarks:
+    '''Building the grounded generation prompt over the template corpus'''
+    def test_build_grounded_prompt(self, benchmark):
+        sources = load_corpus_sources(autoflow.AutoFlowConfig.TEMPLATE_DIRECTORIES)
+        library = autoflow.TemplateLibrary.from_templates([autoflow.N8NTemplateCorpus.parse_template(source["text"]) for source in sources])
+        builder = autoflow.GenerationPromptBuilder(library, examples=3, prompt_token_budget=1500, tokens_per_node=60,
+                                                   min_output_tokens=512, max_output_tokens=2000)
+        prompt = benchmark(lambda: asyncio.run(builder.build(BENCHMARK_DESCRIPTIONS[0])))
+        assert prompt["prompt_tokens"] <= 1500
+        assert prompt["max_tokens"] <= 2000
+
+# ============================================================================
+# SECTION 6: COMMAND LINE
+# ============================================================================
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="AutoFlow AI offline benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="measure throughput and p50/p99 per endpoint")
+    load.add_argument("-e", "--endpoints", nargs="+", default=BENCHMARK_ENDPOINTS, choices=BENCHMARK_ENDPOINTS)
+    load.add_argument("-c", "--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    load.add_argument("-n", "--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    load.add_argument("--llm-latency-ms", type=float, default=50)
+    load.add_argument("--llm-tokens-per-second", type=float, default=0)
+    load.add_argument("-o", "--output", default="autoflow-load.json")
+
+    compare = commands.add_parser("compare", help="compare two load reports")
+    compare.add_argument("base")
+    compare.add_argument("head")
+    compare.add_argument("--threshold", type=float, default=0.10)
+
+    corpus = commands.add_parser("corpus", help="measure template parse, convert, layout and index scaling")
+    corpus.add_argument("-d", "--directories", nargs="+", default=autoflow.AutoFlowConfig.TEMPLATE_DIRECTORIES)
+    corpus.add_argument("-s", "--scales", nargs="+", type=int, default=[1, 10, 100])
+    corpus.add_argument("--layout-sizes", nargs="+", type=int, default=[10, 100, 1000, 10000])
+    corpus.add_argument("-o", "--output", default="autoflow-corpus.json")
+
+    prompts = commands.add_parser("prompts", help="measure grounded prompt size and output budget per description")
+    prompts.add_argument("-d", "--directories", nargs="+", default=autoflow.AutoFlowConfig.TEMPLATE_DIRECTORIES)
+    prompts.add_argument("-o", "--output", default="autoflow-prompts.json")
+
+    compression = commands.add_parser("compression", help="measure bytes on the wire and CPU per request per Accept-Encoding")
+    compression.add_argument("-n", "--requests", type=int, default=200, help="requests per endpoint and encoding")
+    compression.add_argument("--nodes", type=int, default=40, help="nodes per seeded workflow")
+    compression.add_argument("-o", "--output", default="autoflow-compression.json")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compression":
+        report = run_compression_suite(args.requests, args.nodes)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        for result in report["results"][:-1]:
+            print(f"{result['endpoint']:<16} {result['encoding']:<9} {result['wire_bytes_per_request']:>11.0f} B/req  "
+                  f"cpu {result['cpu_ms_per_request']:>7.2f} ms  wall {result['wall_ms_per_request']:>7.2f} ms")
+        return 0
+
+    if args.command == "prompts":
+        report = run_prompt_suite(args.directories)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        for prompt in report["prompts"]:
+            print(f"{prompt['prompt_tokens']:>5} prompt tokens  max_tokens {prompt['max_tokens']:>5} / {report['baseline_max_tokens']}  "
+                  f"{prompt['build_ms']:>7.2f} ms  {prompt['description'][:60]}")
+        return 0
+
+    if args.command == "corpus":
+        report = run_corpus_suite(args.directories, args.scales, args.layout_sizes)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        for scale in report["scales"]:
+            print(f"x{scale['factor']:<4} {scale['templates']:>7} templates  parse {scale['parse_mb_per_second']:>7.1f} MB/s  "
+                  f"convert {scale['convert_templates_per_second']:>9.0f} tpl/s  index {scale['index_build_seconds']:>7.2f} s "
+                  f"peak {scale['index_peak_bytes'] / 1e6:>7.1f} MB")
+        for layout in report["layout"]:
+            print(f"layout {layout['nodes']:>6} nodes  {layout['best_seconds'] * 1000:>8.2f} ms")
+        return 0
+
+    if args.command == "load":
+        report = run_load_suite(args.endpoints, args.concurrency, args.requests, args.llm_latency_ms, args.llm_tokens_per_second)
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        for result in report["results"]:
+            print(f"{result['endpoint']:<16} c={result['concurrency']:<4} {result['throughput_rps']:>9.1f} rps  "
+                  f"p50 {result['p50_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  errors {result['errors']}")
+        return 0
+
+    with open(args.base) as base, open(args.head) as head:
+        regressions = compare_reports(json.load(base), json.load(head), args.threshold)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,19 +4,56 @@
 # K9X integration, and deployment configurations into one comprehensive development foundation.
 
 import os
+import re
+import sys
 import json
+import math
+import logging
+import time
+import uuid
+import random
+import socket
 import asyncio
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import base64
+import bisect
+import hashlib
+import inspect
+import threading
+import contextvars
+import zlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import Counter, OrderedDict, deque
+import contextlib
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, AsyncIterator, Awaitable, Callable, Tuple
 from dataclasses import dataclass, asdict
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, JSON
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from sqlalchemy import create_engine, bindparam, insert, select, update, delete, func, inspect as inspect_schema, type_coerce, or_, and_, Column, Integer, String, DateTime, Boolean, Text, JSON, Float, LargeBinary, Index, UniqueConstraint
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, Session, load_only
+from sqlalchemy.types import TypeDecorator
+import numpy as np
 import redis
 import openai
-from anthropic import Anthropic
+import zstandard
+from anthropic import AsyncAnthropic
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # br is simply not offered without it
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # ReactFlow payloads are then only served and accepted as JSON
+    msgpack = None
+
+logger = logging.getLogger("autoflow")
 
 # ============================================================================
 # SECTION 1: CORE PLATFORM CONFIGURATION
@@ -31,19 +68,136 @@ class AutoFlowConfig:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
     
+    # LLM Dispatch Configuration
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "1000"))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "400000"))
+    LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "1000"))
+    LLM_TIER_WEIGHTS = {"enterprise": 8, "pro": 3, "starter": 1}
+    
+    # Provider Routing Configuration
+    LLM_BACKENDS = [
+        {"provider": "anthropic", "model": "claude-3-sonnet-20240229"},
+        {"provider": "openai", "model": "gpt-4o"}
+    ]
+    LLM_ROUTING_EWMA_ALPHA = 0.2
+    LLM_ROUTING_EXPLORATION_RATE = 0.05
+    LLM_BACKEND_FAILURE_THRESHOLD = 3
+    LLM_BACKEND_COOLDOWN_SECONDS = 30
+    LLM_HEDGED_TIERS = ["enterprise"]
+    LLM_HEDGE_PERCENTILE = 95
+    LLM_HEDGE_DEFAULT_DEADLINE_SECONDS = 10.0
+    
+    # Batch Generation Configuration
+    BATCH_GENERATION_MAX_ITEMS = 100
+    BATCH_GENERATION_CONCURRENCY = 8
+    
+    # Generation Job Queue Configuration
+    GENERATION_JOB_WORKERS = int(os.getenv("GENERATION_JOB_WORKERS", "4"))
+    GENERATION_JOB_LEASE_SECONDS = 300
+    GENERATION_JOB_MAX_ATTEMPTS = 3
+    GENERATION_JOB_RETRY_BACKOFF_SECONDS = 5
+    GENERATION_JOB_POLL_INTERVAL_SECONDS = 0.5
+    
     # K9X Configuration
     K9X_ENABLED = True
     K9X_MEMORY_RETENTION_DAYS = 180
     K9X_QUANTUM_FEATURES = ["trend_analysis", "monetization_intel", "positioning_logic"]
+    K9X_SESSION_TTL_SECONDS = 24 * 60 * 60
+    K9X_CHECKPOINT_INTERVAL_SECONDS = 5.0  # write-behind interval for sessions held by a WebSocket
+    K9X_SESSION_LEASE_SECONDS = 30  # ownership marker of a WebSocket-held session, refreshed every checkpoint interval
+    # Session/vault shards; while a resharding rollout is migrating keys, K9X_REDIS_PREVIOUS_URLS holds the old list
+    K9X_REDIS_URLS = [url for url in os.getenv("K9X_REDIS_URLS", "").split(",") if url] or [REDIS_URL]
+    K9X_REDIS_PREVIOUS_URLS = [url for url in os.getenv("K9X_REDIS_PREVIOUS_URLS", "").split(",") if url]
+    K9X_RING_VIRTUAL_NODES = 160
     
     # ReactFlow Configuration
     REACTFLOW_VERSION = "11.10.0"
     WORKFLOW_NODE_TYPES = ["trigger", "action", "condition", "ai_generator", "k9x_optimizer"]
     
+    # Template Corpus Configuration
+    JSON_DICTIONARY_DIR = os.getenv("JSON_DICTIONARY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "zstd-dictionaries"))
+    JSON_DICTIONARY_SIZE = 64 * 1024
+    JSON_COMPRESSION_LEVEL = 3
+    # The playbook's own templates, the repo's categorized workflows/<category>/ tree and the awesome-n8n collection
+    TEMPLATE_DIRECTORIES = os.getenv("TEMPLATE_DIRECTORIES", os.pathsep.join([
+        os.path.dirname(os.path.abspath(__file__)),
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "workflows"),
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "awesome-n8n-templates-main")
+    ])).split(os.pathsep)
+    TEMPLATE_FAST_PATH_ENABLED = os.getenv("TEMPLATE_FAST_PATH_ENABLED", "true").lower() == "true"
+    TEMPLATE_FAST_PATH_MIN_CONFIDENCE = 0.8
+    TEMPLATE_FAST_PATH_MIN_TERMS = 3
+    TEMPLATE_DEDUP_ENABLED = True
+    TEMPLATE_DEDUP_THRESHOLD = 0.8  # estimated Jaccard similarity of structural shingles
+    TEMPLATE_CATEGORY_MIN_SCORE = 0.05  # cosine to the best category centroid; below it a template stays uncategorized
+    
+    # Similarity Index Configuration
+    VECTOR_DIMENSIONS = 512
+    VECTOR_EMBEDDING_MODEL = os.getenv("VECTOR_EMBEDDING_MODEL", "")  # optional sentence-transformers model
+    VECTOR_IVF_MIN_ROWS = 50000
+    VECTOR_IVF_PROBES = 8
+    SIMILAR_RESULTS_LIMIT = 5
+    SIMILAR_MAX_INDEXED_USERS = 10000  # least recently queried users' workflows are dropped from the index past this
+    
+    # Prompt Grounding Configuration
+    GENERATION_PROMPT_GROUNDING_ENABLED = os.getenv("GENERATION_PROMPT_GROUNDING_ENABLED", "true").lower() == "true"
+    GENERATION_PROMPT_EXAMPLES = 3
+    GENERATION_PROMPT_TOKEN_BUDGET = 1500
+    GENERATION_OUTPUT_TOKENS_PER_NODE = 60
+    GENERATION_MIN_OUTPUT_TOKENS = 512
+    GENERATION_MAX_OUTPUT_TOKENS = 2000
+    GENERATION_CONTINUATION_MAX_TOKENS = 1024
+    
+    # Workflow Execution Configuration
+    WORKFLOW_EXECUTION_MAX_CONCURRENCY = int(os.getenv("WORKFLOW_EXECUTION_MAX_CONCURRENCY", "32"))
+    WORKFLOW_EXECUTION_NODE_TIMEOUT_SECONDS = 30.0
+    WORKFLOW_EXECUTION_CPU_POOL = os.getenv("WORKFLOW_EXECUTION_CPU_POOL", "thread")  # thread or process
+    WORKFLOW_EXECUTION_CPU_WORKERS = os.cpu_count() or 4
+    NODE_OUTPUT_CACHE_MAX_ENTRIES = 10000
+    NODE_OUTPUT_CACHE_DIR = os.getenv("NODE_OUTPUT_CACHE_DIR", "")  # empty keeps the cache in memory only
+    NODE_OUTPUT_CACHE_MAX_DISK_ENTRIES = 100000
+    EXECUTION_PLAN_CACHE_MAX_ENTRIES = 1024
+    
+    # Cross-worker Cache Invalidation
+    CACHE_INVALIDATION_BACKEND = os.getenv("CACHE_INVALIDATION_BACKEND", "local")  # "local" (single node) or "redis"
+    CACHE_INVALIDATION_CHANNEL = "autoflow:invalidate"
+    CACHE_INVALIDATION_COALESCE_SECONDS = 0.05
+    CACHE_INVALIDATION_MAX_KEYS = 100000  # per-key generations and versions remembered, least recently invalidated dropped first
+    CACHE_FALLBACK_TTL_SECONDS = 30  # bounds staleness if a worker misses invalidation messages
+    REACTFLOW_CACHE_MAX_ENTRIES = 2048
+    
+    # Response Compression Configuration
+    COMPRESSION_ENCODINGS = ["zstd", "br", "gzip"]  # server preference among what the client accepts
+    COMPRESSION_MIN_BYTES = 1024
+    COMPRESSION_LEVELS = {"zstd": 3, "br": 5, "gzip": 6}
+    COMPRESSION_PRECOMPRESSED_LEVELS = {"zstd": 12, "br": 9, "gzip": 9}  # paid once per cached payload
+    REACTFLOW_MEDIA_TYPES = ["application/msgpack", "application/json"]  # server preference on equal q
+    
+    # Listing Configuration
+    WORKFLOW_LIST_DEFAULT_LIMIT = 50
+    WORKFLOW_LIST_MAX_LIMIT = 200
+    
+    # Bulk Export/Import Configuration
+    WORKFLOW_EXPORT_BATCH_SIZE = 500  # rows fetched per server-side cursor round-trip
+    WORKFLOW_IMPORT_BATCH_SIZE = 500  # rows per multi-row INSERT
+    WORKFLOW_IMPORT_COMMIT_ROWS = 5000
+    WORKFLOW_IMPORT_MAX_LINE_BYTES = 8 * 1024 * 1024
+    
     # Analytics Configuration
     ANALYTICS_TRACKING = True
     DEMO_ANALYTICS_ENABLED = True
     FEEDBACK_COLLECTION_ENABLED = True
+    
+    # Profiling Configuration
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_HEADER = "X-AutoFlow-Profile"
+    PROFILE_ALL_REQUESTS = os.getenv("PROFILE_ALL_REQUESTS", "false").lower() == "true"
+    PROFILING_INTERVAL_MS = 5
+    PROFILING_DIR = os.getenv("PROFILING_DIR", "/tmp/autoflow-profiles")
+    PROFILING_RING_SIZE = 100
+    GLOBAL_PROFILING_ENABLED = os.getenv("GLOBAL_PROFILING_ENABLED", "false").lower() == "true"
+    GLOBAL_PROFILING_INTERVAL_MS = 100
 
 # ============================================================================
 # SECTION 2: DATABASE MODELS AND SCHEMAS
@@ -51,6 +205,115 @@ class AutoFlowConfig:
 
 Base = declarative_base()
 
+class JSONDictionaries:
+    '''Versioned zstd dictionaries for CompressedJSON, read from JSON_DICTIONARY_DIR/workflow-json-v<N>.zdict
+    
+    New rows are written with the highest version; every version stays readable so
+    rows written under an older dictionary decode until recompress_json_columns
+    moves them forward. Compressor/decompressor contexts are not thread-safe, so
+    each thread keeps its own.
+    '''
+    
+    FILE_PATTERN = re.compile(r"^workflow-json-v(\d+)\.zdict$")
+    
+    def __init__(self, directory: str, level: int):
+        self.directory = directory
+        self.level = level
+        self._dictionaries = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def dictionaries(self) -> Dict[int, "zstandard.ZstdCompressionDict"]:
+        if self._dictionaries is None:
+            with self._lock:
+                if self._dictionaries is None:
+                    found = {}
+                    if os.path.isdir(self.directory):
+                        for name in os.listdir(self.directory):
+                            match = self.FILE_PATTERN.match(name)
+                            if match:
+                                with open(os.path.join(self.directory, name), "rb") as dictionary:
+                                    found[int(match.group(1))] = zstandard.ZstdCompressionDict(dictionary.read())
+                    self._dictionaries = found
+        return self._dictionaries
+    
+    @property
+    def current_version(self) -> int:
+        '''0 means no dictionary: plain zstd'''
+        return max(self.dictionaries(), default=0)
+    
+    def compressor(self) -> "zstandard.ZstdCompressor":
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            dictionary = self.dictionaries().get(self.current_version)
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary, write_content_size=True)
+            self._local.compressor = compressor
+        return compressor
+    
+    def decompressor(self, version: int) -> "zstandard.ZstdDecompressor":
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if version not in decompressors:
+            if version and version not in self.dictionaries():
+                raise LookupError(f"zstd dictionary v{version} is not installed in {self.directory}")
+            decompressors[version] = zstandard.ZstdDecompressor(dict_data=self.dictionaries().get(version))
+        return decompressors[version]
+    
+    MAX_VERSION = 255  # stored as a single header byte
+    
+    def install(self, dictionary_data: bytes) -> int:
+        '''Write a newly trained dictionary as the next version and make it current'''
+        version = self.current_version + 1
+        if version > self.MAX_VERSION:
+            raise ValueError(f"zstd dictionary versions are exhausted (max {self.MAX_VERSION}); renumber {self.directory} after recompressing")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, f"workflow-json-v{version}.zdict"), "wb") as dictionary:
+            dictionary.write(dictionary_data)
+        with self._lock:
+            self._dictionaries = None
+            self._local = threading.local()
+        return version
+
+json_dictionaries = JSONDictionaries(AutoFlowConfig.JSON_DICTIONARY_DIR, AutoFlowConfig.JSON_COMPRESSION_LEVEL)
+
+class CompressedJSON(TypeDecorator):
+    '''JSON stored as zstd-compressed bytes: b"Z", one dictionary-version byte, then the frame
+    
+    Values that are not in this format are legacy uncompressed JSON (text or bytes) and
+    are decoded as such, so the column type can be switched before rows are migrated.
+    '''
+    
+    impl = LargeBinary
+    cache_ok = True
+    MAGIC = b"Z"
+    
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        raw = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+        return CompressedJSON.MAGIC + bytes([json_dictionaries.current_version]) + json_dictionaries.compressor().compress(raw)
+    
+    @staticmethod
+    def decode(value: Any) -> Any:
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        if isinstance(value, bytes) and value[:1] == CompressedJSON.MAGIC:
+            return json.loads(json_dictionaries.decompressor(value[1]).decompress(value[2:]))
+        if isinstance(value, (bytes, str)):
+            return json.loads(value)
+        return value
+    
+    @staticmethod
+    def version(value: Any) -> Optional[int]:
+        '''Dictionary version of a stored value, None for legacy uncompressed JSON'''
+        if isinstance(value, memoryview):
+            value = value.tobytes()
+        return value[1] if isinstance(value, bytes) and value[:1] == CompressedJSON.MAGIC else None
+    
+    def process_bind_param(self, value, dialect):
+        return None if value is None else self.encode(value)
+    
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.decode(value)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -62,35 +325,86 @@ class User(Base):
 
 class Workflow(Base):
     __tablename__ = "workflows"
+    __table_args__ = (
+        # Seek index for per-user listings ordered by recency
+        Index("ix_workflows_user_updated", "user_id", "updated_at", "id"),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
     name = Column(String)
     description = Column(Text)
-    nodes = Column(JSON)
-    connections = Column(JSON)
+    nodes = Column(CompressedJSON)
+    connections = Column(CompressedJSON)
     ai_generated = Column(Boolean, default=False)
     k9x_optimized = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
+class WorkflowNode(Base):
+    '''Queryable copy of Workflow.nodes, one row per node; rewritten with the workflow on every save'''
+    __tablename__ = "workflow_nodes"
+    __table_args__ = (
+        Index("ix_workflow_nodes_type", "node_type", "workflow_id"),
+        Index("ix_workflow_nodes_n8n_type", "n8n_type", "workflow_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    workflow_id = Column(Integer, index=True)
+    node_id = Column(String)
+    node_type = Column(String)  # one of WORKFLOW_NODE_TYPES
+    n8n_type = Column(String)
+    name = Column(String)
+    position_x = Column(Float)
+    position_y = Column(Float)
+
+class WorkflowEdge(Base):
+    '''Queryable copy of Workflow.connections, one row per edge'''
+    __tablename__ = "workflow_edges"
+    id = Column(Integer, primary_key=True)
+    workflow_id = Column(Integer, index=True)
+    source_node_id = Column(String)
+    target_node_id = Column(String)
+    output_index = Column(Integer, default=0)
+
 class K9XConversation(Base):
     __tablename__ = "k9x_conversations"
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
     session_id = Column(String)
-    conversation_history = Column(JSON)
+    conversation_history = Column(CompressedJSON)
     vault_memory = Column(JSON)
     quantum_analysis = Column(JSON)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key"),
+        Index("ix_generation_jobs_claim", "status", "available_at"),
+    )
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, index=True)
+    idempotency_key = Column(String)
+    tier = Column(String, default="starter")
+    request = Column(JSON)
+    status = Column(String, default="pending")  # pending, running, succeeded, failed
+    attempts = Column(Integer, default=0)
+    available_at = Column(DateTime, default=datetime.utcnow)
+    lease_expires_at = Column(DateTime)
+    worker_id = Column(String)
+    result = Column(JSON)
+    error = Column(Text)
+    workflow_id = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class Template(Base):
     __tablename__ = "templates"
     id = Column(Integer, primary_key=True)
     name = Column(String)
     category = Column(String)
     description = Column(Text)
-    nodes = Column(JSON)
-    connections = Column(JSON)
+    nodes = Column(CompressedJSON)
+    connections = Column(CompressedJSON)
     usage_count = Column(Integer, default=0)
     is_featured = Column(Boolean, default=False)
 
@@ -98,35 +412,664 @@ class Template(Base):
 # SECTION 3: AI WORKFLOW GENERATION ENGINE
 # ============================================================================
 
+TOKEN_PIECE_PATTERN = re.compile(r"[A-Za-z]+|[0-9]+|[^\sA-Za-z0-9]")
+
+def estimate_tokens(text: str) -> int:
+    '''Local BPE-style token estimate: ~4 letters per token for words, one per digit run or symbol'''
+    return max(1, sum((len(piece) + 3) // 4 for piece in TOKEN_PIECE_PATTERN.findall(text)))
+
+@dataclass
+class LLMCompletion:
+    '''Provider-neutral result of one upstream model call'''
+    text: str
+    input_tokens: int
+    output_tokens: int
+    provider: str
+    model: str
+
+class LLMDispatcherOverloaded(Exception):
+    '''Raised when a tier's dispatch queue is full'''
+
+class TokenBucket:
+    '''Token bucket refilled continuously at rate_per_minute, holding at most one minute of budget'''
+    
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self, amount: float) -> float:
+        '''Seconds until amount tokens are available (0 when they are available now)'''
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+    
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+    
+    def refund(self, amount: float):
+        '''Return over-estimated tokens (or charge under-estimated ones when amount is negative)'''
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class LLMDispatcher:
+    '''Admission control for upstream model calls
+    
+    Calls wait in one FIFO queue per tier. Whenever a concurrency slot and rate budget are
+    free, the tier with the lowest virtual pass value is served and its pass advances by
+    1/weight, so backlogged tiers share throughput in proportion to LLM_TIER_WEIGHTS and a
+    starter flood cannot delay enterprise calls by more than a slot turnover.
+    '''
+    
+    def __init__(self, max_concurrency: int, requests_per_minute: float, tokens_per_minute: float,
+                 tier_weights: Dict[str, float], max_queue_depth: int):
+        self.max_concurrency = max_concurrency
+        self.tier_weights = tier_weights
+        self.max_queue_depth = max_queue_depth
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.queues = {tier: deque() for tier in tier_weights}
+        self.passes = {tier: 0.0 for tier in tier_weights}
+        self.virtual_time = 0.0
+        self.in_flight = 0
+        self.dispatched = Counter()
+        self.rejected = Counter()
+        self.wait_ms = {tier: deque(maxlen=1000) for tier in tier_weights}
+        self._loop = None
+        self._wakeup = None
+        self._pump_task = None
+    
+    async def submit(self, tier: str, call: Callable[[], Awaitable], estimated_tokens: int):
+        '''Queue call() under tier and return its result once it has been dispatched and completed'''
+        
+        self._bind_loop()
+        tier = tier if tier in self.queues else "starter"
+        queue = self.queues[tier]
+        if len(queue) >= self.max_queue_depth:
+            self.rejected[tier] += 1
+            raise LLMDispatcherOverloaded(f"LLM queue for tier '{tier}' is full")
+        
+        if not queue:
+            # A tier returning from idle must not bank credit for the time it was away
+            self.passes[tier] = max(self.passes[tier], self.virtual_time)
+        
+        job = {"call": call, "tokens": estimated_tokens, "future": self._loop.create_future(), "queued_at": time.monotonic()}
+        queue.append(job)
+        self._wakeup.set()
+        return await job["future"]
+    
+    def try_acquire(self, estimated_tokens: int) -> bool:
+        '''Take a concurrency slot and rate budget for an extra call right now, without queueing
+        
+        Used for hedges: when no slot or budget is free, or calls are already queued, this returns
+        False and the caller goes without rather than overtaking waiting work. Every successful
+        acquire must be paired with release().
+        '''
+        
+        if self.in_flight >= self.max_concurrency or any(self.queues.values()):
+            return False
+        if self.request_bucket.delay(1) > 0 or self.token_bucket.delay(estimated_tokens) > 0:
+            return False
+        self.request_bucket.consume(1)
+        self.token_bucket.consume(estimated_tokens)
+        self.in_flight += 1
+        return True
+    
+    def release(self, unused_tokens: float = 0):
+        '''Free a slot taken by try_acquire, refunding the part of its estimate that was not spent'''
+        
+        self.token_bucket.refund(unused_tokens)
+        self.in_flight -= 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def metrics(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": {tier: len(queue) for tier, queue in self.queues.items()},
+            "dispatched": dict(self.dispatched),
+            "rejected": dict(self.rejected),
+            "wait_ms": {
+                tier: {"p50": self._percentile(waits, 50), "p99": self._percentile(waits, 99)}
+                for tier, waits in self.wait_ms.items()
+            },
+            "request_budget": round(self.request_bucket.tokens, 1),
+            "token_budget": round(self.token_bucket.tokens, 1)
+        }
+    
+    @staticmethod
+    def _percentile(values, pct: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 2)
+    
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        # First use, or the previous event loop is gone (e.g. test clients): restart the pump here
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._pump_task = loop.create_task(self._pump())
+    
+    def _next_tier(self) -> Optional[str]:
+        waiting = [tier for tier, queue in self.queues.items() if queue]
+        return min(waiting, key=lambda tier: self.passes[tier]) if waiting else None
+    
+    async def _pump(self):
+        while True:
+            self._wakeup.clear()
+            tier = self._next_tier()
+            if tier is None or self.in_flight >= self.max_concurrency:
+                await self._wakeup.wait()
+                continue
+            
+            job = self.queues[tier][0]
+            if job["future"].done():
+                self.queues[tier].popleft()
+                continue
+            
+            delay = max(self.request_bucket.delay(1), self.token_bucket.delay(job["tokens"]))
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            self.queues[tier].popleft()
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(job["tokens"])
+            self.virtual_time = self.passes[tier]
+            self.passes[tier] += 1 / self.tier_weights[tier]
+            self.in_flight += 1
+            self.dispatched[tier] += 1
+            self.wait_ms[tier].append((time.monotonic() - job["queued_at"]) * 1000)
+            self._loop.create_task(self._run(job))
+    
+    async def _run(self, job: Dict):
+        try:
+            result = await job["call"]()
+        except Exception as e:
+            if not job["future"].done():
+                job["future"].set_exception(e)
+        else:
+            if isinstance(result, LLMCompletion):
+                self.token_bucket.refund(job["tokens"] - result.input_tokens - result.output_tokens)
+            if not job["future"].done():
+                job["future"].set_result(result)
+        finally:
+            self.in_flight -= 1
+            self._wakeup.set()
+
+llm_dispatcher = LLMDispatcher(
+    max_concurrency=AutoFlowConfig.LLM_MAX_CONCURRENCY,
+    requests_per_minute=AutoFlowConfig.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=AutoFlowConfig.LLM_TOKENS_PER_MINUTE,
+    tier_weights=AutoFlowConfig.LLM_TIER_WEIGHTS,
+    max_queue_depth=AutoFlowConfig.LLM_MAX_QUEUE_DEPTH
+)
+
+class ProviderRouter:
+    '''Routes each call to the fastest healthy provider/model and hedges slow calls for latency-sensitive tiers
+    
+    Latency and error rate are tracked as EWMAs per backend. A backend that fails
+    LLM_BACKEND_FAILURE_THRESHOLD times in a row sits out a cooldown. For tiers in
+    LLM_HEDGED_TIERS a second request goes to the runner-up backend once the primary
+    passes its own latency percentile; whichever answers first wins and the other is cancelled.
+    A hedge takes its own slot and budget from the dispatcher and is skipped when none is free.
+    '''
+    
+    def __init__(self, backends: List[Dict], dispatcher: LLMDispatcher):
+        self.dispatcher = dispatcher
+        self.stats = {
+            self.backend_key(backend): {
+                "backend": backend,
+                "latency_ewma": None,
+                "error_ewma": 0.0,
+                "recent_latencies": deque(maxlen=200),
+                "consecutive_failures": 0,
+                "cooldown_until": 0.0,
+                "calls": 0,
+                "hedges_won": 0,
+                "hedges_skipped": 0
+            }
+            for backend in backends
+        }
+    
+    @staticmethod
+    def backend_key(backend: Dict) -> str:
+        return f"{backend['provider']}:{backend['model']}"
+    
+    def ranked_backends(self) -> List[Dict]:
+        '''Healthy backends fastest first; cooling-down backends only when nothing else is left'''
+        
+        now = time.monotonic()
+        healthy = [stats for stats in self.stats.values() if stats["cooldown_until"] <= now]
+        candidates = healthy or list(self.stats.values())
+        known = [stats["latency_ewma"] for stats in candidates if stats["latency_ewma"] is not None]
+        # Unmeasured backends rank as fast as the best known one so they get tried
+        fallback_latency = min(known, default=0.0)
+        
+        def score(stats):
+            latency = stats["latency_ewma"] if stats["latency_ewma"] is not None else fallback_latency
+            return latency * (1 + 4 * stats["error_ewma"])
+        
+        ranked = sorted(candidates, key=score)
+        if len(ranked) > 1 and random.random() < AutoFlowConfig.LLM_ROUTING_EXPLORATION_RATE:
+            # Occasionally lead with the runner-up so its statistics do not go stale
+            ranked[0], ranked[1] = ranked[1], ranked[0]
+        return [stats["backend"] for stats in ranked]
+    
+    def hedge_deadline(self, backend: Dict) -> float:
+        latencies = sorted(self.stats[self.backend_key(backend)]["recent_latencies"])
+        if len(latencies) < 20:
+            return AutoFlowConfig.LLM_HEDGE_DEFAULT_DEADLINE_SECONDS
+        return latencies[min(len(latencies) - 1, int(len(latencies) * AutoFlowConfig.LLM_HEDGE_PERCENTILE / 100))]
+    
+    def record_success(self, backend: Dict, latency: float):
+        stats = self.stats[self.backend_key(backend)]
+        alpha = AutoFlowConfig.LLM_ROUTING_EWMA_ALPHA
+        stats["calls"] += 1
+        stats["latency_ewma"] = latency if stats["latency_ewma"] is None else alpha * latency + (1 - alpha) * stats["latency_ewma"]
+        stats["error_ewma"] *= 1 - alpha
+        stats["recent_latencies"].append(latency)
+        stats["consecutive_failures"] = 0
+    
+    def record_censored(self, backend: Dict, elapsed: float):
+        stats = self.stats[self.backend_key(backend)]
+        if stats["latency_ewma"] is None or elapsed > stats["latency_ewma"]:
+            alpha = AutoFlowConfig.LLM_ROUTING_EWMA_ALPHA
+            stats["latency_ewma"] = elapsed if stats["latency_ewma"] is None else alpha * elapsed + (1 - alpha) * stats["latency_ewma"]
+    
+    def record_failure(self, backend: Dict):
+        stats = self.stats[self.backend_key(backend)]
+        alpha = AutoFlowConfig.LLM_ROUTING_EWMA_ALPHA
+        stats["calls"] += 1
+        stats["error_ewma"] = alpha + (1 - alpha) * stats["error_ewma"]
+        stats["consecutive_failures"] += 1
+        if stats["consecutive_failures"] >= AutoFlowConfig.LLM_BACKEND_FAILURE_THRESHOLD:
+            stats["cooldown_until"] = time.monotonic() + AutoFlowConfig.LLM_BACKEND_COOLDOWN_SECONDS
+    
+    async def complete(self, tier: str, call_backend: Callable[[Dict], Awaitable[LLMCompletion]],
+                       estimated_tokens: int = 0, prompt_tokens: int = 0) -> LLMCompletion:
+        '''Run call_backend against the best backend, hedging or failing over to the runner-up
+        
+        The caller's dispatcher job pays for one call and is reconciled against the winner's
+        usage. A hedge is charged estimated_tokens on top; once the race is decided that charge
+        is settled as the loser's spend, taken to be its prompt_tokens since it was cut short.
+        '''
+        
+        ranked = self.ranked_backends()
+        primary = asyncio.create_task(self._timed_call(ranked[0], call_backend))
+        pending = {primary}
+        runners_up = ranked[1:]
+        
+        if tier in AutoFlowConfig.LLM_HEDGED_TIERS and runners_up:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_deadline(ranked[0]))
+            if not done and not self.dispatcher.try_acquire(estimated_tokens):
+                self.stats[self.backend_key(ranked[0])]["hedges_skipped"] += 1
+            elif not done:
+                hedge = asyncio.create_task(self._timed_call(runners_up.pop(0), call_backend, hedge=True))
+                # The slot is held until the hedge has actually finished, win, lose or cancelled
+                hedge.add_done_callback(lambda _: self.dispatcher.release(max(0, estimated_tokens - prompt_tokens)))
+                pending.add(hedge)
+        
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                if not pending and runners_up:
+                    pending.add(asyncio.create_task(self._timed_call(runners_up.pop(0), call_backend)))
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def _timed_call(self, backend: Dict, call_backend: Callable[[Dict], Awaitable[LLMCompletion]], hedge: bool = False) -> LLMCompletion:
+        started = time.monotonic()
+        try:
+            completion = await call_backend(backend)
+        except asyncio.CancelledError:
+            # A hedge loser's elapsed time is a lower bound on its latency; only let it push the EWMA up
+            self.record_censored(backend, time.monotonic() - started)
+            raise
+        except Exception:
+            self.record_failure(backend)
+            raise
+        self.record_success(backend, time.monotonic() - started)
+        if hedge:
+            self.stats[self.backend_key(backend)]["hedges_won"] += 1
+        return completion
+    
+    def metrics(self) -> Dict:
+        now = time.monotonic()
+        return {
+            key: {
+                "latency_ewma_ms": round(stats["latency_ewma"] * 1000, 1) if stats["latency_ewma"] is not None else None,
+                "error_ewma": round(stats["error_ewma"], 3),
+                "healthy": stats["cooldown_until"] <= now,
+                "calls": stats["calls"],
+                "hedges_won": stats["hedges_won"],
+                "hedges_skipped": stats["hedges_skipped"],
+                "hedge_deadline_ms": round(self.hedge_deadline(stats["backend"]) * 1000, 1)
+            }
+            for key, stats in self.stats.items()
+        }
+
+provider_router = ProviderRouter(AutoFlowConfig.LLM_BACKENDS, llm_dispatcher)
+
+class WorkflowJSONRepair:
+    '''Tolerant local parsing of model output before anything is re-requested
+    
+    Strips markdown fences and surrounding prose, drops trailing commas and, when the
+    output stops mid-structure, cuts back to the last complete element and closes the
+    open arrays/objects. The raw truncated text is kept as the prefix for a tail-only
+    continuation request; the locally closed workflow is the fallback if that fails.
+    '''
+    
+    FENCE_PATTERN = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+    CLOSERS = {"{": "}", "[": "]"}
+    
+    def __init__(self):
+        self.responses = 0
+        self.clean = 0
+        self.repaired = 0
+        self.continued = 0
+        self.full_retries = 0
+        self.failed = 0
+    
+    @classmethod
+    def strip_fences(cls, text: str) -> str:
+        text = cls.FENCE_PATTERN.sub("", text)
+        start = text.find("{")
+        return text[start:] if start >= 0 else text
+    
+    @classmethod
+    def close_json(cls, text: str) -> Dict:
+        '''Drop trailing commas and close a truncated document at its last complete element'''
+        
+        out = []
+        stack = []
+        in_string = escaped = False
+        # (output length, open containers) after which the document can be closed cleanly
+        safe_length, safe_stack = 0, ()
+        for char in text:
+            if in_string:
+                out.append(char)
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                continue
+            if char == '"':
+                in_string = True
+            elif char in "{[":
+                stack.append(char)
+                out.append(char)
+                # An empty array is complete; a nested object that was only just opened is not
+                if char == "[" or len(stack) == 1:
+                    safe_length, safe_stack = len(out), tuple(stack)
+                continue
+            elif char in "}]":
+                while out and (out[-1].isspace() or out[-1] == ","):
+                    out.pop()
+                if stack:
+                    stack.pop()
+                out.append(char)
+                safe_length, safe_stack = len(out), tuple(stack)
+                if not stack:
+                    break
+                continue
+            elif char == "," and stack:
+                safe_length, safe_stack = len(out), tuple(stack)
+            out.append(char)
+        
+        truncated = bool(stack) or in_string
+        prefix = text.rstrip()
+        if truncated:
+            out = out[:safe_length]
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            stack = list(safe_stack)
+        body = "".join(out)
+        return {
+            "text": body + "".join(cls.CLOSERS[opener] for opener in reversed(stack)),
+            "prefix": prefix,
+            "truncated": truncated
+        }
+    
+    @staticmethod
+    def validate(data: Any) -> List[str]:
+        '''Fast structural check; fixes what is safe to fix in place and returns the remaining errors'''
+        
+        if not isinstance(data, dict):
+            return ["workflow is not a JSON object"]
+        nodes = data.get("nodes")
+        if not isinstance(nodes, list) or not nodes:
+            return ["workflow has no nodes"]
+        errors = []
+        for i, node in enumerate(nodes):
+            if not isinstance(node, dict) or not isinstance(node.get("type"), str):
+                errors.append(f"node {i} has no type")
+                continue
+            if not isinstance(node.get("name"), str):
+                node["name"] = f"{node['type']} {i + 1}"
+            if not isinstance(node.get("config"), dict):
+                node["config"] = {}
+        connections = data.get("connections")
+        data["connections"] = [
+            connection for connection in (connections if isinstance(connections, list) else [])
+            if isinstance(connection, dict)
+            and all(isinstance(connection.get(end), int) and 0 <= connection[end] < len(nodes) for end in ("from", "to"))
+        ]
+        if not isinstance(data.get("metadata"), dict):
+            data["metadata"] = {}
+        return errors
+    
+    def parse(self, text: str) -> Dict:
+        '''Returns {"workflow", "status", "errors", "prefix"}; status is clean, repaired, truncated or invalid'''
+        
+        try:
+            workflow = json.loads(text)
+            status = "clean"
+        except (json.JSONDecodeError, TypeError):
+            workflow = None
+        prefix = ""
+        if workflow is None:
+            closed = self.close_json(self.strip_fences(text or ""))
+            prefix = closed["prefix"]
+            try:
+                workflow = json.JSONDecoder().raw_decode(closed["text"])[0]
+            except json.JSONDecodeError as e:
+                return {"workflow": None, "status": "invalid", "errors": [str(e)], "prefix": prefix}
+            status = "truncated" if closed["truncated"] else "repaired"
+        
+        errors = self.validate(workflow)
+        if errors:
+            # A truncated document can still be completed by a continuation
+            return {"workflow": None, "status": "truncated" if status == "truncated" else "invalid", "errors": errors, "prefix": prefix}
+        return {"workflow": workflow, "status": status, "errors": [], "prefix": prefix}
+    
+    def record(self, outcome: str):
+        '''Count one generation by how it was finally parsed: clean, repaired, continued, full_retry or failed'''
+        self.responses += 1
+        if outcome == "full_retry":
+            self.full_retries += 1
+        else:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+    
+    def metrics(self) -> Dict:
+        def rate(count):
+            return round(count / self.responses, 4) if self.responses else None
+        return {
+            "responses": self.responses,
+            "clean_rate": rate(self.clean),
+            "repair_rate": rate(self.repaired),
+            "continuation_rate": rate(self.continued),
+            "full_retry_rate": rate(self.full_retries),
+            "failure_rate": rate(self.failed)
+        }
+
+workflow_json_repair = WorkflowJSONRepair()
+
 class AIWorkflowGenerator:
     def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=AutoFlowConfig.OPENAI_API_KEY)
-        self.anthropic_client = Anthropic(api_key=AutoFlowConfig.ANTHROPIC_API_KEY)
+        self.openai_client = openai.AsyncOpenAI(api_key=AutoFlowConfig.OPENAI_API_KEY)
+        self.anthropic_client = AsyncAnthropic(api_key=AutoFlowConfig.ANTHROPIC_API_KEY)
         
-    async def generate_workflow_from_description(self, description: str, user_context: Dict = None) -> Dict:
+    async def generate_workflow_from_description(self, description: str, user_context: Dict = None, tier: str = "starter") -> Dict:
         '''Generate workflow from natural language description using AI'''
         
-        system_prompt = '''You are an expert workflow automation designer. Generate a complete workflow 
-        specification from the user description. Return a JSON structure with nodes, connections, and metadata.'''
+        if AutoFlowConfig.TEMPLATE_FAST_PATH_ENABLED and (user_context or {}).get("allow_templates", True):
+            match = await template_fast_path.match(description)
+            if match:
+                template = match["template"]
+                return {
+                    "success": True,
+                    "source": "template",
+                    "template": {"name": template["name"], "category": template["category"]},
+                    "reactflow_data": ReactFlowWorkflowEditor.convert_n8n_template_to_reactflow(template),
+                    "ai_confidence": match["confidence"],
+                    "suggestions": [f"Started from the '{template['name']}' template; review credentials and parameters"]
+                }
+        
+        prompt = await generation_prompt_builder.build(description)
+        system_prompt = prompt["system"]
+        max_tokens = prompt["max_tokens"]
         
         try:
-            response = await self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=2000,
-                system=system_prompt,
-                messages=[{"role": "user", "content": description}]
-            )
+            started = time.perf_counter()
+            completion = await self._generate(tier, system_prompt, description, max_tokens)
+            template_fast_path.record_generation_latency(time.perf_counter() - started)
+            generation_prompt_builder.record_completion(prompt, completion)
+            
+            parsed = workflow_json_repair.parse(completion.text)
+            outcome = "clean" if parsed["status"] == "clean" else "repaired"
+            if parsed["status"] == "truncated":
+                parsed, outcome = await self._continue_truncated(tier, system_prompt, description, parsed)
+            if parsed["workflow"] is None:
+                # Unrecoverable locally: pay for one complete regeneration
+                outcome = "full_retry"
+                completion = await self._generate(tier, system_prompt, description, max_tokens)
+                parsed = workflow_json_repair.parse(completion.text)
+                if parsed["status"] == "truncated":
+                    parsed, _ = await self._continue_truncated(tier, system_prompt, description, parsed)
+            if parsed["workflow"] is None:
+                workflow_json_repair.record("failed")
+                return {"success": False, "error": "; ".join(parsed["errors"])}
+            workflow_json_repair.record(outcome)
             
-            workflow_data = json.loads(response.content[0].text)
             return {
                 "success": True,
-                "workflow": workflow_data,
+                "source": "model",
+                "workflow": parsed["workflow"],
                 "ai_confidence": 0.85,
-                "suggestions": ["Consider adding error handling", "Add logging for debugging"]
+                "suggestions": ["Consider adding error handling", "Add logging for debugging"],
+                "provider": completion.provider,
+                "model": completion.model
             }
-            
+        
+        except LLMDispatcherOverloaded:
+            raise
         except Exception as e:
             return {"success": False, "error": str(e)}
+    
+    async def _generate(self, tier: str, system_prompt: str, description: str, max_tokens: int, prefix: str = None) -> LLMCompletion:
+        '''One dispatched, routed model call; with a prefix the model continues that partial answer'''
+        
+        prompt_tokens = estimate_tokens(system_prompt + description + (prefix or ""))
+        return await llm_dispatcher.submit(
+            tier,
+            lambda: provider_router.complete(
+                tier,
+                lambda backend: self._complete(backend, system_prompt, description, max_tokens, prefix),
+                estimated_tokens=prompt_tokens + max_tokens,
+                prompt_tokens=prompt_tokens
+            ),
+            estimated_tokens=prompt_tokens + max_tokens
+        )
+    
+    async def _continue_truncated(self, tier: str, system_prompt: str, description: str, parsed: Dict):
+        '''Re-ask only for the missing tail of a truncated workflow; keep the locally closed one if that fails'''
+        
+        try:
+            tail = await self._generate(tier, system_prompt, description,
+                                        AutoFlowConfig.GENERATION_CONTINUATION_MAX_TOKENS, prefix=parsed["prefix"])
+        except LLMDispatcherOverloaded:
+            raise
+        except Exception:
+            return parsed, "repaired"
+        continued = workflow_json_repair.parse(parsed["prefix"] + tail.text)
+        if continued["workflow"] is None or continued["status"] == "truncated":
+            # Some models restart the document instead of continuing it
+            restarted = workflow_json_repair.parse(tail.text)
+            if restarted["workflow"] is not None and restarted["status"] != "truncated":
+                continued = restarted
+        if continued["workflow"] is None or (parsed["workflow"] and len(continued["workflow"]["nodes"]) < len(parsed["workflow"]["nodes"])):
+            return parsed, "repaired"
+        return continued, "continued"
+
+    async def _complete(self, backend: Dict, system_prompt: str, user_message: str, max_tokens: int, prefix: str = None) -> LLMCompletion:
+        '''Single call to one provider/model, normalized to LLMCompletion
+        
+        With a prefix the model is asked to continue that partial answer: Anthropic takes it
+        as a prefilled assistant turn, OpenAI as an assistant turn plus a continue instruction.
+        '''
+        
+        if backend["provider"] == "anthropic":
+            messages = [{"role": "user", "content": user_message}]
+            if prefix:
+                messages.append({"role": "assistant", "content": prefix.rstrip()})
+            response = await self.anthropic_client.messages.create(
+                model=backend["model"],
+                max_tokens=max_tokens,
+                system=system_prompt,
+                messages=messages
+            )
+            return LLMCompletion(
+                text=response.content[0].text,
+                input_tokens=response.usage.input_tokens,
+                output_tokens=response.usage.output_tokens,
+                provider="anthropic",
+                model=backend["model"]
+            )
+        
+        if backend["provider"] == "openai":
+            response = await self.openai_client.chat.completions.create(
+                model=backend["model"],
+                max_tokens=max_tokens,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_message}
+                ] + ([
+                    {"role": "assistant", "content": prefix},
+                    {"role": "user", "content": "Your JSON was cut off. Output only the characters that come after it, nothing else."}
+                ] if prefix else [])
+            )
+            return LLMCompletion(
+                text=response.choices[0].message.content,
+                input_tokens=response.usage.prompt_tokens,
+                output_tokens=response.usage.completion_tokens,
+                provider="openai",
+                model=backend["model"]
+            )
+        
+        raise ValueError(f"Unknown LLM provider: {backend['provider']}")
 
     async def optimize_workflow_with_k9x(self, workflow: Dict, optimization_goals: List[str]) -> Dict:
         '''Apply K9X optimization to existing workflow'''
@@ -142,18 +1085,371 @@ class AIWorkflowGenerator:
             "improvements": ["Reduced execution time by 30%", "Improved error handling"]
         }
 
+# Generation jobs: the generation_jobs table is the durable queue. Workers lease a job by
+# compare-and-set on (id, attempts); a worker that dies lets its lease expire and another
+# worker reclaims the job, so delivery is at-least-once. Completion writes the Workflow
+# row and flips the job to succeeded in one transaction, only while the lease is still held.
+
+def enqueue_generation_job(db: Session, user_id: int, tier: str, request: Dict, idempotency_key: Optional[str] = None) -> GenerationJob:
+    '''Queue a generation, returning the existing job when idempotency_key was seen before'''
+    
+    if idempotency_key:
+        existing = db.query(GenerationJob).filter(
+            GenerationJob.user_id == user_id,
+            GenerationJob.idempotency_key == idempotency_key
+        ).first()
+        if existing:
+            return existing
+    
+    job = GenerationJob(id=uuid.uuid4().hex, user_id=user_id, idempotency_key=idempotency_key, tier=tier, request=request)
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent submit with the same key won the race
+        db.rollback()
+        return db.query(GenerationJob).filter(
+            GenerationJob.user_id == user_id,
+            GenerationJob.idempotency_key == idempotency_key
+        ).one()
+    return job
+
+def open_db_session():
+    '''Session from the same provider request handlers use, honouring dependency overrides'''
+    return contextmanager(app.dependency_overrides.get(get_db, get_db))()
+
+class GenerationJobWorker:
+    '''Claims queued generation jobs and runs them, in-process or as a standalone worker process'''
+    
+    def __init__(self, concurrency: int, session_factory: Callable = None):
+        self.concurrency = concurrency
+        self.session_factory = session_factory or open_db_session
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+        self._stop_event = asyncio.Event()
+    
+    async def run(self):
+        await asyncio.gather(*(self._work_loop() for _ in range(self.concurrency)))
+    
+    def stop(self):
+        self._stop_event.set()
+    
+    async def _work_loop(self):
+        while not self._stop_event.is_set():
+            # The session is only held for the claim and the final write, never across the LLM call
+            with self.session_factory() as db:
+                job = self.claim(db)
+            if job is not None:
+                try:
+                    await self.process(job)
+                except Exception:
+                    logger.exception("Generation job %s failed outside its own error handling", job.id)
+                continue
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=AutoFlowConfig.GENERATION_JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    
+    def claim(self, db: Session) -> Optional[GenerationJob]:
+        '''Lease the oldest runnable job: pending and due, or running with an expired lease and attempts left'''
+        
+        now = datetime.utcnow()
+        expired = and_(GenerationJob.status == "running", GenerationJob.lease_expires_at < now)
+        # A job that keeps killing its worker would otherwise be reclaimed forever
+        db.execute(update(GenerationJob).where(expired, GenerationJob.attempts >= AutoFlowConfig.GENERATION_JOB_MAX_ATTEMPTS).values(
+            status="failed",
+            lease_expires_at=None,
+            error=f"Lease expired on all {AutoFlowConfig.GENERATION_JOB_MAX_ATTEMPTS} attempts",
+            updated_at=now
+        ))
+        runnable = or_(
+            and_(GenerationJob.status == "pending", GenerationJob.available_at <= now),
+            and_(expired, GenerationJob.attempts < AutoFlowConfig.GENERATION_JOB_MAX_ATTEMPTS)
+        )
+        candidates = db.execute(
+            select(GenerationJob.id, GenerationJob.attempts)
+            .where(runnable)
+            .order_by(GenerationJob.available_at)
+            .limit(self.concurrency)
+            .with_for_update(skip_locked=True)
+        ).all()
+        
+        for job_id, attempts in candidates:
+            claimed = db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id, GenerationJob.attempts == attempts, runnable)
+                .values(
+                    status="running",
+                    attempts=attempts + 1,
+                    worker_id=self.worker_id,
+                    lease_expires_at=now + timedelta(seconds=AutoFlowConfig.GENERATION_JOB_LEASE_SECONDS),
+                    updated_at=now
+                )
+            )
+            if claimed.rowcount == 1:
+                db.commit()
+                return db.get(GenerationJob, job_id, populate_existing=True)
+        db.commit()
+        return None
+    
+    def still_leased(self, job: GenerationJob) -> Tuple:
+        return (GenerationJob.id == job.id, GenerationJob.worker_id == self.worker_id, GenerationJob.attempts == job.attempts)
+    
+    def record_failure(self, db: Session, job: GenerationJob, error: str):
+        '''Back off and requeue the job, or fail it once its attempts are used up'''
+        
+        now = datetime.utcnow()
+        retry = job.attempts < AutoFlowConfig.GENERATION_JOB_MAX_ATTEMPTS
+        db.execute(update(GenerationJob).where(*self.still_leased(job)).values(
+            status="pending" if retry else "failed",
+            available_at=now + timedelta(seconds=AutoFlowConfig.GENERATION_JOB_RETRY_BACKOFF_SECONDS * job.attempts),
+            lease_expires_at=None,
+            error=error,
+            updated_at=now
+        ))
+        db.commit()
+    
+    async def process(self, job: GenerationJob):
+        '''Run a claimed (detached) job, writing its outcome in a fresh session'''
+        
+        request = job.request
+        try:
+            result = await AIWorkflowGenerator().generate_workflow_from_description(
+                request["description"],
+                request.get("context", {}),
+                tier=job.tier
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        with self.session_factory() as db:
+            if not result["success"]:
+                self.record_failure(db, job, result["error"])
+                return
+            try:
+                completed = self.record_success(db, job, request, result)
+            except Exception as e:
+                db.rollback()
+                self.record_failure(db, job, f"{type(e).__name__}: {e}")
+                return
+        if completed:
+            self.processed += 1
+    
+    def record_success(self, db: Session, job: GenerationJob, request: Dict, result: Dict) -> bool:
+        '''Store the generated workflow and complete the job; False if the lease was lost meanwhile'''
+        
+        reactflow_data = generation_reactflow_data(result)
+        workflow = Workflow(
+            user_id=job.user_id,
+            name=request.get("name", "AI Generated Workflow"),
+            description=request["description"],
+            nodes=reactflow_data["nodes"],
+            connections=reactflow_data["edges"],
+            ai_generated=True
+        )
+        db.add(workflow)
+        db.flush()
+        sync_workflow_graph(db, [(workflow.id, workflow.nodes, workflow.connections)])
+        completed = db.execute(update(GenerationJob).where(*self.still_leased(job)).values(
+            status="succeeded",
+            workflow_id=workflow.id,
+            result={
+                "workflow_id": workflow.id,
+                "reactflow_data": reactflow_data,
+                "ai_confidence": result["ai_confidence"],
+                "suggestions": result["suggestions"]
+            },
+            error=None,
+            lease_expires_at=None,
+            updated_at=datetime.utcnow()
+        ))
+        if completed.rowcount != 1:
+            # Lease expired and another worker owns the job now; drop this duplicate
+            db.rollback()
+            return False
+        db.commit()
+        return True
+
 # ============================================================================
 # SECTION 4: K9X QUANTUM PROMPT STRATEGIST
 # ============================================================================
 
+class ConsistentHashRing:
+    '''Hash ring with virtual nodes: adding or removing a node moves only ~1/n of the keys'''
+    
+    def __init__(self, nodes: List[str], virtual_nodes: int = 160):
+        self.nodes = list(nodes)
+        self.virtual_nodes = virtual_nodes
+        points = sorted((self.hash(f"{node}#{replica}"), node) for node in self.nodes for replica in range(virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+    
+    @staticmethod
+    def hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+    
+    def node_for(self, key: str) -> str:
+        return self._owners[bisect.bisect(self._points, self.hash(key)) % len(self._points)]
+
+K9X_SHARD_KEY_PATTERN = re.compile(r"^k9x_(?:session:k9x_|session_lease:k9x_|vault:)(\d+)")
+
+def k9x_shard_key(key: str) -> str:
+    '''Ring position of a K9X key: the user id, so a user's vault and sessions share a shard'''
+    match = K9X_SHARD_KEY_PATTERN.match(key)
+    return f"user:{match.group(1)}" if match else key
+
+class ShardedSessionStore:
+    '''The subset of the Redis client K9X uses (get, set, setex, delete), spread over a consistent-hash ring
+    
+    While keys migrate to a new ring, reads that miss on the new owner fall back to the
+    owner under the previous ring; rebalance() then moves the keys across (keeping
+    their TTL, never overwriting a newer write) and retires the previous ring.
+    '''
+    
+    def __init__(self, shards: Dict[str, redis.Redis], virtual_nodes: int = 160,
+                 previous_shards: Optional[Dict[str, redis.Redis]] = None, key_pattern: str = "k9x_*"):
+        self.virtual_nodes = virtual_nodes
+        self.key_pattern = key_pattern
+        self.clients = {**(previous_shards or {}), **shards}
+        self.ring = ConsistentHashRing(list(shards), virtual_nodes)
+        self.previous_ring = ConsistentHashRing(list(previous_shards), virtual_nodes) if previous_shards else None
+        self.moved = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_urls(cls, urls: List[str], previous_urls: List[str] = (), virtual_nodes: int = 160) -> "ShardedSessionStore":
+        return cls(
+            {url: redis.Redis.from_url(url) for url in urls},
+            virtual_nodes,
+            {url: redis.Redis.from_url(url) for url in previous_urls} or None
+        )
+    
+    def client_for(self, key: str) -> redis.Redis:
+        return self.clients[self.ring.node_for(k9x_shard_key(key))]
+    
+    def get(self, key: str):
+        value = self.client_for(key).get(key)
+        previous_ring = self.previous_ring
+        if value is None and previous_ring is not None:
+            shard_key = k9x_shard_key(key)
+            if previous_ring.node_for(shard_key) != self.ring.node_for(shard_key):
+                value = self.clients[previous_ring.node_for(shard_key)].get(key)
+        return value
+    
+    def setex(self, key: str, seconds: int, value):
+        return self.client_for(key).setex(key, seconds, value)
+    
+    # Compare-and-set on a lease: only the holder of the token may renew or delete it
+    EXPIRE_IF_EQUAL_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    DELETE_IF_EQUAL_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    
+    def set(self, key: str, value, nx: bool = False, ex: Optional[int] = None):
+        '''SET on the key's owner; with nx, a copy still on the previous owner counts as present'''
+        
+        previous_ring = self.previous_ring
+        if nx and previous_ring is not None:
+            shard_key = k9x_shard_key(key)
+            previous_owner = previous_ring.node_for(shard_key)
+            if previous_owner != self.ring.node_for(shard_key) and self.clients[previous_owner].exists(key):
+                return None
+        return self.client_for(key).set(key, value, nx=nx, ex=ex)
+    
+    def expire_if_equal(self, key: str, expected: str, seconds: int) -> bool:
+        return self._compare_and(self.EXPIRE_IF_EQUAL_SCRIPT, key, expected, int(seconds * 1000))
+    
+    def delete_if_equal(self, key: str, expected: str) -> bool:
+        return self._compare_and(self.DELETE_IF_EQUAL_SCRIPT, key, expected)
+    
+    def _compare_and(self, script: str, key: str, *args) -> bool:
+        # Until rebalance() moves it, the key may still live on its owner under the previous ring
+        shard_key = k9x_shard_key(key)
+        owners = [self.ring.node_for(shard_key)]
+        previous_ring = self.previous_ring
+        if previous_ring is not None and previous_ring.node_for(shard_key) not in owners:
+            owners.append(previous_ring.node_for(shard_key))
+        return any(self.clients[owner].eval(script, 1, key, *args) for owner in owners)
+    
+    def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            deleted += self.client_for(key).delete(key)
+            if self.previous_ring is not None:
+                deleted += self.clients[self.previous_ring.node_for(k9x_shard_key(key))].delete(key)
+        return deleted
+    
+    def add_shard(self, name: str, client: redis.Redis):
+        '''Put a new shard on the ring; keys it now owns are found through the fallback until rebalance()'''
+        
+        with self._lock:
+            self.clients[name] = client
+            self.previous_ring = self.previous_ring or self.ring
+            self.ring = ConsistentHashRing(self.ring.nodes + [name], self.virtual_nodes)
+    
+    def remove_shard(self, name: str):
+        '''Take a shard off the ring; its keys stay readable until rebalance() drains it'''
+        
+        with self._lock:
+            self.previous_ring = self.previous_ring or self.ring
+            self.ring = ConsistentHashRing([node for node in self.ring.nodes if node != name], self.virtual_nodes)
+    
+    def rebalance(self, batch_size: int = 500) -> Dict:
+        '''Move every key that changed owner onto its shard under the current ring'''
+        
+        previous_ring = self.previous_ring
+        if previous_ring is None:
+            return {"moved": 0}
+        
+        moved = 0
+        for name in previous_ring.nodes:
+            source = self.clients[name]
+            for raw_key in source.scan_iter(match=self.key_pattern, count=batch_size):
+                key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+                target = self.ring.node_for(k9x_shard_key(key))
+                if target == name:
+                    continue
+                value, ttl = source.get(key), source.pttl(key)
+                if value is not None:
+                    # nx: a write that already landed on the new owner is newer than this copy
+                    self.clients[target].set(key, value, px=ttl if ttl > 0 else None, nx=True)
+                source.delete(key)
+                moved += 1
+        
+        with self._lock:
+            if self.previous_ring is previous_ring:
+                self.previous_ring = None
+                self.clients = {name: client for name, client in self.clients.items() if name in self.ring.nodes}
+        self.moved += moved
+        return {"moved": moved}
+    
+    def metrics(self) -> Dict:
+        return {"shards": self.ring.nodes, "rebalancing": self.previous_ring is not None, "moved": self.moved}
+
+k9x_session_store = ShardedSessionStore.from_urls(
+    AutoFlowConfig.K9X_REDIS_URLS,
+    AutoFlowConfig.K9X_REDIS_PREVIOUS_URLS,
+    AutoFlowConfig.K9X_RING_VIRTUAL_NODES
+)
+
 class K9XQuantumOptimizer:
-    def __init__(self):
-        self.memory_store = redis.Redis.from_url(AutoFlowConfig.REDIS_URL)
+    def __init__(self, memory_store: Optional[ShardedSessionStore] = None):
+        self.memory_store = memory_store or k9x_session_store
         self.quantum_features = AutoFlowConfig.K9X_QUANTUM_FEATURES
         
     async def start_conversation(self, user_id: int, initial_request: str) -> Dict:
         '''Start K9X conversational optimization session'''
         
+        conversation_state = await self.new_conversation_state(user_id, initial_request)
+        await self._store_conversation_state(conversation_state["session_id"], conversation_state)
+        
+        return {
+            "session_id": conversation_state["session_id"],
+            "questions": conversation_state["questions"],
+            "stage": "clarification"
+        }
+    
+    async def new_conversation_state(self, user_id: int, initial_request: str) -> Dict:
+        '''Opening state of a session, not yet persisted'''
+        
         session_id = f"k9x_{user_id}_{datetime.utcnow().timestamp()}"
         
         # System One: Dynamic questioning logic
@@ -170,19 +1466,27 @@ class K9XQuantumOptimizer:
             "vault_memory": vault_memory,
             "quantum_analysis": {"trend_signals": [], "monetization_potential": 0}
         }
+        return conversation_state
+    
+    async def continue_conversation(self, session_id: str, user_responses: Dict, lease_token: Optional[str] = None) -> Dict:
+        '''Continue K9X conversation with user responses, storing the state only while lease_token (if any) still holds the session'''
         
-        await self._store_conversation_state(session_id, conversation_state)
+        conversation_state = await self._load_conversation_state(session_id)
+        async for event in self.advance_conversation(conversation_state, user_responses):
+            result = event.get("result")
         
-        return {
-            "session_id": session_id,
-            "questions": clarifying_questions,
-            "stage": "clarification"
-        }
+        if result["status"] == "continuing":
+            if lease_token is not None and not await K9XLiveSession.renew(
+                    self.memory_store, session_id, lease_token, AutoFlowConfig.K9X_SESSION_LEASE_SECONDS):
+                raise HTTPException(status_code=409, detail="Conversation session was taken over while this turn ran")
+            await self._store_conversation_state(session_id, conversation_state)
+        return result
     
-    async def continue_conversation(self, session_id: str, user_responses: Dict) -> Dict:
-        '''Continue K9X conversation with user responses'''
+    async def advance_conversation(self, conversation_state: Dict, user_responses: Dict) -> AsyncIterator[Dict]:
+        '''Apply one turn to in-memory state, yielding each follow-up question as it is generated
         
-        conversation_state = await self._load_conversation_state(session_id)
+        The final event is {"type": "turn", "result": ...}; persisting the state is up to the caller.
+        '''
         
         # System Two: Quantum positioning logic and optimization
         analysis = await self._perform_quantum_analysis(user_responses)
@@ -191,26 +1495,82 @@ class K9XQuantumOptimizer:
         # System Three: Generate structured output
         if conversation_state["stage"] == "ready_for_output":
             optimized_prompt = await self._generate_structured_output(conversation_state)
-            return {
+            yield {"type": "turn", "result": {
                 "status": "complete",
                 "output": optimized_prompt,
                 "monetization_analysis": analysis["monetization_potential"],
                 "quantum_suggestions": analysis["next_opportunities"]
-            }
+            }}
+            return
         
         # Continue conversation
-        next_questions = await self._generate_follow_up_questions(conversation_state)
+        next_questions = []
+        async for question in self._iter_follow_up_questions(conversation_state):
+            next_questions.append(question)
+            yield {"type": "question", "question": question}
         conversation_state["questions"] = next_questions
         
-        await self._store_conversation_state(session_id, conversation_state)
-        
-        return {
+        yield {"type": "turn", "result": {
             "status": "continuing",
             "questions": next_questions,
             "progress": conversation_state["stage"]
-        }
+        }}
     
-    async def _generate_structured_output(self, conversation_state: Dict) -> Dict:
+    async def _generate_clarifying_questions(self, initial_request: str) -> List[str]:
+        '''System One: open the conversation with questions scoped to the request'''
+        
+        return [
+            f"Who is the target audience for: {initial_request}?",
+            "What single outcome should this drive?",
+            "Which tone and brand voice should it use?"
+        ]
+    
+    async def _iter_follow_up_questions(self, conversation_state: Dict) -> AsyncIterator[str]:
+        '''Advance the conversation stage and ask the next round of questions'''
+        
+        if conversation_state["stage"] == "clarification":
+            conversation_state["stage"] = "refinement"
+            yield "Which competitors or examples should we position against?"
+            yield "Where will this be published?"
+            return
+        
+        conversation_state["stage"] = "ready_for_output"
+        yield "Anything else to include before we generate the final output?"
+    
+    async def _perform_quantum_analysis(self, user_responses: Dict) -> Dict:
+        '''System Two: score the responses for trend and monetization signals'''
+        
+        answered = [answer for answer in user_responses.values() if answer]
+        return {
+            "trend_signals": list(self.quantum_features) if answered else [],
+            "monetization_potential": round(min(1.0, 0.2 * len(answered)), 2),
+            "next_opportunities": ["Repurpose output for email sequence", "A/B test the hook"]
+        }
+    
+    async def _load_user_vault_memory(self, user_id: int) -> Dict:
+        '''Load the user's long-term vault memory'''
+        
+        raw = self.memory_store.get(f"k9x_vault:{user_id}")
+        return json.loads(raw) if raw else {}
+    
+    async def _store_conversation_state(self, session_id: str, conversation_state: Dict):
+        '''Persist conversation state for the next turn'''
+        
+        self.memory_store.setex(
+            f"k9x_session:{session_id}",
+            AutoFlowConfig.K9X_SESSION_TTL_SECONDS,
+            json.dumps(conversation_state)
+        )
+    
+    async def _load_conversation_state(self, session_id: str) -> Dict:
+        '''Load conversation state stored by the previous turn'''
+        
+        raw = self.memory_store.get(f"k9x_session:{session_id}")
+        if raw is None:
+            raise HTTPException(status_code=404, detail="Conversation session not found")
+        return json.loads(raw)
+    
+    async def _generate_structured_output(self, conversation_state: Dict) -> Dict:
         '''Generate final structured output: [Hook], [Main], [CTA], [SEO], [Emotional Push]'''
         
         # Implementation uses proprietary K9X algorithms (details confidential)
@@ -223,6 +1583,148 @@ class K9XQuantumOptimizer:
             "quantum_positioning": "Trend-based positioning adjustments"
         }
 
+class K9XLiveSession:
+    '''Conversation state resident in one worker for the life of a WebSocket connection
+    
+    Turns mutate the state in memory and never touch Redis. A background task checkpoints
+    it (write-behind) every interval when it changed, and the connection closing writes
+    the final state, so a later HTTP turn or reconnect can resume from Redis.
+    
+    The connection is the session's single writer while it is open: the opener takes a
+    lease key with SET NX (see acquire) before loading the state, the session renews it
+    at each checkpoint and releases it with the final write. HTTP turns take the same
+    lease, so a second writer is refused rather than overwriting the other's state.
+    
+    The lease holds a token unique to its acquirer, and renewal and release compare it
+    first. A holder whose lease lapsed (Redis unreachable for longer than lease_seconds)
+    finds it gone or re-taken on its next renewal, and stops writing from then on.
+    '''
+    
+    metrics = Counter()
+    
+    def __init__(self, optimizer: K9XQuantumOptimizer, conversation_state: Dict, checkpoint_interval: float, lease_token: str):
+        self.optimizer = optimizer
+        self.state = conversation_state
+        self.checkpoint_interval = checkpoint_interval
+        self.lease_seconds = self.lease_seconds_for(checkpoint_interval)
+        self.lease_token = lease_token
+        self.lease_lost = False
+        self.version = 0
+        self.persisted_version = 0
+        self._checkpoint_task = None
+        self._write_lock = threading.Lock()
+        self._released = False
+    
+    @property
+    def session_id(self) -> str:
+        return self.state["session_id"]
+    
+    @staticmethod
+    def lease_key(session_id: str) -> str:
+        return f"k9x_session_lease:{session_id}"
+    
+    @staticmethod
+    def lease_seconds_for(checkpoint_interval: float) -> int:
+        return int(max(AutoFlowConfig.K9X_SESSION_LEASE_SECONDS, 3 * checkpoint_interval))
+    
+    @staticmethod
+    async def acquire(memory_store, session_id: str, lease_seconds: int) -> Optional[str]:
+        '''Take the session's single-writer lease and return its token; None while another writer (in any worker) holds it'''
+        token = uuid.uuid4().hex
+        taken = await asyncio.to_thread(memory_store.set, K9XLiveSession.lease_key(session_id), token, nx=True, ex=lease_seconds)
+        return token if taken else None
+    
+    @staticmethod
+    async def renew(memory_store, session_id: str, token: str, lease_seconds: int) -> bool:
+        '''Extend the lease if the token still holds it'''
+        return await asyncio.to_thread(memory_store.expire_if_equal, K9XLiveSession.lease_key(session_id), token, lease_seconds)
+    
+    @staticmethod
+    async def release(memory_store, session_id: str, token: str):
+        await asyncio.to_thread(memory_store.delete_if_equal, K9XLiveSession.lease_key(session_id), token)
+    
+    async def __aenter__(self) -> "K9XLiveSession":
+        # The opener has already taken the lease (see acquire); the session only renews and releases it
+        K9XLiveSession.metrics["active"] += 1
+        self._checkpoint_task = asyncio.create_task(self._checkpoint_loop())
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        K9XLiveSession.metrics["active"] -= 1
+        self._checkpoint_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._checkpoint_task
+        # One thread call for the final state and the lease release. Shielded, because the server
+        # may cancel this handler once the client has gone, and cancelling a still-queued
+        # executor future would withdraw the write
+        loop = asyncio.get_running_loop()
+        await asyncio.shield(loop.run_in_executor(None, self._write, self.version, json.dumps(self.state), True))
+    
+    def mark_dirty(self):
+        self.version += 1
+    
+    async def turn(self, user_responses: Dict) -> AsyncIterator[Dict]:
+        started = time.perf_counter()
+        async for event in self.optimizer.advance_conversation(self.state, user_responses):
+            if event["type"] == "turn":
+                self.mark_dirty()
+                K9XLiveSession.metrics["turns"] += 1
+                K9XLiveSession.metrics["turn_us"] += int((time.perf_counter() - started) * 1e6)
+            yield event
+    
+    async def checkpoint(self):
+        '''Write the state to Redis if it changed since the last checkpoint'''
+        
+        if self.version != self.persisted_version:
+            await asyncio.to_thread(self._write, self.version, json.dumps(self.state))
+    
+    def _write(self, version: int, payload: str, release: bool = False):
+        '''Store a state snapshot unless a newer one already landed, optionally releasing the lease
+        
+        Cancelling a checkpoint does not stop its thread, so writes are ordered here by
+        version: a late, older snapshot can never overwrite the final one, nor renew a
+        lease that has already been released. Each write first renews the lease by token;
+        once that fails the session has lost it and never writes again.
+        '''
+        
+        store = self.optimizer.memory_store
+        with self._write_lock:
+            if self._released or self.lease_lost:
+                return
+            if not store.expire_if_equal(self.lease_key(self.session_id), self.lease_token, self.lease_seconds):
+                self.lease_lost = True
+                K9XLiveSession.metrics["leases_lost"] += 1
+                return
+            if version > self.persisted_version:
+                store.setex(f"k9x_session:{self.session_id}", AutoFlowConfig.K9X_SESSION_TTL_SECONDS, payload)
+                self.persisted_version = version
+                K9XLiveSession.metrics["checkpoints"] += 1
+            if release:
+                store.delete_if_equal(self.lease_key(self.session_id), self.lease_token)
+                self._released = True
+    
+    async def _checkpoint_loop(self):
+        while not self.lease_lost:
+            await asyncio.sleep(self.checkpoint_interval)
+            try:
+                # Also renews the lease, so it runs even when nothing changed
+                await asyncio.to_thread(self._write, self.version, json.dumps(self.state))
+            except redis.RedisError:
+                # The next interval (or the final checkpoint on close) retries
+                K9XLiveSession.metrics["checkpoint_errors"] += 1
+    
+    @classmethod
+    def metrics_snapshot(cls) -> Dict:
+        turns = cls.metrics["turns"]
+        return {
+            "active_sessions": cls.metrics["active"],
+            "turns": turns,
+            "checkpoints": cls.metrics["checkpoints"],
+            "checkpoint_errors": cls.metrics["checkpoint_errors"],
+            "leases_lost": cls.metrics["leases_lost"],
+            "mean_turn_us": round(cls.metrics["turn_us"] / turns, 1) if turns else None
+        }
+
 # ============================================================================
 # SECTION 5: REACTFLOW VISUAL EDITOR INTEGRATION
 # ============================================================================
@@ -271,101 +1773,3255 @@ class ReactFlowWorkflowEditor:
             "viewport": {"x": 0, "y": 0, "zoom": 1}
         }
 
+    @staticmethod
+    def classify_n8n_node_type(n8n_type: str) -> str:
+        '''Map an n8n node type (e.g. n8n-nodes-base.gmailTrigger) onto a WORKFLOW_NODE_TYPES entry'''
+        
+        short_type = n8n_type.rsplit(".", 1)[-1].lower()
+        if "trigger" in short_type or short_type in ("webhook", "cron", "schedule", "start"):
+            return "trigger"
+        if short_type in ("if", "switch", "filter"):
+            return "condition"
+        if "langchain" in n8n_type or "openai" in short_type:
+            return "ai_generator"
+        return "action"
+    
+    @staticmethod
+    def workflow_node_type(node: Dict) -> str:
+        '''WORKFLOW_NODE_TYPES entry of a stored ReactFlow node'''
+        
+        data = node.get("data") or {}
+        if data.get("node_type") in AutoFlowConfig.WORKFLOW_NODE_TYPES:
+            return data["node_type"]
+        if node.get("type") in AutoFlowConfig.WORKFLOW_NODE_TYPES:
+            return node["type"]
+        if data.get("n8n_type"):
+            return ReactFlowWorkflowEditor.classify_n8n_node_type(data["n8n_type"])
+        return REACTFLOW_NODE_TYPES.get(node.get("type"), "action")
+    
+    @staticmethod
+    def convert_n8n_template_to_reactflow(template: Dict) -> Dict:
+        '''Convert an n8n template (nodes + name-keyed connections) to ReactFlow format'''
+        
+        reactflow_nodes = []
+        node_ids = {}
+        
+        for i, node in enumerate(template.get("nodes", [])):
+            if node.get("type") == N8N_STICKY_NOTE_TYPE:
+                continue
+            
+            node_id = node.get("id") or f"node_{i}"
+            node_ids[node["name"]] = node_id
+            position = node.get("position")
+            reactflow_nodes.append({
+                "id": node_id,
+                "type": ReactFlowWorkflowEditor.COMPONENT_MAPPING[
+                    ReactFlowWorkflowEditor.classify_n8n_node_type(node.get("type", ""))
+                ],
+                "position": {"x": position[0], "y": position[1]} if position else None,
+                "data": {
+                    "label": node["name"],
+                    "config": node.get("parameters", {}),
+                    "n8n_type": node.get("type")
+                }
+            })
+        
+        reactflow_edges = []
+        for source_name, outputs in template.get("connections", {}).items():
+            for connection_type, output_slots in outputs.items():
+                for output_index, targets in enumerate(output_slots or []):
+                    for target in targets or []:
+                        source_id = node_ids.get(source_name)
+                        target_id = node_ids.get(target.get("node"))
+                        if source_id is None or target_id is None:
+                            continue
+                        reactflow_edges.append({
+                            "id": f"edge_{source_id}_{target_id}_{connection_type}_{output_index}",
+                            "source": source_id,
+                            "target": target_id,
+                            "type": "smoothstep",
+                            "data": {"connection_type": connection_type, "output_index": output_index}
+                        })
+        
+        if any(node["position"] is None for node in reactflow_nodes):
+            ReactFlowWorkflowEditor.auto_layout(reactflow_nodes, reactflow_edges, missing_only=True)
+        
+        return {
+            "nodes": reactflow_nodes,
+            "edges": reactflow_edges,
+            "viewport": {"x": 0, "y": 0, "zoom": 1}
+        }
+    
+    @staticmethod
+    def auto_layout(nodes: List[Dict], edges: List[Dict], x_spacing: int = 250, y_spacing: int = 150, missing_only: bool = False) -> List[Dict]:
+        '''Layered left-to-right layout: each node sits one column right of its deepest parent
+        
+        With missing_only, nodes that already have a position keep it; the others go one
+        column right of their rightmost placed parent, stacked below the placed nodes.
+        '''
+        
+        children = {node["id"]: [] for node in nodes}
+        parents = {node["id"]: [] for node in nodes}
+        in_degree = {node["id"]: 0 for node in nodes}
+        for edge in edges:
+            if edge["source"] in children and edge["target"] in in_degree:
+                children[edge["source"]].append(edge["target"])
+                parents[edge["target"]].append(edge["source"])
+                in_degree[edge["target"]] += 1
+        
+        levels = {node_id: 0 for node_id, degree in in_degree.items() if degree == 0}
+        ready = list(levels)
+        while ready:
+            node_id = ready.pop()
+            for child in children[node_id]:
+                levels[child] = max(levels.get(child, 0), levels[node_id] + 1)
+                in_degree[child] -= 1
+                if in_degree[child] == 0:
+                    ready.append(child)
+        
+        # Nodes on a cycle never reach in-degree zero; park them in a trailing column
+        trailing_level = max(levels.values(), default=-1) + 1
+        for node in nodes:
+            levels.setdefault(node["id"], trailing_level)
+        
+        placed = {node["id"]: node["position"] for node in nodes if missing_only and node.get("position")}
+        top = max((position["y"] for position in placed.values()), default=-y_spacing) + y_spacing
+        rows = Counter()
+        # Parents sit on lower levels, so they are placed before their children
+        for node in sorted(nodes, key=lambda node: levels[node["id"]]):
+            if node["id"] in placed:
+                continue
+            level = levels[node["id"]]
+            parent_x = [placed[parent]["x"] for parent in parents[node["id"]] if parent in placed]
+            x = max(parent_x) + x_spacing if parent_x else level * x_spacing
+            node["position"] = placed[node["id"]] = {"x": x, "y": top + rows[level] * y_spacing}
+            rows[level] += 1
+        
+        return nodes
+
+REACTFLOW_NODE_TYPES = {component: node_type for node_type, component in ReactFlowWorkflowEditor.COMPONENT_MAPPING.items()}
+
+class ReactFlowColumnarCodec:
+    '''Compact columnar form of a ReactFlow payload, served and accepted as application/msgpack
+    
+    Nodes and edges become parallel arrays (ids, x, y, dictionary-coded types, node-index edge
+    endpoints) rather than an object per element, and edge ids are dropped where they follow one
+    of the converters' naming schemes. Anything irregular -- missing keys, extra keys, odd
+    positions, dangling edges -- travels in sparse side lists so decoding is lossless.
+    '''
+    
+    FORMAT = "reactflow-columnar/1"
+    NODE_FIELDS = ("id", "type", "position", "data")
+    EDGE_FIELDS = ("id", "source", "target", "type", "data")
+    
+    @staticmethod
+    def edge_id(form: int, source: str, target: str, data: Any) -> str:
+        '''Edge id under one of the naming schemes of convert_ai_workflow_to_reactflow / convert_n8n_template_to_reactflow'''
+        
+        if form == 0:
+            return f"edge_{source}_{target}"
+        if form == 1:
+            return f"edge_{source[5:]}_{target[5:]}"
+        return f"edge_{source}_{target}_{data['connection_type']}_{data.get('output_index', 0)}"
+    
+    @staticmethod
+    def edge_id_form(edge_id: str, source: str, target: str, data: Any) -> Any:
+        '''Naming scheme that reproduces edge_id, or the id itself when none does'''
+        
+        if type(data) is dict and "connection_type" in data:
+            forms = (2, 0)
+        elif source[:5] == "node_" and target[:5] == "node_":
+            forms = (1, 0)
+        else:
+            forms = (0,)
+        for form in forms:
+            if ReactFlowColumnarCodec.edge_id(form, source, target, data) == edge_id:
+                return form
+        return edge_id
+    
+    @staticmethod
+    def dictionary(values: List[Any]) -> Any:
+        '''{"values", "codes"} for a low-cardinality column; unhashable columns are left as they are'''
+        
+        symbols = {}
+        try:
+            codes = [symbols.setdefault(value, len(symbols)) for value in values]
+        except TypeError:
+            return values
+        return {"values": list(symbols), "codes": codes}
+    
+    @staticmethod
+    def undictionary(column: Any) -> List[Any]:
+        if type(column) is dict:
+            values = column["values"]
+            return [values[code] for code in column["codes"]]
+        return column
+    
+    @staticmethod
+    def lift(rows: List[Dict], fields: Tuple[str, ...]) -> Tuple[List[List[Any]], Dict[str, List[int]], List[List[Any]]]:
+        '''One column per field, plus {field: row indices lacking it} and [[row index, extra keys]]'''
+        
+        field_set = set(fields)
+        columns = [[row.get(field) for row in rows] for field in fields]
+        irregular = [(i, row) for i, row in enumerate(rows) if row.keys() != field_set]
+        absent = {}
+        for field in fields:
+            missing = [i for i, row in irregular if field not in row]
+            if missing:
+                absent[field] = missing
+        extras = [[i, {key: row[key] for key in row.keys() - field_set}] for i, row in irregular if row.keys() - field_set]
+        return columns, absent, extras
+    
+    @staticmethod
+    def restore(rows: List[Dict], absent: Dict[str, List[int]], extras: List[List[Any]]) -> List[Dict]:
+        for field, indices in absent.items():
+            for i in indices:
+                del rows[i][field]
+        for i, extra in extras:
+            rows[i].update(extra)
+        return rows
+    
+    @staticmethod
+    def encode(payload: Dict) -> Dict:
+        '''Columnar document for a {"nodes", "edges", ...} payload; other top-level keys are carried as they are'''
+        
+        codec = ReactFlowColumnarCodec
+        (ids, types, positions, data), node_absent, node_extras = codec.lift(payload.get("nodes") or [], codec.NODE_FIELDS)
+        xy = {"x", "y"}
+        regular = [type(position) is dict and position.keys() == xy and position["x"] is not None for position in positions]
+        xs = [position["x"] if ok else None for position, ok in zip(positions, regular)]
+        ys = [position["y"] if ok else None for position, ok in zip(positions, regular)]
+        node_extras += [[i, {"position": positions[i]}] for i, ok in enumerate(regular) if not ok and positions[i] is not None]
+        
+        # Endpoints are stored as node indices; the first node wins if ids repeat
+        index = {node_id: i for i, node_id in reversed(list(enumerate(ids))) if type(node_id) is str}
+        (edge_ids, sources, targets, edge_types, edge_data), edge_absent, edge_extras = codec.lift(payload.get("edges") or [], codec.EDGE_FIELDS)
+        source_refs = [index.get(source) if type(source) is str else None for source in sources]
+        target_refs = [index.get(target) if type(target) is str else None for target in targets]
+        id_refs = [
+            (edge_id if s is None or t is None else codec.edge_id_form(edge_id, source, target, d)) if type(edge_id) is str else None
+            for edge_id, source, target, d, s, t in zip(edge_ids, sources, targets, edge_data, source_refs, target_refs)
+        ]
+        edge_extras += [[i, {"source": sources[i]}] for i, ref in enumerate(source_refs) if ref is None and sources[i] is not None]
+        edge_extras += [[i, {"target": targets[i]}] for i, ref in enumerate(target_refs) if ref is None and targets[i] is not None]
+        edge_extras += [[i, {"id": edge_ids[i]}] for i, ref in enumerate(id_refs) if ref is None and edge_ids[i] is not None]
+        
+        document = {key: value for key, value in payload.items() if key not in ("nodes", "edges")}
+        document["format"] = codec.FORMAT
+        document["nodes"] = {
+            "id": ids, "type": codec.dictionary(types), "x": xs, "y": ys, "data": data,
+            "absent": node_absent, "extras": node_extras
+        }
+        document["edges"] = {
+            "id": id_refs, "source": source_refs, "target": target_refs, "type": codec.dictionary(edge_types), "data": edge_data,
+            "absent": edge_absent, "extras": edge_extras
+        }
+        return document
+    
+    @staticmethod
+    def columns(document: Dict, key: str, names: Tuple[str, ...]) -> Dict:
+        '''document[key] checked to be a well-formed column group; ValueError otherwise'''
+        
+        columns = document.get(key)
+        if type(columns) is not dict:
+            raise ValueError(f"'{key}' must be a column map")
+        for name in names:
+            column = columns.get(name)
+            if type(column) is dict:
+                if type(column.get("values")) is not list or type(column.get("codes")) is not list:
+                    raise ValueError(f"'{key}.{name}' must be a list or a {{values, codes}} dictionary")
+                column = column["codes"]
+            if type(column) is not list:
+                raise ValueError(f"'{key}.{name}' must be a list")
+            if len(column) != len(columns[names[0]]):
+                raise ValueError(f"'{key}' columns differ in length")
+        absent, extras = columns.get("absent"), columns.get("extras")
+        rows = len(columns[names[0]])
+        if type(absent) is not dict or not all(
+                type(indices) is list and all(type(i) is int and 0 <= i < rows for i in indices) for indices in absent.values()):
+            raise ValueError(f"'{key}.absent' must map fields to row indices")
+        if type(extras) is not list or not all(
+                type(extra) is list and len(extra) == 2 and type(extra[0]) is int and 0 <= extra[0] < rows and type(extra[1]) is dict
+                for extra in extras):
+            raise ValueError(f"'{key}.extras' must be [row index, object] pairs")
+        return columns
+    
+    @staticmethod
+    def decode(document: Dict) -> Dict:
+        '''Inverse of encode; ValueError (or KeyError/IndexError/TypeError) for a malformed document'''
+        
+        codec = ReactFlowColumnarCodec
+        if type(document) is not dict:
+            raise ValueError("ReactFlow document must be a map")
+        if document.get("format") != codec.FORMAT:
+            raise ValueError(f"Unsupported ReactFlow encoding: {document.get('format')!r}")
+        
+        payload = {key: value for key, value in document.items() if key not in ("format", "nodes", "edges")}
+        columns = codec.columns(document, "nodes", ("id", "type", "x", "y", "data"))
+        ids = columns["id"]
+        nodes = [
+            {"id": node_id, "type": node_type, "position": None if x is None else {"x": x, "y": y}, "data": data}
+            for node_id, node_type, x, y, data in zip(ids, codec.undictionary(columns["type"]), columns["x"], columns["y"], columns["data"])
+        ]
+        payload["nodes"] = codec.restore(nodes, columns["absent"], columns["extras"])
+        
+        columns = codec.columns(document, "edges", ("id", "source", "target", "type", "data"))
+        refs = columns["source"] + columns["target"]
+        if not all(ref is None or (type(ref) is int and 0 <= ref < len(ids)) for ref in refs):
+            raise ValueError("Edge endpoints must be node indices")
+        if not all(type(ref) is not int or ref in (0, 1, 2) for ref in columns["id"]):
+            raise ValueError("Unknown edge id form")
+        edges = []
+        for ref, s, t, edge_type, data in zip(columns["id"], columns["source"], columns["target"], codec.undictionary(columns["type"]), columns["data"]):
+            source = None if s is None else ids[s]
+            target = None if t is None else ids[t]
+            edge_id = codec.edge_id(ref, source, target, data) if type(ref) is int else ref
+            edges.append({"id": edge_id, "source": source, "target": target, "type": edge_type, "data": data})
+        payload["edges"] = codec.restore(edges, columns["absent"], columns["extras"])
+        return payload
+    
+    @staticmethod
+    def pack(payload: Dict) -> bytes:
+        return msgpack.packb(ReactFlowColumnarCodec.encode(payload), use_bin_type=True, default=str)
+    
+    @staticmethod
+    def unpack(body: bytes) -> Dict:
+        return ReactFlowColumnarCodec.decode(msgpack.unpackb(body, raw=False))
+
+REACTFLOW_MEDIA_TYPES = [media_type for media_type in AutoFlowConfig.REACTFLOW_MEDIA_TYPES if msgpack is not None or media_type != "application/msgpack"]
+REACTFLOW_SERIALIZERS = {"application/msgpack": ReactFlowColumnarCodec.pack} if msgpack is not None else {}
+
+def workflow_graph_rows(workflow_id: int, nodes: List[Dict], edges: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    '''workflow_nodes / workflow_edges rows for one stored ReactFlow graph'''
+    
+    node_rows = []
+    for node in nodes or []:
+        data = node.get("data") or {}
+        position = node.get("position") or {}
+        node_rows.append({
+            "workflow_id": workflow_id,
+            "node_id": node.get("id"),
+            "node_type": ReactFlowWorkflowEditor.workflow_node_type(node),
+            "n8n_type": data.get("n8n_type"),
+            "name": data.get("label"),
+            "position_x": position.get("x"),
+            "position_y": position.get("y")
+        })
+    edge_rows = [
+        {
+            "workflow_id": workflow_id,
+            "source_node_id": edge.get("source"),
+            "target_node_id": edge.get("target"),
+            "output_index": (edge.get("data") or {}).get("output_index", 0)
+        }
+        for edge in edges or []
+    ]
+    return node_rows, edge_rows
+
+def sync_workflow_graph(db: Session, workflows: List[Tuple[int, List[Dict], List[Dict]]]):
+    '''Replace the side-table rows of (workflow_id, nodes, edges) graphs inside the caller's transaction'''
+    
+    workflow_ids = [workflow_id for workflow_id, _, _ in workflows]
+    db.execute(delete(WorkflowNode).where(WorkflowNode.workflow_id.in_(workflow_ids)))
+    db.execute(delete(WorkflowEdge).where(WorkflowEdge.workflow_id.in_(workflow_ids)))
+    node_rows, edge_rows = [], []
+    for workflow_id, nodes, edges in workflows:
+        rows = workflow_graph_rows(workflow_id, nodes, edges)
+        node_rows += rows[0]
+        edge_rows += rows[1]
+    if node_rows:
+        db.execute(insert(WorkflowNode), node_rows)
+    if edge_rows:
+        db.execute(insert(WorkflowEdge), edge_rows)
+
+def generation_reactflow_data(result: Dict) -> Dict:
+    '''ReactFlow payload of a successful generation, whether it came from a template or the model'''
+    return result.get("reactflow_data") or ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(result["workflow"])
+
 # ============================================================================
-# SECTION 6: API ENDPOINTS AND ROUTES
+# SECTION 6: N8N TEMPLATE CORPUS
 # ============================================================================
 
-app = FastAPI(title="AutoFlow AI Platform", version="1.0.0")
+N8N_STICKY_NOTE_TYPE = "n8n-nodes-base.stickyNote"
+N8N_TYPE_NOISE_TOKENS = {"n8n", "nodes", "base", "langchain", "tool"}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+CAMEL_CASE_BOUNDARY_PATTERN = re.compile(r"([a-z0-9])([A-Z])")
+WORD_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
 
-# Database session dependency
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(AutoFlowConfig.DATABASE_URL))
+def split_identifier(text: str) -> List[str]:
+    '''Lowercase word tokens, splitting camelCase and punctuation (gmailTrigger -> gmail, trigger)'''
+    return WORD_TOKEN_PATTERN.findall(CAMEL_CASE_BOUNDARY_PATTERN.sub(r"\1 \2", text).lower())
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+QUERY_STOPWORDS = {
+    "a", "an", "the", "and", "or", "to", "of", "for", "in", "on", "with", "when", "that", "this",
+    "is", "are", "be", "it", "my", "our", "we", "i", "me", "from", "into", "as", "by", "via", "then",
+    "create", "build", "make", "workflow", "automation", "automate", "using", "use", "new", "every", "each"
+}
 
-# AI Workflow Generation Endpoints
-@app.post("/api/workflows/generate")
-async def generate_workflow(request: Dict, db: Session = Depends(get_db)):
-    '''Generate workflow from natural language description'''
+def query_terms(query: str) -> List[str]:
+    '''Distinct informative tokens of a free-text query'''
+    return sorted({token for token in split_identifier(query) if token not in QUERY_STOPWORDS})
+
+def template_tokens(template: Dict) -> List[str]:
+    '''Searchable tokens of a template: its name plus the names and types of its nodes'''
     
-    generator = AIWorkflowGenerator()
-    result = await generator.generate_workflow_from_description(
-        request["description"], 
-        request.get("context", {})
-    )
+    tokens = split_identifier(template.get("name", ""))
+    for node in template.get("nodes", []):
+        if node.get("type") == N8N_STICKY_NOTE_TYPE:
+            continue
+        tokens.extend(split_identifier(node.get("name", "")))
+        tokens.extend(token for token in split_identifier(node.get("type", "")) if token not in N8N_TYPE_NOISE_TOKENS)
+    return tokens
+
+class N8NTemplateCorpus:
+    '''Loads the n8n template files shipped with the playbook'''
     
-    if result["success"]:
-        # Convert to ReactFlow format
-        reactflow_data = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(result["workflow"])
+    TEMPLATE_EXTENSIONS = (".txt", ".json")
+    UNCATEGORIZED_DIRECTORIES = ("uncategorized",)
+    
+    @staticmethod
+    def iter_template_files(directories: List[str]):
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                for file_name in sorted(files):
+                    if file_name.endswith(N8NTemplateCorpus.TEMPLATE_EXTENSIONS):
+                        yield directory, os.path.join(root, file_name)
+    
+    @staticmethod
+    def structure_error(template: Dict) -> Optional[str]:
+        '''Why a posted n8n export cannot be read structurally, or None when it can'''
         
-        # Save to database
-        workflow = Workflow(
-            user_id=request["user_id"],
-            name=request.get("name", "AI Generated Workflow"),
-            description=request["description"],
-            nodes=reactflow_data["nodes"],
-            connections=reactflow_data["edges"],
-            ai_generated=True
+        nodes = template.get("nodes")
+        if not isinstance(nodes, list) or not all(isinstance(node, dict) for node in nodes):
+            return "nodes must be a list of objects"
+        if not all(isinstance(node.get("type", ""), str) and isinstance(node.get("parameters") or {}, dict) for node in nodes):
+            return "node type must be a string and parameters an object"
+        if not isinstance(template.get("name") or "", str):
+            return "name must be a string"
+        if not all(isinstance((node.get("parameters") or {}).get("content") or "", str)
+                   for node in nodes if node.get("type") == N8N_STICKY_NOTE_TYPE):
+            return "sticky note content must be a string"
+        connections = template.get("connections") or {}
+        if not isinstance(connections, dict) or not all(
+                isinstance(outputs or {}, dict) and all(
+                    isinstance(slots or [], list) and all(
+                        isinstance(targets or [], list) and all(isinstance(target, dict) for target in targets or [])
+                        for targets in slots or [])
+                    for slots in (outputs or {}).values())
+                for outputs in connections.values()):
+            return "connections must map node names to {type: [[{node, type, index}]]}"
+        return None
+    
+    @staticmethod
+    def parse_template(text: str, name: str = "", category: Optional[str] = None, path: Optional[str] = None) -> Optional[Dict]:
+        '''Parse one n8n export; returns None for files that are not workflow JSON'''
+        
+        try:
+            # Some exports carry trailing text after the JSON document, so decode only the first value
+            document, _ = json.JSONDecoder().raw_decode(text.lstrip())
+        except ValueError:
+            return None
+        if not isinstance(document, dict) or not isinstance(document.get("nodes"), list):
+            return None
+        
+        sticky_notes = [
+            node.get("parameters", {}).get("content", "")
+            for node in document["nodes"] if node.get("type") == N8N_STICKY_NOTE_TYPE
+        ]
+        return {
+            "name": document.get("name") or name,
+            "category": category,
+            "description": "\n\n".join(note for note in sticky_notes if note)[:2000],
+            "path": path,
+            "nodes": document["nodes"],
+            "connections": document.get("connections") or {}
+        }
+    
+    @staticmethod
+    def load(directories: Optional[List[str]] = None) -> List[Dict]:
+        '''Load every parseable template under the configured directories'''
+        
+        templates = []
+        for directory, path in N8NTemplateCorpus.iter_template_files(directories or AutoFlowConfig.TEMPLATE_DIRECTORIES):
+            parent = os.path.dirname(path)
+            category = None if os.path.abspath(parent) == os.path.abspath(directory) else os.path.basename(parent)
+            if category in N8NTemplateCorpus.UNCATEGORIZED_DIRECTORIES:
+                category = None
+            with open(path, encoding="utf-8", errors="replace") as template_file:
+                template = N8NTemplateCorpus.parse_template(
+                    template_file.read(),
+                    name=os.path.splitext(os.path.basename(path))[0],
+                    category=category,
+                    path=path
+                )
+            if template is not None:
+                templates.append(template)
+        return templates
+
+class TemplateIndex:
+    '''BM25 inverted index over template names, node names and node types'''
+    
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[Dict] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: List[int] = []
+    
+    @classmethod
+    def build(cls, templates) -> "TemplateIndex":
+        index = cls()
+        for template in templates:
+            index.add(template)
+        return index
+    
+    def add(self, template: Dict) -> int:
+        '''Index a template and return its document id'''
+        
+        doc_id = len(self.documents)
+        tokens = template_tokens(template)
+        self.documents.append({
+            "name": template.get("name"),
+            "category": template.get("category"),
+            "path": template.get("path"),
+            "node_count": len(template.get("nodes", []))
+        })
+        self.lengths.append(len(tokens))
+        for token, frequency in Counter(tokens).items():
+            self.postings.setdefault(token, {})[doc_id] = frequency
+        return doc_id
+    
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        '''Rank templates against a free-text query, best match first'''
+        
+        if not self.documents:
+            return []
+        
+        average_length = sum(self.lengths) / len(self.lengths) or 1
+        scores = Counter()
+        for token in query_terms(query):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = self.idf(token)
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        
+        return [
+            {"doc_id": doc_id, "score": round(score, 4), **self.documents[doc_id]}
+            for doc_id, score in scores.most_common(limit)
+        ]
+    
+    def idf(self, token: str) -> float:
+        document_frequency = len(self.postings.get(token, ()))
+        return math.log(1 + (len(self.documents) - document_frequency + 0.5) / (document_frequency + 0.5))
+    
+    def query_coverage(self, query: str, doc_id: int) -> float:
+        '''Share of the query's IDF mass that the document contains (1.0 = every informative term)'''
+        
+        weights = {token: self.idf(token) for token in query_terms(query)}
+        total = sum(weights.values())
+        matched = sum(weight for token, weight in weights.items() if doc_id in self.postings.get(token, ()))
+        return matched / total if total else 0.0
+
+COPY_SUFFIX_PATTERN = re.compile(r"\s+\d+$")
+
+def template_structure_shingles(template: Dict) -> List[str]:
+    '''Structural shingles of an n8n template: node types, parameter keys and typed connection paths
+    
+    Names, ids, positions and parameter values are ignored, so re-exports and copies that
+    differ only in those produce the same set. Repeated node types are numbered so that
+    multiplicity counts.
+    '''
+    
+    nodes = [node for node in template.get("nodes", []) if node.get("type") != N8N_STICKY_NOTE_TYPE]
+    types_by_name = {node.get("name"): node.get("type", "") for node in nodes}
+    seen = Counter()
+    
+    def numbered(shingle):
+        seen[shingle] += 1
+        return f"{shingle}#{seen[shingle]}"
+    
+    shingles = []
+    for node in nodes:
+        shingles.append(numbered("n:" + node.get("type", "")))
+        for key in sorted(node.get("parameters") or {}):
+            shingles.append(numbered(f"k:{node.get('type', '')}.{key}"))
+    successors = {}
+    for source, outputs in (template.get("connections") or {}).items():
+        for connection_type, output_slots in (outputs or {}).items():
+            for targets in output_slots or []:
+                for target in targets or []:
+                    if source in types_by_name and target.get("node") in types_by_name:
+                        successors.setdefault(source, []).append(target["node"])
+                        shingles.append(numbered(f"e:{types_by_name[source]}>{types_by_name[target['node']]}:{connection_type}"))
+    for source, targets in successors.items():
+        for middle in targets:
+            for target in successors.get(middle, []):
+                shingles.append(numbered(f"p:{types_by_name[source]}>{types_by_name[middle]}>{types_by_name[target]}"))
+    return shingles
+
+class MinHasher:
+    '''MinHash signatures with universal hashing (a*x + b mod 2^31-1), vectorized over shingles'''
+    
+    PRIME = (1 << 31) - 1
+    
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, self.PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, self.PRIME, num_perm, dtype=np.uint64)
+    
+    def signature(self, shingles: List[str]) -> np.ndarray:
+        if not shingles:
+            return np.full(self.num_perm, self.PRIME, dtype=np.uint64)
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little") % self.PRIME for shingle in set(shingles)),
+            dtype=np.uint64
         )
-        db.add(workflow)
-        db.commit()
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % self.PRIME).min(axis=1)
+    
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+class TemplateVariantIndex:
+    '''LSH banding over MinHash signatures: near-duplicate lookups in O(1) expected time
+    
+    Each signature is cut into bands of rows; templates sharing any band bucket are
+    candidates and are confirmed by estimated Jaccard similarity. 16 bands of 8 rows put
+    the LSH S-curve midpoint near 0.7, under the 0.8 default threshold.
+    '''
+    
+    def __init__(self, threshold: float = 0.8, bands: int = 16, rows: int = 8):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows)
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures: List[np.ndarray] = []
+        self.group_of: List[int] = []
+        self.groups: Dict[int, List[int]] = {}
+        self.templates: List[Dict] = []
+        self.representatives: Dict[int, Dict] = {}
+    
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+    
+    def find_duplicate(self, signature: np.ndarray) -> Optional[int]:
+        '''Index of the most similar indexed template at or above the threshold, if any'''
+        best, best_similarity = None, self.threshold
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(key, ()))
+        for candidate in candidates:
+            similarity = MinHasher.similarity(signature, self.signatures[candidate])
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+    
+    def add(self, template: Dict) -> int:
+        '''Index a template; returns the id of the variant group it joined or founded'''
+        signature = self.hasher.signature(template_structure_shingles(template))
+        duplicate = self.find_duplicate(signature)
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        group = self.group_of[duplicate] if duplicate is not None else position
+        self.group_of.append(group)
+        self.groups.setdefault(group, []).append(position)
+        for band, key in self._band_keys(signature):
+            self.buckets[band].setdefault(key, []).append(position)
+        return group
+    
+    @staticmethod
+    def canonical(templates: List[Dict]) -> Dict:
+        '''Representative of a variant group: prefer un-numbered copies, categorized files, then the shortest name'''
+        return min(templates, key=lambda template: (
+            bool(COPY_SUFFIX_PATTERN.search(os.path.splitext(os.path.basename(template.get("path") or ""))[0])),
+            template.get("category") is None,
+            len(template.get("name") or ""),
+            template.get("path") or ""
+        ))
+    
+    @classmethod
+    def deduplicate(cls, templates: List[Dict], threshold: float = 0.8) -> "TemplateVariantIndex":
+        index = cls(threshold)
+        index.templates = templates
+        for template in templates:
+            index.add(template)
+        index.representatives = {
+            group: cls.canonical([templates[member] for member in members]) for group, members in index.groups.items()
+        }
+        return index
+    
+    def canonical_templates(self) -> List[Dict]:
+        return list(self.representatives.values())
+    
+    def variant_groups(self) -> List[Dict]:
+        '''Groups with more than one member: the canonical template and its variants, by name and path'''
+        groups = []
+        for group, members in self.groups.items():
+            if len(members) > 1:
+                representative = self.representatives[group]
+                groups.append({
+                    "canonical": {"name": representative["name"], "path": representative.get("path")},
+                    "variants": [
+                        {"name": self.templates[member]["name"], "path": self.templates[member].get("path")}
+                        for member in members if self.templates[member] is not representative
+                    ]
+                })
+        return groups
+    
+    def find_variant(self, template: Dict) -> Optional[Dict]:
+        '''Canonical template that a new template would be a variant of, if any'''
+        duplicate = self.find_duplicate(self.hasher.signature(template_structure_shingles(template)))
+        return None if duplicate is None else self.representatives[self.group_of[duplicate]]
+
+# Category taxonomy of workflow-organizer.js; the keywords only seed the centroids, which are then
+# refined on template content
+TEMPLATE_CATEGORY_KEYWORDS = {
+    "email-automation": ["email", "gmail", "outlook", "autoresponder", "reply", "imap", "smtp"],
+    "social-media": ["telegram", "twitter", "instagram", "social", "discord", "whatsapp", "linkedin"],
+    "data-analysis": ["analyze", "data", "analytics", "insights", "research", "extract"],
+    "content-generation": ["generate", "write", "content", "blog", "post", "article", "wordpress"],
+    "ai-chatbots": ["chatbot", "chat", "bot", "assistant", "conversation", "agent"],
+    "document-processing": ["pdf", "document", "parse", "ocr", "invoice", "file"],
+    "workflow-automation": ["workflow", "process", "pipeline", "trigger", "webhook", "schedule"],
+    "image-video": ["image", "video", "photo", "visual", "dalle", "flux"],
+    "database-integration": ["database", "supabase", "postgres", "airtable", "mongodb", "sql"],
+    "monitoring-alerts": ["monitor", "alert", "notification", "tracking", "security"],
+    "voice-audio": ["voice", "audio", "speech", "transcribe", "elevenlabs"],
+    "ecommerce": ["shop", "product", "commerce", "payment", "store", "shopify", "stripe"],
+    "productivity": ["calendar", "task", "notion", "productivity", "todo"],
+    "hr-recruitment": ["hr", "recruitment", "cv", "resume", "candidate", "job"],
+    "advanced-ai": ["rag", "embedding", "embeddings", "vector", "langchain", "qdrant", "pinecone"]
+}
+
+def template_category_terms(template: Dict) -> Counter:
+    '''Classifier terms of a template: name, node names and types, plus sticky-note text'''
+    
+    terms = Counter(token for token in template_tokens(template) if not token.isdigit())
+    terms.update(
+        token for token in split_identifier(template.get("description") or "")[:400]
+        if token not in QUERY_STOPWORDS and not token.isdigit()
+    )
+    return terms
+
+def sparse_dense_product(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, dense: np.ndarray) -> np.ndarray:
+    '''CSR rows (indptr, indices, data) times a dense (vocabulary x k) matrix'''
+    
+    result = np.zeros((len(indptr) - 1, dense.shape[1]), dtype=np.float32)
+    nonempty = np.diff(indptr) > 0
+    if nonempty.any():
+        # Empty rows add no products, so the remaining row starts still bound each row's segment
+        result[nonempty] = np.add.reduceat(data[:, None] * dense[indices], indptr[:-1][nonempty], axis=0)
+    return result
+
+class TemplateCategoryClassifier:
+    '''Nearest-centroid category classifier over sparse TF-IDF template vectors
+    
+    Centroids start from the taxonomy keywords and are refined by a few rounds of
+    assigning the corpus and re-averaging (templates that already carry a taxonomy
+    category stay pinned to it). The corpus is scored in one sparse x dense product;
+    a single template at ingest costs one lookup per term and a small matrix-vector product.
+    '''
+    
+    def __init__(self, categories: Dict[str, List[str]] = TEMPLATE_CATEGORY_KEYWORDS, min_score: float = 0.05, iterations: int = 3):
+        self.categories = list(categories)
+        self.keywords = categories
+        self.min_score = min_score
+        self.iterations = iterations
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.centroids = np.zeros((0, len(self.categories)), dtype=np.float32)  # vocabulary x categories
+    
+    def _csr(self, templates: List[Dict], grow: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        indptr, indices, data = [0], [], []
+        for template in templates:
+            for term, count in template_category_terms(template).items():
+                column = self.vocabulary.get(term)
+                if column is None:
+                    if not grow:
+                        continue
+                    column = self.vocabulary[term] = len(self.vocabulary)
+                indices.append(column)
+                data.append(1 + math.log(count))
+            indptr.append(len(indices))
+        return np.array(indptr, dtype=np.int64), np.array(indices, dtype=np.int64), np.array(data, dtype=np.float32)
+    
+    def _tfidf(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray) -> np.ndarray:
+        data = data * self.idf[indices]
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=len(indptr) - 1))
+        return (data / np.maximum(norms[rows], 1e-12)).astype(np.float32)
+    
+    def _normalize(self, centroids: np.ndarray) -> np.ndarray:
+        return (centroids / np.maximum(np.linalg.norm(centroids, axis=0, keepdims=True), 1e-12)).astype(np.float32)
+    
+    def fit(self, templates: List[Dict]) -> "TemplateCategoryClassifier":
+        for keywords in self.keywords.values():
+            for keyword in keywords:
+                self.vocabulary.setdefault(keyword, len(self.vocabulary))
+        indptr, indices, raw = self._csr(templates, grow=True)
+        document_frequency = np.bincount(indices, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + len(templates)) / (1 + document_frequency)) + 1).astype(np.float32)
+        data = self._tfidf(indptr, indices, raw)
+        
+        seeds = np.zeros((len(self.vocabulary), len(self.categories)), dtype=np.float32)
+        for category, keywords in enumerate(self.keywords.values()):
+            for keyword in keywords:
+                seeds[self.vocabulary[keyword], category] = self.idf[self.vocabulary[keyword]]
+        seeds = self._normalize(seeds)
+        
+        rows = np.repeat(np.arange(len(templates)), np.diff(indptr))
+        pinned = np.array([
+            self.categories.index(template["category"]) if template.get("category") in self.keywords else -1
+            for template in templates
+        ], dtype=np.int64)
+        self.centroids = seeds
+        for _ in range(self.iterations):
+            scores = sparse_dense_product(indptr, indices, data, self.centroids)
+            labels = np.where(pinned >= 0, pinned, np.argmax(scores, axis=1))
+            confident = (pinned >= 0) | (scores.max(axis=1) >= self.min_score)
+            keep = confident[rows]
+            sums = np.zeros_like(seeds)
+            np.add.at(sums, (indices[keep], labels[rows][keep]), data[keep])
+            # The seed keeps each category anchored to its meaning while the corpus fills in its vocabulary
+            self.centroids = self._normalize(seeds + self._normalize(sums))
+        return self
+    
+    def _labels(self, scores: np.ndarray) -> List[Tuple[Optional[str], float]]:
+        best = np.argmax(scores, axis=1)
+        return [
+            (self.categories[category] if score >= self.min_score else None, round(float(score), 4))
+            for category, score in zip(best, scores[np.arange(len(best)), best])
+        ]
+    
+    def scores(self, templates: List[Dict]) -> np.ndarray:
+        '''Cosine of every template to every category centroid, in one vectorized pass'''
+        indptr, indices, raw = self._csr(templates)
+        return sparse_dense_product(indptr, indices, self._tfidf(indptr, indices, raw), self.centroids)
+    
+    def classify(self, templates: List[Dict]) -> List[Tuple[Optional[str], float]]:
+        '''(category, score) per template; category is None below min_score'''
+        return self._labels(self.scores(templates))
+    
+    def classify_one(self, template: Dict) -> Tuple[Optional[str], float]:
+        columns, counts = [], []
+        for term, count in template_category_terms(template).items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                columns.append(column)
+                counts.append(count)
+        if not columns:
+            return None, 0.0
+        weights = (1 + np.log(np.array(counts, dtype=np.float32))) * self.idf[columns]
+        return self._labels((weights @ self.centroids[columns] / np.linalg.norm(weights))[None, :])[0]
+
+class TemplateLibrary:
+    '''Template corpus and its search index, loaded once per process on first use'''
+    
+    def __init__(self, directories: List[str]):
+        self.directories = directories
+        self.templates: List[Dict] = []
+        self.variants: Optional[TemplateVariantIndex] = None
+        self.classifier: Optional[TemplateCategoryClassifier] = None
+        self.index = TemplateIndex()
+        self.loaded = False
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_templates(cls, templates: List[Dict]) -> "TemplateLibrary":
+        library = cls([])
+        library.templates = templates
+        library.index = TemplateIndex.build(templates)
+        library.loaded = True
+        return library
+    
+    def load(self) -> "TemplateLibrary":
+        with self._lock:
+            if not self.loaded:
+                templates = N8NTemplateCorpus.load(self.directories)
+                if AutoFlowConfig.TEMPLATE_DEDUP_ENABLED:
+                    # Search only the canonical member of each near-duplicate group
+                    self.variants = TemplateVariantIndex.deduplicate(templates, AutoFlowConfig.TEMPLATE_DEDUP_THRESHOLD)
+                    templates = self.variants.canonical_templates()
+                self.classifier = TemplateCategoryClassifier(min_score=AutoFlowConfig.TEMPLATE_CATEGORY_MIN_SCORE).fit(templates)
+                uncategorized = [template for template in templates if not template["category"]]
+                for template, (category, _) in zip(uncategorized, self.classifier.classify(uncategorized)):
+                    template["category"] = category
+                self.index = TemplateIndex.build(templates)
+                self.templates = templates
+                self.loaded = True
+        return self
+
+class TemplateFastPath:
+    '''Answers generation requests straight from the template corpus when one template clearly matches'''
+    
+    def __init__(self, library: TemplateLibrary, min_confidence: float, min_terms: int):
+        self.library = library
+        self.min_confidence = min_confidence
+        self.min_terms = min_terms
+        self.lookups = 0
+        self.hits = 0
+        self.lookup_seconds = 0.0
+        self.generation_seconds_ewma = None
+        self.latency_saved_seconds = 0.0
+    
+    async def match(self, description: str) -> Optional[Dict]:
+        '''Best template for the description, or None when confidence is below the threshold'''
+        
+        started = time.perf_counter()
+        if not self.library.loaded:
+            await asyncio.to_thread(self.library.load)
         
+        match = None
+        if len(query_terms(description)) >= self.min_terms:
+            top = self.library.index.search(description, limit=1)
+            if top:
+                confidence = self.library.index.query_coverage(description, top[0]["doc_id"])
+                if confidence >= self.min_confidence:
+                    match = {"template": self.library.templates[top[0]["doc_id"]], "confidence": round(confidence, 3)}
+        
+        elapsed = time.perf_counter() - started
+        self.lookups += 1
+        self.lookup_seconds += elapsed
+        if match:
+            self.hits += 1
+            if self.generation_seconds_ewma is not None:
+                self.latency_saved_seconds += max(0.0, self.generation_seconds_ewma - elapsed)
+        return match
+    
+    def record_generation_latency(self, seconds: float):
+        '''Feed the latency of a model generation so saved time can be estimated for hits'''
+        if self.generation_seconds_ewma is None:
+            self.generation_seconds_ewma = seconds
+        else:
+            self.generation_seconds_ewma = 0.1 * seconds + 0.9 * self.generation_seconds_ewma
+    
+    def metrics(self) -> Dict:
         return {
-            "workflow_id": workflow.id,
-            "reactflow_data": reactflow_data,
-            "ai_confidence": result["ai_confidence"],
-            "suggestions": result["suggestions"]
+            "enabled": AutoFlowConfig.TEMPLATE_FAST_PATH_ENABLED,
+            "templates": len(self.library.templates),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None,
+            "mean_lookup_ms": round(self.lookup_seconds / self.lookups * 1000, 3) if self.lookups else None,
+            "mean_generation_ms": round(self.generation_seconds_ewma * 1000, 1) if self.generation_seconds_ewma else None,
+            "latency_saved_seconds": round(self.latency_saved_seconds, 2)
         }
+
+class GenerationPromptBuilder:
+    '''Grounds the generation prompt in compact skeletons of the most similar templates
+    
+    Skeletons keep only [type, name] per node and [from, to] per edge, in the same index
+    space the model is asked to answer in. Examples are added in rank order while the
+    estimated prompt stays inside the token budget, and max_tokens is sized from the node
+    counts of the retrieved examples instead of a flat ceiling.
+    '''
+    
+    BASE_SYSTEM_PROMPT = (
+        "You are an expert workflow automation designer. Generate a complete workflow specification "
+        "from the user description. Return only minified JSON, no prose or markdown: "
+        '{"nodes":[{"type":T,"name":str,"config":{}}],"connections":[{"from":i,"to":j}],"metadata":{}} '
+        f"where T is one of {', '.join(AutoFlowConfig.WORKFLOW_NODE_TYPES)} and i, j are indexes into nodes. "
+        "Keep config to the parameters the workflow needs."
+    )
+    MAX_SKELETON_NODES = 40
+    
+    def __init__(self, library: TemplateLibrary, examples: int, prompt_token_budget: int,
+                 tokens_per_node: int, min_output_tokens: int, max_output_tokens: int):
+        self.library = library
+        self.examples = examples
+        self.prompt_token_budget = prompt_token_budget
+        self.tokens_per_node = tokens_per_node
+        self.min_output_tokens = min_output_tokens
+        self.max_output_tokens = max_output_tokens
+        self.builds = 0
+        self.prompt_tokens_total = 0
+        self.max_tokens_total = 0
+        self.completions = 0
+        self.output_tokens_total = 0
+        self.truncated = 0
+    
+    @staticmethod
+    def template_skeleton(template: Dict, max_nodes: int = MAX_SKELETON_NODES) -> Dict:
+        nodes = [node for node in template["nodes"] if node.get("type") != N8N_STICKY_NOTE_TYPE][:max_nodes]
+        positions = {node["name"]: i for i, node in enumerate(nodes)}
+        edges = []
+        for source_name, outputs in template.get("connections", {}).items():
+            for output_slots in outputs.values():
+                for targets in output_slots or []:
+                    for target in targets or []:
+                        if source_name in positions and target.get("node") in positions:
+                            edges.append([positions[source_name], positions[target["node"]]])
+        return {
+            "name": template["name"],
+            "nodes": [[ReactFlowWorkflowEditor.classify_n8n_node_type(node.get("type", "")), node["name"]] for node in nodes],
+            "edges": edges
+        }
+    
+    async def build(self, description: str) -> Dict:
+        '''System prompt and max_tokens for one generation'''
+        
+        prompt_tokens = estimate_tokens(self.BASE_SYSTEM_PROMPT) + estimate_tokens(description)
+        if not AutoFlowConfig.GENERATION_PROMPT_GROUNDING_ENABLED:
+            return {"system": self.BASE_SYSTEM_PROMPT, "max_tokens": self.max_output_tokens, "prompt_tokens": prompt_tokens, "examples": []}
+        
+        if not self.library.loaded:
+            await asyncio.to_thread(self.library.load)
+        
+        examples, example_names, node_counts = [], [], []
+        # Over-fetch: the corpus carries copies of the same template under several files
+        for hit in self.library.index.search(description, limit=self.examples * 3):
+            if len(examples) == self.examples:
+                break
+            skeleton = self.template_skeleton(self.library.templates[hit["doc_id"]])
+            if skeleton["name"] in example_names:
+                continue
+            skeleton_text = json.dumps(skeleton, separators=(",", ":"), ensure_ascii=False)
+            cost = estimate_tokens(skeleton_text)
+            if prompt_tokens + cost > self.prompt_token_budget:
+                continue
+            examples.append(skeleton_text)
+            example_names.append(skeleton["name"])
+            node_counts.append(len(skeleton["nodes"]))
+            prompt_tokens += cost
+        
+        system = self.BASE_SYSTEM_PROMPT
+        max_tokens = self.max_output_tokens
+        if examples:
+            system += "\n\nSimilar proven workflows ([type,name] nodes, [from,to] edges); adapt, do not copy:\n" + "\n".join(examples)
+            # Leave 25% headroom over the largest example plus room for the JSON envelope
+            expected_nodes = max(node_counts) * 1.25
+            max_tokens = int(min(self.max_output_tokens, max(self.min_output_tokens, expected_nodes * self.tokens_per_node + 150)))
+        
+        self.builds += 1
+        self.prompt_tokens_total += prompt_tokens
+        self.max_tokens_total += max_tokens
+        return {"system": system, "max_tokens": max_tokens, "prompt_tokens": prompt_tokens, "examples": example_names}
+    
+    def record_completion(self, prompt: Dict, completion: LLMCompletion):
+        self.completions += 1
+        self.output_tokens_total += completion.output_tokens
+        if completion.output_tokens >= prompt["max_tokens"]:
+            self.truncated += 1
+    
+    def metrics(self) -> Dict:
+        return {
+            "grounding_enabled": AutoFlowConfig.GENERATION_PROMPT_GROUNDING_ENABLED,
+            "builds": self.builds,
+            "mean_prompt_tokens": round(self.prompt_tokens_total / self.builds, 1) if self.builds else None,
+            "mean_max_tokens": round(self.max_tokens_total / self.builds, 1) if self.builds else None,
+            "mean_output_tokens": round(self.output_tokens_total / self.completions, 1) if self.completions else None,
+            "truncation_rate": round(self.truncated / self.completions, 4) if self.completions else None
+        }
+
+def vector_document(name: str, description: str, nodes: List[Tuple[str, str]]) -> Dict:
+    '''Common shape for vectorizing templates and stored workflows: nodes are (type, name) pairs'''
+    return {"name": name or "", "description": description or "", "nodes": nodes}
+
+def template_vector_document(template: Dict) -> Dict:
+    return vector_document(template.get("name"), template.get("description"), [
+        (node.get("type", ""), node.get("name", "")) for node in template.get("nodes", []) if node.get("type") != N8N_STICKY_NOTE_TYPE
+    ])
+
+class HashedTfidfVectorizer:
+    '''TF-IDF over signed feature hashing into a fixed number of float32 dimensions
+    
+    Features are namespaced (t: node type tokens, w: template and node name tokens,
+    d: description tokens) and weighted per namespace; IDF is fitted per hash bucket on
+    the template corpus. Rows are L2-normalized so a dot product is cosine similarity.
+    '''
+    
+    FIELD_WEIGHTS = {"t": 2.0, "w": 1.0, "d": 0.5}
+    
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.idf = np.ones(dimensions, dtype=np.float32)
+        self._buckets: Dict[str, Tuple[int, float]] = {}
+    
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        bucket = self._buckets.get(feature)
+        if bucket is None:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            bucket = self._buckets[feature] = (digest % self.dimensions, 1.0 if digest >> 63 else -1.0)
+        return bucket
+    
+    @staticmethod
+    def features(document: Dict) -> Counter:
+        features = Counter()
+        for token in split_identifier(document["name"]):
+            if token not in QUERY_STOPWORDS:
+                features["w:" + token] += 1
+        for token in split_identifier(document["description"])[:300]:
+            if token not in QUERY_STOPWORDS:
+                features["d:" + token] += 1
+        for node_type, node_name in document["nodes"]:
+            for token in split_identifier(node_type):
+                if token not in N8N_TYPE_NOISE_TOKENS:
+                    features["t:" + token] += 1
+            for token in split_identifier(node_name):
+                features["w:" + token] += 1
+        return features
+    
+    def _term_matrix(self, documents: List[Dict]) -> np.ndarray:
+        matrix = np.zeros((len(documents), self.dimensions), dtype=np.float32)
+        for row, document in enumerate(documents):
+            for feature, count in self.features(document).items():
+                bucket, sign = self._bucket(feature)
+                matrix[row, bucket] += sign * self.FIELD_WEIGHTS[feature[0]] * (1 + math.log(count))
+        return matrix
+    
+    def fit(self, documents: List[Dict]) -> "HashedTfidfVectorizer":
+        document_frequency = np.count_nonzero(self._term_matrix(documents), axis=0)
+        self.idf = np.log((1 + len(documents)) / (1 + document_frequency)).astype(np.float32) + 1
+        return self
+    
+    def transform(self, documents: List[Dict]) -> np.ndarray:
+        matrix = self._term_matrix(documents) * self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.ascontiguousarray(matrix / np.maximum(norms, 1e-12), dtype=np.float32)
+
+class SentenceEmbeddingVectorizer:
+    '''Optional local embedding model (sentence-transformers), used when VECTOR_EMBEDDING_MODEL is set'''
+    
+    def __init__(self, model_name: str):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise RuntimeError("VECTOR_EMBEDDING_MODEL requires the sentence-transformers package")
+        self.model = SentenceTransformer(model_name)
+        self.dimensions = self.model.get_sentence_embedding_dimension()
+    
+    def fit(self, documents: List[Dict]) -> "SentenceEmbeddingVectorizer":
+        return self
+    
+    def transform(self, documents: List[Dict]) -> np.ndarray:
+        texts = [". ".join([document["name"], *(name for _, name in document["nodes"]), document["description"][:500]]) for document in documents]
+        return np.ascontiguousarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+class VectorIndex:
+    '''Contiguous float32 matrix of unit vectors with batched matmul top-k
+    
+    Rows carry a key and an owner id so results can be restricted to one user. Past
+    ivf_min_rows the index switches to IVF: spherical k-means cells over the rows, with
+    int8 row-scaled codes, and a query scans only the nprobe nearest cells.
+    '''
+    
+    def __init__(self, dimensions: int, ivf_min_rows: int = 50000, nprobe: int = 8):
+        self.dimensions = dimensions
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.matrix = np.zeros((16, dimensions), dtype=np.float32)
+        self.owners = np.zeros(16, dtype=np.int64)
+        self.size = 0
+        self.keys: List[Any] = []
+        self.positions: Dict[Any, int] = {}
+        self.centroids = None
+        self.cells: List[np.ndarray] = []
+        self.codes = None
+        self.scales = None
+    
+    def _grow(self, rows: int):
+        if self.size + rows > len(self.matrix):
+            capacity = max(len(self.matrix) * 2, self.size + rows)
+            matrix = np.zeros((capacity, self.dimensions), dtype=np.float32)
+            matrix[:self.size] = self.matrix[:self.size]
+            owners = np.zeros(capacity, dtype=np.int64)
+            owners[:self.size] = self.owners[:self.size]
+            self.matrix, self.owners = matrix, owners
+    
+    def upsert(self, keys: List[Any], vectors: np.ndarray, owners: Optional[List[int]] = None):
+        owners = owners if owners is not None else [0] * len(keys)
+        self._grow(len(keys))
+        for key, vector, owner in zip(keys, vectors, owners):
+            position = self.positions.get(key)
+            if position is None:
+                position = self.positions[key] = self.size
+                self.keys.append(key)
+                self.size += 1
+            self.matrix[position] = vector
+            self.owners[position] = owner
+            if self.centroids is not None:
+                self._assign(position)
+        if self.centroids is None and self.size >= self.ivf_min_rows:
+            self.build_ivf()
+    
+    def remove(self, keys: List[Any]) -> List[int]:
+        '''Drop rows by key, moving the last row into each freed slot; returns the removed rows' owners'''
+        
+        owners = []
+        for key in keys:
+            position = self.positions.pop(key, None)
+            if position is None:
+                continue
+            owners.append(int(self.owners[position]))
+            last = self.size - 1
+            if self.centroids is not None:
+                self._unassign(position)
+            if position != last:
+                moved = self.keys[last]
+                self.keys[position] = moved
+                self.positions[moved] = position
+                self.matrix[position] = self.matrix[last]
+                self.owners[position] = self.owners[last]
+                if self.centroids is not None:
+                    self.codes[position] = self.codes[last]
+                    self.scales[position] = self.scales[last]
+                    for members in self.cells:
+                        members[members == last] = position
+            self.keys.pop()
+            self.size -= 1
+        return owners
+    
+    def keys_of(self, owner: int) -> List[Any]:
+        return [self.keys[position] for position in np.flatnonzero(self.owners[:self.size] == owner)]
+    
+    def build_ivf(self, iterations: int = 8, seed: int = 0):
+        vectors = self.matrix[:self.size]
+        cell_count = max(1, int(math.sqrt(self.size)))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(self.size, cell_count, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.scales = np.zeros(len(self.matrix), dtype=np.float32)
+        self.codes = np.zeros((len(self.matrix), self.dimensions), dtype=np.int8)
+        self.cells = [np.zeros(0, dtype=np.int64) for _ in range(cell_count)]
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        self._quantize(np.arange(self.size))
+        for cell in range(cell_count):
+            self.cells[cell] = np.flatnonzero(assignment == cell)
+    
+    def _quantize(self, positions: np.ndarray):
+        if len(self.codes) < len(self.matrix):
+            codes = np.zeros((len(self.matrix), self.dimensions), dtype=np.int8)
+            codes[:len(self.codes)] = self.codes
+            scales = np.zeros(len(self.matrix), dtype=np.float32)
+            scales[:len(self.scales)] = self.scales
+            self.codes, self.scales = codes, scales
+        rows = self.matrix[positions]
+        scales = np.maximum(np.abs(rows).max(axis=1), 1e-12) / 127
+        self.codes[positions] = np.round(rows / scales[:, None]).astype(np.int8)
+        self.scales[positions] = scales
+    
+    def _unassign(self, position: int):
+        for cell, members in enumerate(self.cells):
+            if position in members:
+                self.cells[cell] = members[members != position]
+    
+    def _assign(self, position: int):
+        self._unassign(position)
+        cell = int(np.argmax(self.centroids @ self.matrix[position]))
+        self.cells[cell] = np.append(self.cells[cell], position)
+        self._quantize(np.array([position]))
+    
+    def search(self, queries: np.ndarray, limit: int = 10, owner: Optional[int] = None, exclude: Any = None) -> List[List[Tuple[Any, float]]]:
+        '''Top-k (key, cosine) per query row, optionally restricted to one owner'''
+        
+        if not self.size:
+            return [[] for _ in queries]
+        if self.centroids is not None:
+            return [self._search_ivf(query, limit, owner, exclude) for query in queries]
+        
+        scores = queries @ self.matrix[:self.size].T
+        if owner is not None:
+            scores[:, self.owners[:self.size] != owner] = -np.inf
+        if exclude in self.positions:
+            scores[:, self.positions[exclude]] = -np.inf
+        return [self._top(row, limit, None) for row in scores]
+    
+    def _search_ivf(self, query: np.ndarray, limit: int, owner: Optional[int], exclude: Any) -> List[Tuple[Any, float]]:
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        candidates = np.concatenate([self.cells[cell] for cell in probes])
+        if owner is not None:
+            candidates = candidates[self.owners[candidates] == owner]
+        if exclude in self.positions:
+            candidates = candidates[candidates != self.positions[exclude]]
+        scores = (self.codes[candidates] @ query) * self.scales[candidates]
+        return self._top(scores, limit, candidates)
+    
+    def _top(self, scores: np.ndarray, limit: int, candidates: Optional[np.ndarray]) -> List[Tuple[Any, float]]:
+        if not len(scores):
+            return []
+        top = np.argpartition(-scores, min(limit, len(scores)) - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (self.keys[candidates[i] if candidates is not None else i], round(float(scores[i]), 4))
+            for i in top if np.isfinite(scores[i])
+        ]
+
+class SimilarityService:
+    '''"Similar workflows": one vector index over canonical templates and one over stored workflows
+    
+    The vectorizer is fitted on the template corpus once. Workflow vectors are kept
+    fresh per user: each lookup seeks that user's rows updated since the last seen
+    updated_at through ix_workflows_user_updated, so saves from any worker are picked up.
+    Node types and names come from the workflow_nodes side table rather than the JSON.
+    
+    A "workflow:<id>" invalidation drops that row at once and has its owner's next lookup
+    re-read it, so deleted or reassigned workflows leave the index. Only the max_users most
+    recently queried users stay indexed.
+    
+    Lookups run in worker threads while invalidations arrive on the event loop, so index
+    state is only changed under _lock. A refresh reads and embeds outside it and applies
+    the result under it, dropping the result if a resync replaced the index meanwhile and
+    leaving out rows invalidated while it was reading.
+    '''
+    
+    def __init__(self, library: TemplateLibrary, dimensions: int, embedding_model: str = "",
+                 ivf_min_rows: int = 50000, nprobe: int = 8, max_users: int = 10000):
+        self.library = library
+        self.dimensions = dimensions
+        self.embedding_model = embedding_model
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.max_users = max_users
+        self.vectorizer = None
+        self.templates: Optional[VectorIndex] = None
+        self.workflows: Optional[VectorIndex] = None
+        self.user_watermarks: OrderedDict = OrderedDict()
+        self.stale: Dict[int, set] = {}
+        self.evictions = 0
+        self.resyncs = 0
+        self._refreshing = 0
+        self._invalidated_while_refreshing = set()
+        self._lock = threading.RLock()
+    
+    def load(self) -> "SimilarityService":
+        with self._lock:
+            if self.templates is None:
+                self.library.load()
+                documents = [template_vector_document(template) for template in self.library.templates]
+                vectorizer = (SentenceEmbeddingVectorizer(self.embedding_model) if self.embedding_model
+                              else HashedTfidfVectorizer(self.dimensions)).fit(documents)
+                templates = VectorIndex(vectorizer.dimensions, self.ivf_min_rows, self.nprobe)
+                templates.upsert(list(range(len(documents))), vectorizer.transform(documents))
+                self.workflows = VectorIndex(vectorizer.dimensions, self.ivf_min_rows, self.nprobe)
+                self.vectorizer, self.templates = vectorizer, templates
+        return self
+    
+    def on_invalidate(self, bus_key: Optional[str]):
+        '''Invalidation bus callback: evict one workflow, or every indexed workflow on a resync'''
+        
+        with self._lock:
+            if self.workflows is None:
+                return
+            if bus_key is None:
+                self.workflows = VectorIndex(self.vectorizer.dimensions, self.ivf_min_rows, self.nprobe)
+                self.user_watermarks.clear()
+                self.stale.clear()
+                self.resyncs += 1
+                return
+            key = bus_key[len("workflow:"):]
+            if not key.isdigit():
+                return
+            if self._refreshing:
+                self._invalidated_while_refreshing.add(int(key))
+            for owner in self.workflows.remove([int(key)]):
+                self.evictions += 1
+                if owner in self.user_watermarks:
+                    self.stale.setdefault(owner, set()).add(int(key))
+    
+    def _touch_user(self, user_id: int):
+        '''Mark the user most recently used, dropping the least recent one's rows past max_users'''
+        
+        with self._lock:
+            self.user_watermarks.move_to_end(user_id)
+            while len(self.user_watermarks) > self.max_users:
+                evicted, _ = self.user_watermarks.popitem(last=False)
+                self.stale.pop(evicted, None)
+                self.workflows.remove(self.workflows.keys_of(evicted))
+    
+    def refresh_user(self, db: Session, user_id: int):
+        '''Index this user's workflows created or updated since the last refresh, and re-read invalidated ones'''
+        
+        with self._lock:
+            watermark = self.user_watermarks.get(user_id)
+            stale = self.stale.pop(user_id, set())
+            resyncs = self.resyncs
+            self._refreshing += 1
+        try:
+            query = select(Workflow.id, Workflow.name, Workflow.description, Workflow.updated_at).where(Workflow.user_id == user_id)
+            if watermark:
+                query = query.where(or_(
+                    Workflow.updated_at > watermark[0],
+                    and_(Workflow.updated_at == watermark[0], Workflow.id > watermark[1]),
+                    Workflow.id.in_(stale)
+                ))
+            rows = db.execute(query.order_by(Workflow.updated_at, Workflow.id)).all()
+            if not rows:
+                if watermark:
+                    self._touch_user(user_id)
+                return
+            nodes = {}
+            for node in db.execute(
+                select(WorkflowNode.workflow_id, WorkflowNode.n8n_type, WorkflowNode.node_type, WorkflowNode.name)
+                .where(WorkflowNode.workflow_id.in_([row.id for row in rows]))
+            ):
+                nodes.setdefault(node.workflow_id, []).append((node.n8n_type or node.node_type or "", node.name or ""))
+            documents = [vector_document(row.name, row.description, nodes.get(row.id, [])) for row in rows]
+            vectors = self.vectorizer.transform(documents)
+        except Exception:
+            with self._lock:
+                self.stale.setdefault(user_id, set()).update(stale)
+            raise
+        finally:
+            with self._lock:
+                self._refreshing -= 1
+                invalidated = set(self._invalidated_while_refreshing)
+                if not self._refreshing:
+                    self._invalidated_while_refreshing.clear()
+        
+        with self._lock:
+            if self.resyncs != resyncs:
+                # The index was dropped while this read ran; the user's next lookup starts afresh
+                return
+            # What was read of a row invalidated meanwhile may already be out of date: re-read it next time
+            keep = [index for index, row in enumerate(rows) if row.id not in invalidated]
+            if len(keep) < len(rows):
+                self.stale.setdefault(user_id, set()).update(row.id for row in rows if row.id in invalidated)
+            self.workflows.upsert([rows[index].id for index in keep], vectors[keep], [user_id] * len(keep))
+            # Re-read stale rows may sort before the watermark; never move it backwards
+            latest = (rows[-1].updated_at, rows[-1].id)
+            self.user_watermarks[user_id] = max(watermark, latest) if watermark else latest
+            self._touch_user(user_id)
+    
+    def similar(self, db: Session, workflow: Workflow, limit: int) -> Dict:
+        self.refresh_user(db, workflow.user_id)
+        nodes = [(node.n8n_type or node.node_type or "", node.name or "") for node in db.execute(
+            select(WorkflowNode.n8n_type, WorkflowNode.node_type, WorkflowNode.name).where(WorkflowNode.workflow_id == workflow.id)
+        )]
+        query = self.vectorizer.transform([vector_document(workflow.name, workflow.description, nodes)])
+        
+        templates = self.templates.search(query, limit)[0]
+        with self._lock:
+            workflows = self.workflows.search(query, limit, owner=workflow.user_id, exclude=workflow.id)[0]
+        return {
+            "templates": [
+                {"name": self.library.templates[key]["name"], "category": self.library.templates[key]["category"], "score": score}
+                for key, score in templates
+            ],
+            "workflows": [{"workflow_id": key, "score": score} for key, score in workflows]
+        }
+
+template_library = TemplateLibrary(AutoFlowConfig.TEMPLATE_DIRECTORIES)
+
+template_fast_path = TemplateFastPath(
+    template_library,
+    min_confidence=AutoFlowConfig.TEMPLATE_FAST_PATH_MIN_CONFIDENCE,
+    min_terms=AutoFlowConfig.TEMPLATE_FAST_PATH_MIN_TERMS
+)
+
+similarity_service = SimilarityService(
+    template_library,
+    dimensions=AutoFlowConfig.VECTOR_DIMENSIONS,
+    embedding_model=AutoFlowConfig.VECTOR_EMBEDDING_MODEL,
+    ivf_min_rows=AutoFlowConfig.VECTOR_IVF_MIN_ROWS,
+    nprobe=AutoFlowConfig.VECTOR_IVF_PROBES,
+    max_users=AutoFlowConfig.SIMILAR_MAX_INDEXED_USERS
+)
+
+generation_prompt_builder = GenerationPromptBuilder(
+    template_library,
+    examples=AutoFlowConfig.GENERATION_PROMPT_EXAMPLES,
+    prompt_token_budget=AutoFlowConfig.GENERATION_PROMPT_TOKEN_BUDGET,
+    tokens_per_node=AutoFlowConfig.GENERATION_OUTPUT_TOKENS_PER_NODE,
+    min_output_tokens=AutoFlowConfig.GENERATION_MIN_OUTPUT_TOKENS,
+    max_output_tokens=AutoFlowConfig.GENERATION_MAX_OUTPUT_TOKENS
+)
+
+# ============================================================================
+# SECTION 7: WORKFLOW EXECUTION ENGINE
+# ============================================================================
+
+@dataclass
+class NodeHandler:
+    '''Executes one node type: fn(config, inputs, context) -> output
+    
+    Coroutine functions run on the event loop; plain functions run in the engine's thread
+    pool, or in the CPU pool (thread or process, see WORKFLOW_EXECUTION_CPU_POOL) when
+    cpu_bound is set. Process-pool handlers must be picklable module-level functions.
+    Handlers are assumed to have side effects and always run; pure ones opt in to
+    memoization with side_effects=False.
+    '''
+    fn: Callable
+    cpu_bound: bool = False
+    timeout_seconds: Optional[float] = None
+    side_effects: bool = True
+
+@dataclass
+class ExecutionPlan:
+    '''A stored workflow compiled for execution; nodes are addressed by index in topological order
+    
+    parents[i] and children[i] hold (node index, output slot) pairs, handlers[i] is the
+    resolved NodeHandler (None if the type has no handler) and levels[i] is the node's
+    longest distance from a root.
+    '''
+    node_ids: List[str]
+    node_types: List[str]
+    configs: List[Dict]
+    config_digests: List[str]
+    handlers: List[Optional[NodeHandler]]
+    memoizable: List[bool]
+    timeouts: List[float]
+    is_condition: List[bool]
+    parents: List[Tuple[Tuple[int, int], ...]]
+    children: List[Tuple[Tuple[int, int], ...]]
+    levels: List[int]
+    roots: List[int]
+
+class WorkflowCycleError(ValueError):
+    pass
+
+class NodeOutputCache:
+    '''Content-addressed node outputs: an in-memory LRU in front of an optional bounded disk tier
+    
+    Keys are hashes of node type, config and input hashes, so an entry never goes stale;
+    editing a node simply produces new keys for it and everything downstream of it.
+    Disk entries are one JSON file per key; outputs that are not JSON stay in memory only.
+    The engine touches the disk tier (load / persist) from worker threads, so it is locked.
+    '''
+    
+    def __init__(self, max_entries: int, directory: str = "", max_disk_entries: int = 0):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.memory = OrderedDict()
+        self.disk = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk_lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.stat().st_mtime)
+            for entry in entries:
+                if entry.name.endswith(".json"):
+                    self.disk[entry.name[:-5]] = entry.path
+    
+    @staticmethod
+    def digest(value: Any) -> str:
+        return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()).hexdigest()
+    
+    def get(self, key: str):
+        '''Returns (found, output), reading the disk tier inline'''
+        found, output = self.lookup(key)
+        return self.load(key) if found is None else (found, output)
+    
+    def lookup(self, key: str):
+        '''Memory tier only: (True, output) on a hit, (None, None) if only the disk tier has the key, else (False, None)'''
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return True, self.memory[key]
+        if key in self.disk:
+            return None, None
+        self.misses += 1
+        return False, None
+    
+    def load(self, key: str):
+        '''Disk tier read; safe to call from a worker thread'''
+        with self._disk_lock:
+            path = self.disk.get(key)
+        if path:
+            try:
+                with open(path) as cached:
+                    output = json.load(cached)
+            except (OSError, ValueError):
+                with self._disk_lock:
+                    self.disk.pop(key, None)
+            else:
+                with self._disk_lock:
+                    if key in self.disk:
+                        self.disk.move_to_end(key)
+                    self.disk_hits += 1
+                return True, output
+        self.misses += 1
+        return False, None
+    
+    def put(self, key: str, output: Any, persist: bool = True):
+        self.remember(key, output)
+        if persist:
+            self.persist(key, output)
+    
+    def persist(self, key: str, output: Any):
+        '''Disk tier write; safe to call from a worker thread'''
+        if not self.directory or key in self.disk:
+            return
+        try:
+            encoded = json.dumps(output)
+        except (TypeError, ValueError):
+            return
+        path = os.path.join(self.directory, f"{key}.json")
+        with open(path, "w") as cached:
+            cached.write(encoded)
+        evicted = []
+        with self._disk_lock:
+            self.disk[key] = path
+            while len(self.disk) > self.max_disk_entries:
+                evicted.append(self.disk.popitem(last=False)[1])
+        for stale in evicted:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    
+    def remember(self, key: str, output: Any):
+        self.memory[key] = output
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+    
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None
+        }
+
+class ExecutionPlanCache:
+    '''Compiled plans per workflow, valid for one updated_at version; LRU-bounded'''
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.compiles = 0
+    
+    def get(self, workflow_id: int, version: Any) -> Optional[ExecutionPlan]:
+        entry = self.plans.get(workflow_id)
+        if entry is None or entry[0] != version:
+            return None
+        self.plans.move_to_end(workflow_id)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, workflow_id: int, version: Any, plan: ExecutionPlan):
+        self.compiles += 1
+        self.plans[workflow_id] = (version, plan)
+        self.plans.move_to_end(workflow_id)
+        while len(self.plans) > self.max_entries:
+            self.plans.popitem(last=False)
+    
+    def invalidate(self, workflow_id: int):
+        self.plans.pop(workflow_id, None)
+    
+    def clear(self):
+        self.plans.clear()
+    
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.compiles
+        return {
+            "plans": len(self.plans),
+            "hits": self.hits,
+            "compiles": self.compiles,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+class WorkflowExecutionEngine:
+    '''Runs stored ReactFlow workflows as DAGs with independent branches in parallel
+    
+    A node starts as soon as all of its parents have settled, so wall time tracks the
+    critical path rather than the node count. A global semaphore bounds how many nodes
+    run at once across all executions. Condition nodes gate their outgoing edges: output
+    slot 0 is the true branch and slot 1 the false branch. Nodes with no live incoming
+    edge, or downstream of a failed node, are skipped.
+    
+    With an output cache, a node whose type, config, payload and input hashes were seen
+    before is answered from the cache, so a re-run after an edit executes only the edited
+    node and what is downstream of it. Only handlers declared free of side effects are
+    memoized; opt a node out with config {"memoize": false}. Keys are salted with the
+    caller's scope (workflow and owner) so outputs never cross tenants.
+    '''
+    
+    def __init__(self, handlers: Dict[str, NodeHandler], max_concurrency: int, node_timeout_seconds: float,
+                 cpu_pool: str = "thread", cpu_workers: int = 4, output_cache: NodeOutputCache = None,
+                 plan_cache: ExecutionPlanCache = None):
+        self.handlers = dict(handlers)
+        self.output_cache = output_cache
+        self.plan_cache = plan_cache or ExecutionPlanCache(AutoFlowConfig.EXECUTION_PLAN_CACHE_MAX_ENTRIES)
+        self.node_timeout_seconds = node_timeout_seconds
+        self.cpu_pool = cpu_pool
+        self.cpu_workers = cpu_workers
+        self._max_concurrency = max_concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
+        self._executor = None
+        self._thread_pool = None
+    
+    def register_handler(self, node_type: str, handler: NodeHandler):
+        if node_type not in AutoFlowConfig.WORKFLOW_NODE_TYPES:
+            raise ValueError(f"Unknown workflow node type: {node_type}")
+        self.handlers[node_type] = handler
+        # Cached plans hold resolved handler references
+        self.plan_cache.clear()
+    
+    def compile(self, nodes: List[Dict], edges: List[Dict]) -> ExecutionPlan:
+        '''Parse ReactFlow nodes/edges once into an index-addressed plan with handlers resolved'''
+        
+        positions = {node["id"]: i for i, node in enumerate(nodes)}
+        parents = [[] for _ in nodes]
+        children = [[] for _ in nodes]
+        for edge in edges or []:
+            source, target = positions.get(edge.get("source")), positions.get(edge.get("target"))
+            if source is not None and target is not None:
+                slot = (edge.get("data") or {}).get("output_index", 0)
+                children[source].append((target, slot))
+                parents[target].append((source, slot))
+        
+        in_degree = [len(node_parents) for node_parents in parents]
+        ready = deque(i for i, degree in enumerate(in_degree) if degree == 0)
+        order = []
+        while ready:
+            i = ready.popleft()
+            order.append(i)
+            for target, _ in children[i]:
+                in_degree[target] -= 1
+                if in_degree[target] == 0:
+                    ready.append(target)
+        if len(order) != len(nodes):
+            raise WorkflowCycleError("Workflow contains a cycle: " + ", ".join(nodes[i]["id"] for i, degree in enumerate(in_degree) if degree > 0))
+        
+        # Renumber so that index order is topological order
+        rank = [0] * len(nodes)
+        for new_index, old_index in enumerate(order):
+            rank[old_index] = new_index
+        node_types, configs, handlers = [], [], []
+        for old_index in order:
+            node = nodes[old_index]
+            node_type = ReactFlowWorkflowEditor.workflow_node_type(node)
+            node_types.append(node_type)
+            configs.append((node.get("data") or {}).get("config") or {})
+            handlers.append(self.handlers.get(node_type))
+        plan_parents = [tuple((rank[source], slot) for source, slot in parents[old_index]) for old_index in order]
+        levels = []
+        for i, node_parents in enumerate(plan_parents):
+            levels.append(max((levels[source] + 1 for source, _ in node_parents), default=0))
+        
+        return ExecutionPlan(
+            node_ids=[nodes[old_index]["id"] for old_index in order],
+            node_types=node_types,
+            configs=configs,
+            config_digests=[NodeOutputCache.digest([node_type, config]) for node_type, config in zip(node_types, configs)],
+            handlers=handlers,
+            memoizable=[config.get("memoize", True) and handler is not None and not handler.side_effects
+                        for config, handler in zip(configs, handlers)],
+            timeouts=[config.get("timeout_seconds") or (handler and handler.timeout_seconds) or self.node_timeout_seconds
+                      for config, handler in zip(configs, handlers)],
+            is_condition=[node_type == "condition" for node_type in node_types],
+            parents=plan_parents,
+            children=[tuple((rank[target], slot) for target, slot in children[old_index]) for old_index in order],
+            levels=levels,
+            roots=[i for i, node_parents in enumerate(plan_parents) if not node_parents]
+        )
+    
+    def plan_for(self, workflow_id: int, version: Any, load: Callable[[], Tuple[List[Dict], List[Dict]]]) -> ExecutionPlan:
+        '''Cached plan for one workflow version; load() fetches nodes/edges only on a miss'''
+        
+        plan = self.plan_cache.get(workflow_id, version)
+        if plan is None:
+            plan = self.compile(*load())
+            self.plan_cache.put(workflow_id, version, plan)
+        return plan
+    
+    def _cpu_executor(self):
+        if self._executor is None:
+            pool = ProcessPoolExecutor if self.cpu_pool == "process" else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.cpu_workers)
+        return self._executor
+    
+    def _thread_executor(self):
+        '''Pool for plain handlers; the semaphore already bounds how many can be running'''
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self._max_concurrency)
+        return self._thread_pool
+    
+    async def _run_node(self, handler: Optional[NodeHandler], node_type: str, config: Dict, inputs: Dict, context: Dict, timeout: float):
+        if handler is None:
+            raise LookupError(f"No handler registered for node type {node_type}")
+        
+        semaphore = self._semaphore
+        if inspect.iscoroutinefunction(handler.fn):
+            async with semaphore:
+                return await asyncio.wait_for(handler.fn(config, inputs, context), timeout)
+        
+        # A thread or process cannot be interrupted, so a timed-out call keeps its concurrency
+        # slot until it really finishes rather than letting stragglers pile up past the bound
+        await semaphore.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            if handler.cpu_bound:
+                future = self._cpu_executor().submit(handler.fn, config, inputs, context)
+            else:
+                future = self._thread_executor().submit(contextvars.copy_context().run, handler.fn, config, inputs, context)
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(lambda _: release_from_thread(loop, semaphore))
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    
+    async def execute(self, plan: ExecutionPlan, payload: Dict = None, memoize: bool = True, scope: Any = None) -> Dict:
+        '''Run a compiled plan; returns per-node status, output and timing
+        
+        scope (e.g. the workflow id and owner) partitions the output cache: only runs with the
+        same scope can be answered from each other's outputs.
+        '''
+        
+        # The concurrency bound is per event loop; a semaphore cannot be shared across loops
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore, self._semaphore_loop = asyncio.Semaphore(self._max_concurrency), loop
+        cache = self.output_cache if memoize else None
+        context = {"payload": payload or {}}
+        payload_hash = NodeOutputCache.digest([scope, context["payload"]]) if cache else None
+        persisting = []
+        
+        count = len(plan.node_ids)
+        results = [None] * count
+        output_hashes = [None] * count
+        cache_keys = [None] * count
+        live_edges = [0] * count
+        pending_parents = [len(node_parents) for node_parents in plan.parents]
+        blocked = [False] * count
+        ready = deque(plan.roots)
+        running = {}
+        started = time.perf_counter()
+        
+        def edge_live(source, slot):
+            return not plan.is_condition[source] or slot == (0 if results[source]["output"] else 1)
+        
+        def launch(i):
+            found = False
+            live_parents = [source for source, slot in plan.parents[i]
+                            if results[source]["status"] == "succeeded" and edge_live(source, slot)]
+            if cache is not None:
+                key = NodeOutputCache.digest([plan.config_digests[i], payload_hash,
+                                              sorted((plan.node_ids[source], output_hashes[source]) for source in live_parents)])
+                cache_keys[i] = key
+                if plan.memoizable[i]:
+                    found, output = cache.lookup(key)
+                    if found:
+                        results[i] = {"status": "succeeded", "output": output, "cached": True}
+                        output_hashes[i] = key
+                        settle(i)
+                        return
+            inputs = {plan.node_ids[source]: results[source]["output"] for source in live_parents}
+            results[i] = {"status": "running", "started_ms": (time.perf_counter() - started) * 1000}
+            on_disk = cache is not None and plan.memoizable[i] and found is None
+            task = asyncio.create_task(load_or_run(i, inputs) if on_disk else
+                                       self._run_node(plan.handlers[i], plan.node_types[i], plan.configs[i], inputs, context, plan.timeouts[i]))
+            running[task] = i
+        
+        async def load_or_run(i, inputs):
+            '''Disk-tier lookup in a worker thread, falling back to running the node'''
+            found, output = await asyncio.to_thread(cache.load, cache_keys[i])
+            if found:
+                results[i]["cached"] = True
+                return output
+            return await self._run_node(plan.handlers[i], plan.node_types[i], plan.configs[i], inputs, context, plan.timeouts[i])
+        
+        def settle(i):
+            settling = [i]
+            while settling:
+                current = settling.pop()
+                succeeded = results[current]["status"] == "succeeded"
+                failed = results[current]["status"] in ("failed", "timed_out")
+                for target, slot in plan.children[current]:
+                    if succeeded and edge_live(current, slot):
+                        live_edges[target] += 1
+                    elif failed:
+                        blocked[target] = True
+                    pending_parents[target] -= 1
+                    if pending_parents[target] == 0:
+                        if live_edges[target] and not blocked[target]:
+                            ready.append(target)
+                        else:
+                            results[target] = {"status": "skipped"}
+                            settling.append(target)
+        
+        def record(i):
+            '''Cache a fresh output; outputs of uncached nodes are hashed by content for their children'''
+            if plan.memoizable[i]:
+                cache.remember(cache_keys[i], results[i]["output"])
+                if cache.directory and not results[i].get("cached"):
+                    persisting.append(asyncio.create_task(asyncio.to_thread(cache.persist, cache_keys[i], results[i]["output"])))
+                output_hashes[i] = cache_keys[i]
+            else:
+                output_hashes[i] = NodeOutputCache.digest([cache_keys[i], results[i]["output"]])
+        
+        while ready or running:
+            while ready:
+                launch(ready.popleft())
+            if not running:
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                i = running.pop(task)
+                result = results[i]
+                result["duration_ms"] = round((time.perf_counter() - started) * 1000 - result.pop("started_ms"), 3)
+                try:
+                    result["output"] = task.result()
+                    result["status"] = "succeeded"
+                    if cache is not None:
+                        record(i)
+                except asyncio.TimeoutError:
+                    result["status"] = "timed_out"
+                    result["error"] = "Node timed out"
+                except Exception as e:
+                    result["status"] = "failed"
+                    result["error"] = str(e)
+                settle(i)
+        if persisting:
+            await asyncio.gather(*persisting)
+        
+        finish = [0.0] * count
+        for i in range(count):
+            finish[i] = results[i].get("duration_ms", 0.0) + max((finish[source] for source, _ in plan.parents[i]), default=0.0)
+        
+        return {
+            "status": "succeeded" if all(result["status"] in ("succeeded", "skipped") for result in results) else "failed",
+            "nodes": dict(zip(plan.node_ids, results)),
+            "wall_ms": round((time.perf_counter() - started) * 1000, 3),
+            "critical_path_ms": round(max(finish, default=0.0), 3),
+            "total_node_ms": round(sum(result.get("duration_ms", 0.0) for result in results), 3),
+            "cached_nodes": sum(1 for result in results if result.get("cached"))
+        }
+
+def release_from_thread(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        pass  # the loop has closed, and its semaphore with it
+
+def merged_inputs(inputs: Dict) -> Dict:
+    merged = {}
+    for output in inputs.values():
+        if isinstance(output, dict):
+            merged.update(output)
+    return merged
+
+def default_node_handlers() -> Dict[str, NodeHandler]:
+    '''Built-in handlers: triggers emit the run payload, conditions test a field, other nodes pass data through'''
+    
+    def trigger(config, inputs, context):
+        return dict(context["payload"])
+    
+    def condition(config, inputs, context):
+        data = merged_inputs(inputs)
+        if "field" not in config:
+            return bool(data)
+        if "equals" in config:
+            return data.get(config["field"]) == config["equals"]
+        return bool(data.get(config["field"]))
+    
+    def passthrough(config, inputs, context):
+        return {**merged_inputs(inputs), **config.get("set", {})}
+    
+    return {
+        "trigger": NodeHandler(trigger, side_effects=False),
+        "action": NodeHandler(passthrough, side_effects=False),
+        "condition": NodeHandler(condition, side_effects=False),
+        "ai_generator": NodeHandler(passthrough, side_effects=False),
+        "k9x_optimizer": NodeHandler(passthrough, side_effects=False)
+    }
+
+def stub_node_handlers(delay_seconds: float = 0.0) -> Dict[str, NodeHandler]:
+    '''Offline handlers for tests and benchmarks: sleep stub_delay_seconds, record the inputs, return stub_result'''
+    
+    def make(node_type):
+        async def handler(config, inputs, context):
+            await asyncio.sleep(config.get("stub_delay_seconds", delay_seconds))
+            if config.get("stub_error"):
+                raise RuntimeError(config["stub_error"])
+            return config.get("stub_result", True if node_type == "condition" else {"node_type": node_type, "inputs": sorted(inputs)})
+        return NodeHandler(handler, side_effects=False)
+    
+    return {node_type: make(node_type) for node_type in AutoFlowConfig.WORKFLOW_NODE_TYPES}
+
+workflow_engine = WorkflowExecutionEngine(
+    default_node_handlers(),
+    max_concurrency=AutoFlowConfig.WORKFLOW_EXECUTION_MAX_CONCURRENCY,
+    node_timeout_seconds=AutoFlowConfig.WORKFLOW_EXECUTION_NODE_TIMEOUT_SECONDS,
+    cpu_pool=AutoFlowConfig.WORKFLOW_EXECUTION_CPU_POOL,
+    cpu_workers=AutoFlowConfig.WORKFLOW_EXECUTION_CPU_WORKERS,
+    output_cache=NodeOutputCache(
+        AutoFlowConfig.NODE_OUTPUT_CACHE_MAX_ENTRIES,
+        directory=AutoFlowConfig.NODE_OUTPUT_CACHE_DIR,
+        max_disk_entries=AutoFlowConfig.NODE_OUTPUT_CACHE_MAX_DISK_ENTRIES
+    )
+)
+
+# ============================================================================
+# CROSS-WORKER CACHE INVALIDATION
+# ============================================================================
+
+class LocalInvalidationBus:
+    '''Invalidation keys ("workflow:42") fanned out to the in-process caches subscribed to their prefix
+    
+    Every key carries a local generation, bumped on each invalidation. A cache that reads
+    generation(key) before loading and passes it back to put() never stores a value
+    that was invalidated while it was being loaded. This class alone is the single-node bus.
+    
+    Only the max_keys most recently invalidated keys keep their own generation; the others
+    read the floor, the highest generation dropped so far, so no key's generation ever
+    goes back to a value a load may have read before it was invalidated.
+    '''
+    
+    def __init__(self, max_keys: int = 100000):
+        self.subscribers: List[Tuple[str, Callable[[Optional[str]], None]]] = []
+        self.max_keys = max_keys
+        self.generations = OrderedDict()
+        self.floor = 0
+        self.published = 0
+        self.received = 0
+        self.resyncs = 0
+    
+    def subscribe(self, prefix: str, callback: Callable[[Optional[str]], None]):
+        '''callback(key) on each matching invalidation; callback(None) when everything must be dropped'''
+        self.subscribers.append((prefix, callback))
+    
+    def generation(self, key: str) -> int:
+        return self.generations.get(key, self.floor)
+    
+    def publish(self, key: str):
+        self.published += 1
+        self._apply(key)
+    
+    def _apply(self, key: str):
+        self.generations[key] = self.generations.get(key, self.floor) + 1
+        self.generations.move_to_end(key)
+        while len(self.generations) > self.max_keys:
+            _, dropped = self.generations.popitem(last=False)
+            self.floor = max(self.floor, dropped)
+        for prefix, callback in self.subscribers:
+            if key.startswith(prefix):
+                callback(key)
+    
+    def _resync(self):
+        self.resyncs += 1
+        self.floor += 1
+        for key in self.generations:
+            self.generations[key] += 1
+        for _, callback in self.subscribers:
+            callback(None)
+    
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        pass
+    
+    def stop(self):
+        pass
+    
+    def metrics(self) -> Dict:
+        return {
+            "backend": "local",
+            "published": self.published,
+            "received": self.received,
+            "resyncs": self.resyncs,
+            "subscribers": len(self.subscribers),
+            "tracked_keys": len(self.generations)
+        }
+
+class RedisInvalidationBus(LocalInvalidationBus):
+    '''Invalidation over Redis pub/sub between workers and replicas
+    
+    publish() applies the key locally at once and queues it; keys published within the
+    coalescing window go out as one message, each with a version from INCR so receivers
+    drop duplicates and out-of-order deliveries. A listener that (re)subscribes may have
+    missed messages, so it drops every subscribed cache; entries also expire on their
+    TTL, which bounds staleness if a message is lost outright.
+    '''
+    
+    def __init__(self, client: redis.Redis, channel: str, coalesce_seconds: float = 0.05, max_keys: int = 100000):
+        super().__init__(max_keys)
+        self.client = client
+        self.channel = channel
+        self.coalesce_seconds = coalesce_seconds
+        self.origin = uuid.uuid4().hex
+        # Forgetting a key's version only costs one redundant eviction if an old message is replayed
+        self.seen_versions = OrderedDict()
+        self.messages_sent = 0
+        self.publish_errors = 0
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._flush_timer = None
+        self._loop = None
+        self._stopping = threading.Event()
+        self._listener = None
+    
+    def publish(self, key: str):
+        super().publish(key)
+        with self._pending_lock:
+            self._pending.add(key)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.coalesce_seconds, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def flush(self):
+        with self._pending_lock:
+            keys, self._pending, self._flush_timer = sorted(self._pending), set(), None
+        if not keys:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipeline.incr(f"{self.channel}:version:{key}")
+            versions = pipeline.execute()
+            self.client.publish(self.channel, json.dumps({"origin": self.origin, "keys": dict(zip(keys, versions))}))
+            self.messages_sent += 1
+        except redis.RedisError:
+            # Other workers fall back to the TTL for these keys
+            self.publish_errors += 1
+    
+    def _on_message(self, data):
+        message = json.loads(data)
+        if message["origin"] == self.origin:
+            return
+        self.received += 1
+        for key, version in message["keys"].items():
+            if version > self.seen_versions.get(key, 0):
+                self.seen_versions[key] = version
+                self.seen_versions.move_to_end(key)
+                if len(self.seen_versions) > self.max_keys:
+                    self.seen_versions.popitem(last=False)
+                self._apply(key)
+    
+    def _dispatch(self, callback: Callable, *args):
+        # Caches are only touched from the event loop thread when one is running
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(callback, *args)
+        else:
+            callback(*args)
+    
+    def _listen(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            pubsub = self.client.pubsub()
+            try:
+                pubsub.subscribe(self.channel)
+                while not self._stopping.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    if message["type"] == "subscribe":
+                        # Anything published while we were not subscribed is lost
+                        self._dispatch(self._resync)
+                        backoff = 0.5
+                    elif message["type"] == "message":
+                        self._dispatch(self._on_message, message["data"])
+            except redis.RedisError:
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                pubsub.close()
+    
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop
+        if self._listener is None:
+            self._stopping.clear()
+            self._listener = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+            self._listener.start()
+    
+    def stop(self):
+        self._stopping.set()
+        self.flush()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+            self._listener = None
+    
+    def metrics(self) -> Dict:
+        return {**super().metrics(), "backend": "redis", "messages_sent": self.messages_sent, "publish_errors": self.publish_errors}
+
+class TTLCache:
+    '''LRU cache whose entries also expire, for in-process copies of database state
+    
+    The TTL is the fallback bound on staleness; invalidation normally evicts entries first.
+    '''
+    
+    def __init__(self, max_entries: int, ttl_seconds: float, bus: Optional[LocalInvalidationBus] = None, prefix: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.bus = bus
+        self.prefix = prefix
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if bus is not None:
+            bus.subscribe(prefix, self._on_invalidate)
+    
+    def get(self, key: Any) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def generation(self, key: Any) -> int:
+        return self.bus.generation(f"{self.prefix}{key}") if self.bus else 0
+    
+    def put(self, key: Any, value: Any, generation: Optional[int] = None):
+        '''Store a value; skipped when the key was invalidated after generation was read'''
+        
+        if generation is not None and generation != self.generation(key):
+            return
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, key: Any):
+        self.invalidations += 1
+        self.entries.pop(key, None)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def _on_invalidate(self, bus_key: Optional[str]):
+        if bus_key is None:
+            self.clear()
+            return
+        key = bus_key[len(self.prefix):]
+        self.invalidate(int(key) if key.isdigit() else key)
+    
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None
+        }
+
+def create_invalidation_bus() -> LocalInvalidationBus:
+    if AutoFlowConfig.CACHE_INVALIDATION_BACKEND == "redis":
+        return RedisInvalidationBus(
+            redis.Redis.from_url(AutoFlowConfig.REDIS_URL),
+            AutoFlowConfig.CACHE_INVALIDATION_CHANNEL,
+            AutoFlowConfig.CACHE_INVALIDATION_COALESCE_SECONDS,
+            AutoFlowConfig.CACHE_INVALIDATION_MAX_KEYS
+        )
+    return LocalInvalidationBus(AutoFlowConfig.CACHE_INVALIDATION_MAX_KEYS)
+
+invalidation_bus = create_invalidation_bus()
+
+# ReactFlow payloads of stored workflows, evicted on every worker when one of them saves
+reactflow_cache = TTLCache(
+    AutoFlowConfig.REACTFLOW_CACHE_MAX_ENTRIES,
+    AutoFlowConfig.CACHE_FALLBACK_TTL_SECONDS,
+    invalidation_bus,
+    prefix="workflow:"
+)
+
+def invalidate_workflow_plan(key: Optional[str]):
+    if key is None:
+        workflow_engine.plan_cache.clear()
+    else:
+        workflow_engine.plan_cache.invalidate(int(key.split(":", 1)[1]))
+
+invalidation_bus.subscribe("workflow:", invalidate_workflow_plan)
+invalidation_bus.subscribe("workflow:", similarity_service.on_invalidate)
+
+# ============================================================================
+# RESPONSE COMPRESSION
+# ============================================================================
+
+COMPRESSIBLE_CONTENT_TYPES = ("application/json", "application/x-ndjson", "application/msgpack", "text/")
+# Event streams are flushed event by event to a client that reads them as they arrive; an encoder would buffer them
+UNCOMPRESSED_CONTENT_TYPES = ("text/event-stream",)
+
+def accept_qualities(header: str) -> Dict[str, float]:
+    '''{token: q} of an Accept / Accept-Encoding header; tokens are lowercased and q defaults to 1'''
+    
+    offered = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            offered[name.strip().lower()] = quality
+    return offered
+
+def negotiate_encoding(accept_encoding: str, encodings: List[str]) -> Optional[str]:
+    '''First of our encodings the Accept-Encoding header allows (q > 0), or None for identity'''
+    
+    offered = accept_qualities(accept_encoding)
+    for encoding in encodings:
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def negotiate_media_type(accept: str, media_types: List[str], default: str = "application/json") -> str:
+    '''Highest-q of our media types the Accept header names (earlier ones win ties), else the default
+    
+    Wildcards are not matched, so only clients that ask for an alternative format by name get it.
+    '''
+    
+    offered = accept_qualities(accept)
+    named = [media_type for media_type in media_types if offered.get(media_type, 0.0) > 0]
+    return max(named, key=offered.get) if named else default
+
+class StreamCompressor:
+    '''Incremental compressor for streamed bodies; every chunk is flushed so NDJSON lines are not held back'''
+    
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = brotli.Compressor(quality=level)
+    
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.process(data) + self._compressor.flush()
+    
+    def finish(self) -> bytes:
+        return self._compressor.finish() if self.encoding == "br" else self._compressor.flush()
+
+class ResponseCompressor:
+    '''gzip / brotli / zstd encoders with per-encoding bytes-on-wire and CPU accounting'''
+    
+    def __init__(self, encodings: List[str], min_bytes: int, levels: Dict[str, int], precompressed_levels: Dict[str, int]):
+        self.encodings = [encoding for encoding in encodings if encoding != "br" or brotli is not None]
+        self.min_bytes = min_bytes
+        self.levels = levels
+        self.precompressed_levels = precompressed_levels
+        self.stats = {encoding: Counter() for encoding in self.encodings + ["identity"]}
+    
+    def negotiate(self, accept_encoding: str) -> Optional[str]:
+        return negotiate_encoding(accept_encoding, self.encodings)
+    
+    def compress(self, body: bytes, encoding: str, precompressed: bool = False) -> bytes:
+        level = (self.precompressed_levels if precompressed else self.levels)[encoding]
+        started = time.thread_time()
+        if encoding == "gzip":
+            data = zlib.compress(body, level, 31)
+        elif encoding == "zstd":
+            data = zstandard.ZstdCompressor(level=level).compress(body)
+        else:
+            data = brotli.compress(body, quality=level)
+        self.record(encoding, len(body), len(data), time.thread_time() - started)
+        return data
+    
+    def stream(self, encoding: str) -> StreamCompressor:
+        return StreamCompressor(encoding, self.levels[encoding])
+    
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, cpu_seconds: float = 0.0, responses: int = 1):
+        stats = self.stats[encoding]
+        stats["responses"] += responses
+        stats["bytes_in"] += bytes_in
+        stats["bytes_out"] += bytes_out
+        stats["cpu_us"] += int(cpu_seconds * 1e6)
+    
+    def record_precompressed_hit(self, encoding: str, bytes_in: int, bytes_out: int):
+        self.stats[encoding]["precompressed_hits"] += 1
+        self.record(encoding, bytes_in, bytes_out)
+    
+    def metrics(self) -> Dict:
+        return {
+            encoding: {
+                "responses": stats["responses"],
+                "precompressed_hits": stats["precompressed_hits"],
+                "bytes_in": stats["bytes_in"],
+                "bytes_out": stats["bytes_out"],
+                "ratio": round(stats["bytes_in"] / stats["bytes_out"], 2) if stats["bytes_out"] else None,
+                "cpu_us_per_response": round(stats["cpu_us"] / stats["responses"], 1) if stats["responses"] else None
+            }
+            for encoding, stats in self.stats.items()
+        }
+
+class ResponseCompressionMiddleware:
+    '''ASGI middleware compressing JSON/NDJSON/text responses per Accept-Encoding
+    
+    Single-body responses under min_bytes go out as they are; streamed bodies are
+    compressed chunk by chunk. Server-sent events and responses that already carry a
+    Content-Encoding (precompressed payloads) pass through untouched.
+    '''
+    
+    def __init__(self, app, compressor: "ResponseCompressor"):
+        self.app = app
+        self.compressor = compressor
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), "")
+        encoding = self.compressor.negotiate(accept_encoding)
+        start = None
+        stream = None
+        identity = False
+        
+        async def send_compressed(message):
+            nonlocal start, stream, identity
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if stream is False:
+                if identity:
+                    self.compressor.record("identity", len(body), len(body), responses=0 if more_body else 1)
+                await send(message)
+                return
+            if stream is None:
+                headers = MutableHeaders(raw=list(start["headers"]))
+                content_type = headers.get("content-type", "")
+                eligible = (
+                    encoding is not None
+                    and "content-encoding" not in headers
+                    and content_type.startswith(COMPRESSIBLE_CONTENT_TYPES)
+                    and not content_type.startswith(UNCOMPRESSED_CONTENT_TYPES)
+                    and (more_body or len(body) >= self.compressor.min_bytes)
+                )
+                if not eligible:
+                    stream = False
+                    identity = "content-encoding" not in headers
+                    if identity:
+                        self.compressor.record("identity", len(body), len(body), responses=0 if more_body else 1)
+                    await send(start)
+                    await send(message)
+                    return
+                
+                headers.add_vary_header("Accept-Encoding")
+                headers["content-encoding"] = encoding
+                if not more_body:
+                    if len(body) > 1 << 20:
+                        # Keep multi-megabyte bodies from stalling the event loop
+                        data = await asyncio.to_thread(self.compressor.compress, body, encoding)
+                    else:
+                        data = self.compressor.compress(body, encoding)
+                    headers["content-length"] = str(len(data))
+                    start["headers"] = headers.raw
+                    stream = False
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                del headers["content-length"]
+                start["headers"] = headers.raw
+                stream = self.compressor.stream(encoding)
+                await send(start)
+            
+            started = time.thread_time()
+            data = stream.chunk(body) if body else b""
+            if not more_body:
+                data += stream.finish()
+            self.compressor.record(encoding, len(body), len(data), time.thread_time() - started, responses=0 if more_body else 1)
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+        
+        await self.app(scope, receive, send_compressed)
+
+class CompressedVariants:
+    '''A cacheable payload serialized once per media type, with each compressed encoding made on first request
+    
+    Held in caches in place of the payload, so a cache hit costs neither serialization nor
+    compression; the variants are dropped with the entry when it is invalidated. JSON is
+    always available; serializers adds further media types, built the first time one is asked for.
+    '''
+    
+    def __init__(self, payload: Any, compressor: ResponseCompressor, serializers: Optional[Dict[str, Callable[[Any], bytes]]] = None):
+        self.payload = payload
+        self.compressor = compressor
+        self.serializers = serializers or {}
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+        self.bodies: Dict[str, bytes] = {"application/json": self.body}
+        self.variants: Dict[Tuple[str, str], bytes] = {}
+    
+    def ready(self, accept_encoding: str, media_type: str = "application/json") -> bool:
+        '''Whether response() can answer from what is already built, without serializing or compressing'''
+        
+        body = self.bodies.get(media_type)
+        if body is None:
+            return False
+        encoding = self.compressor.negotiate(accept_encoding)
+        return encoding is None or len(body) < self.compressor.min_bytes or (media_type, encoding) in self.variants
+    
+    def response(self, accept_encoding: str, media_type: str = "application/json") -> Response:
+        body = self.bodies.get(media_type)
+        if body is None:
+            body = self.bodies[media_type] = self.serializers[media_type](self.payload)
+        vary = "Accept, Accept-Encoding" if self.serializers else "Accept-Encoding"
+        
+        encoding = self.compressor.negotiate(accept_encoding)
+        if encoding is None or len(body) < self.compressor.min_bytes:
+            self.compressor.record("identity", len(body), len(body))
+            return Response(body, media_type=media_type, headers={"Vary": vary})
+        
+        data = self.variants.get((media_type, encoding))
+        if data is None:
+            data = self.variants[media_type, encoding] = self.compressor.compress(body, encoding, precompressed=True)
+        else:
+            self.compressor.record_precompressed_hit(encoding, len(body), len(data))
+        return Response(data, media_type=media_type, headers={"Content-Encoding": encoding, "Vary": vary})
+
+response_compressor = ResponseCompressor(
+    AutoFlowConfig.COMPRESSION_ENCODINGS,
+    AutoFlowConfig.COMPRESSION_MIN_BYTES,
+    AutoFlowConfig.COMPRESSION_LEVELS,
+    AutoFlowConfig.COMPRESSION_PRECOMPRESSED_LEVELS
+)
+
+# ============================================================================
+# SECTION 8: API ENDPOINTS AND ROUTES
+# ============================================================================
+
+@asynccontextmanager
+async def app_lifespan(app: FastAPI):
+    '''Run in-process generation workers for the lifetime of the server'''
+    
+    invalidation_bus.start(asyncio.get_running_loop())
+    worker = None
+    if AutoFlowConfig.GENERATION_JOB_WORKERS > 0:
+        worker = GenerationJobWorker(AutoFlowConfig.GENERATION_JOB_WORKERS)
+        worker_task = asyncio.create_task(worker.run())
+    yield
+    if worker is not None:
+        worker.stop()
+        await worker_task
+    invalidation_bus.stop()
+
+app = FastAPI(title="AutoFlow AI Platform", version="1.0.0", lifespan=app_lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(ResponseCompressionMiddleware, compressor=response_compressor)
+
+# Database session dependency
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=create_engine(AutoFlowConfig.DATABASE_URL))
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@app.exception_handler(LLMDispatcherOverloaded)
+async def llm_dispatcher_overloaded_handler(request, exc: LLMDispatcherOverloaded):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
+# AI Workflow Generation Endpoints
+@app.post("/api/workflows/generate")
+async def generate_workflow(request: Dict, db: Session = Depends(get_db)):
+    '''Generate workflow from natural language description'''
+    
+    user = db.query(User).filter(User.id == request["user_id"]).first()
+    
+    generator = AIWorkflowGenerator()
+    result = await generator.generate_workflow_from_description(
+        request["description"], 
+        request.get("context", {}),
+        tier=user.tier if user else "starter"
+    )
+    
+    if result["success"]:
+        # Convert to ReactFlow format
+        reactflow_data = generation_reactflow_data(result)
+        
+        # Save to database
+        workflow = Workflow(
+            user_id=request["user_id"],
+            name=request.get("name", "AI Generated Workflow"),
+            description=request["description"],
+            nodes=reactflow_data["nodes"],
+            connections=reactflow_data["edges"],
+            ai_generated=True
+        )
+        db.add(workflow)
+        db.flush()
+        sync_workflow_graph(db, [(workflow.id, workflow.nodes, workflow.connections)])
+        db.commit()
+        
+        return {
+            "workflow_id": workflow.id,
+            "reactflow_data": reactflow_data,
+            "source": result["source"],
+            "ai_confidence": result["ai_confidence"],
+            "suggestions": result["suggestions"]
+        }
+    
+    raise HTTPException(status_code=400, detail=result["error"])
+
+@app.post("/api/workflows/generate/batch")
+async def generate_workflows_batch(request: Dict, db: Session = Depends(get_db)):
+    '''Generate many workflows concurrently, streaming NDJSON results as each one completes'''
+    
+    items = request.get("items") or []
+    if not isinstance(items, list) or not items or len(items) > AutoFlowConfig.BATCH_GENERATION_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch must contain 1-{AutoFlowConfig.BATCH_GENERATION_MAX_ITEMS} items")
+    if not isinstance(request.get("user_id"), int):
+        raise HTTPException(status_code=400, detail="user_id must be an integer")
+    # Validated up front: once the 200 stream has started there is no way to report a bad request
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("description"), str) or not item["description"].strip():
+            raise HTTPException(status_code=400, detail=f"Item {index} needs a non-empty description")
+        if not isinstance(item.get("context", {}), dict) or not isinstance(item.get("name", ""), str):
+            raise HTTPException(status_code=400, detail=f"Item {index} has a malformed context or name")
+    
+    user = db.query(User).filter(User.id == request["user_id"]).first()
+    tier = user.tier if user else "starter"
+    generator = AIWorkflowGenerator()
+    semaphore = asyncio.Semaphore(AutoFlowConfig.BATCH_GENERATION_CONCURRENCY)
+    
+    async def generate_item(index: int, item: Dict):
+        # Any failure is this item's error line; it must not abort the stream and cancel the rest
+        try:
+            async with semaphore:
+                result = await generator.generate_workflow_from_description(
+                    item["description"],
+                    item.get("context", {}),
+                    tier=tier
+                )
+            if result["success"]:
+                result["reactflow_data"] = generation_reactflow_data(result)
+        except LLMDispatcherOverloaded as e:
+            result = {"success": False, "error": str(e)}
+        except Exception as e:
+            result = {"success": False, "error": f"{type(e).__name__}: {e}"}
+        return index, result
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(generate_item(index, item)) for index, item in enumerate(items)]
+        rows = {}
+        try:
+            for next_finished in asyncio.as_completed(tasks):
+                index, result = await next_finished
+                if not result["success"]:
+                    yield json.dumps({"index": index, "status": "error", "error": result["error"]}) + "\n"
+                    continue
+                
+                reactflow_data = result["reactflow_data"]
+                rows[index] = {
+                    "user_id": request["user_id"],
+                    "name": items[index].get("name", "AI Generated Workflow"),
+                    "description": items[index]["description"],
+                    "nodes": reactflow_data["nodes"],
+                    "connections": reactflow_data["edges"],
+                    "ai_generated": True
+                }
+                yield json.dumps({
+                    "index": index,
+                    "status": "generated",
+                    "reactflow_data": reactflow_data,
+                    "source": result["source"],
+                    "ai_confidence": result["ai_confidence"],
+                    "suggestions": result["suggestions"]
+                }) + "\n"
+        finally:
+            # Client went away mid-stream: stop paying for the remaining generations
+            for task in tasks:
+                task.cancel()
+        
+        # All rows go in as one multi-row INSERT inside a single transaction, off the event loop
+        def insert_rows() -> Dict[str, int]:
+            order = sorted(rows)
+            ids = db.scalars(
+                insert(Workflow).returning(Workflow.id, sort_by_parameter_order=True),
+                [rows[index] for index in order]
+            ).all()
+            sync_workflow_graph(db, [
+                (workflow_id, rows[index]["nodes"], rows[index]["connections"]) for index, workflow_id in zip(order, ids)
+            ])
+            db.commit()
+            return {str(index): workflow_id for index, workflow_id in zip(order, ids)}
+        
+        workflow_ids = await asyncio.to_thread(insert_rows) if rows else {}
+        
+        yield json.dumps({
+            "status": "complete",
+            "generated": len(rows),
+            "failed": len(items) - len(rows),
+            "workflow_ids": workflow_ids
+        }) + "\n"
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# Generation Job Endpoints
+@app.post("/api/workflows/generate/jobs", status_code=202)
+async def submit_generation_job(request: Dict, db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None)):
+    '''Queue a workflow generation and return its job id immediately'''
+    
+    # Validated here: a malformed request would otherwise be queued and fail every worker attempt
+    if not isinstance(request.get("user_id"), int):
+        raise HTTPException(status_code=400, detail="user_id must be an integer")
+    if not isinstance(request.get("description"), str) or not request["description"].strip():
+        raise HTTPException(status_code=400, detail="description must be a non-empty string")
+    if not isinstance(request.get("context", {}), dict) or not isinstance(request.get("name", ""), str):
+        raise HTTPException(status_code=400, detail="Malformed context or name")
+    
+    user = db.query(User).filter(User.id == request["user_id"]).first()
+    job = enqueue_generation_job(
+        db,
+        user_id=request["user_id"],
+        tier=user.tier if user else "starter",
+        request={key: request[key] for key in ("description", "name", "context") if key in request},
+        idempotency_key=idempotency_key or request.get("idempotency_key")
+    )
+    return {"job_id": job.id, "status": job.status}
+
+def generation_job_status(job: GenerationJob) -> Dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "workflow_id": job.workflow_id,
+        "result": job.result,
+        "error": job.error,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None
+    }
+
+@app.get("/api/workflows/generate/jobs/{job_id}")
+async def get_generation_job(job_id: str, db: Session = Depends(get_db)):
+    '''Poll a generation job'''
+    
+    job = db.get(GenerationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return generation_job_status(job)
+
+@app.get("/api/workflows/generate/jobs/{job_id}/events")
+async def stream_generation_job_events(job_id: str, db: Session = Depends(get_db)):
+    '''Server-sent events for a generation job, one per status change, ending at a terminal status'''
+    
+    if not db.get(GenerationJob, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        last_seen = None
+        while True:
+            db.expire_all()
+            job = db.get(GenerationJob, job_id)
+            if job is None:
+                # Deleted while the client was watching: end the stream on a terminal event
+                yield f"event: failed\ndata: {json.dumps({'job_id': job_id, 'status': 'failed', 'error': 'Job not found'})}\n\n"
+                return
+            status = generation_job_status(job)
+            if (status["status"], status["attempts"]) != last_seen:
+                last_seen = (status["status"], status["attempts"])
+                yield f"event: {status['status']}\ndata: {json.dumps(status)}\n\n"
+            if status["status"] in ("succeeded", "failed"):
+                return
+            db.rollback()
+            await asyncio.sleep(AutoFlowConfig.GENERATION_JOB_POLL_INTERVAL_SECONDS)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/workflows/generate/fast-path")
+async def get_template_fast_path_metrics():
+    '''Template fast-path hit rate and estimated latency saved'''
+    
+    return template_fast_path.metrics()
+
+template_listings: Dict[Optional[str], CompressedVariants] = {}
+
+@app.get("/api/templates")
+async def list_templates(request: Request, category: Optional[str] = None):
+    '''Canonical templates, optionally of one category; fixed for the life of the process, so served precompressed'''
+    
+    if category is not None and category not in TEMPLATE_CATEGORY_KEYWORDS:
+        raise HTTPException(status_code=400, detail=f"Unknown category; expected one of {', '.join(TEMPLATE_CATEGORY_KEYWORDS)}")
+    
+    def build() -> CompressedVariants:
+        template_library.load()
+        return CompressedVariants({
+            "templates": [
+                {
+                    "name": template["name"],
+                    "category": template["category"],
+                    "description": template["description"],
+                    "node_count": len(template["nodes"]),
+                    "path": template.get("path")
+                }
+                for template in template_library.templates if category is None or template["category"] == category
+            ]
+        }, response_compressor)
+    
+    listing = template_listings.get(category)
+    if listing is None:
+        listing = template_listings[category] = await asyncio.to_thread(build)
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if listing.ready(accept_encoding):
+        return listing.response(accept_encoding)
+    # The first request per encoding compresses the whole listing at the precompression level
+    return await asyncio.to_thread(listing.response, accept_encoding)
+
+@app.get("/api/templates/variants")
+async def get_template_variants():
+    '''Near-duplicate groups found in the template corpus'''
+    
+    await asyncio.to_thread(template_library.load)
+    groups = template_library.variants.variant_groups() if template_library.variants else []
+    return {
+        "templates": len(template_library.templates),
+        "variants": sum(len(group["variants"]) for group in groups),
+        "groups": groups
+    }
+
+@app.post("/api/templates/check-duplicate")
+async def check_template_duplicate(template: Dict):
+    '''Ingest check: the canonical template an n8n export is a near-copy of, if any
+    
+    Read-only: the export is compared against the corpus on disk but not added to it, so
+    checking the same new template twice reports no duplicate both times.
+    '''
+    
+    error = N8NTemplateCorpus.structure_error(template)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await asyncio.to_thread(template_library.load)
+    if not template_library.variants:
+        return {"duplicate": False}
+    match = template_library.variants.find_variant(template)
+    if match is None:
+        return {"duplicate": False}
+    return {"duplicate": True, "canonical": {"name": match["name"], "category": match["category"], "path": match.get("path")}}
+
+@app.post("/api/templates/classify")
+async def classify_template(template: Dict):
+    '''Ingest classification: the category an n8n export belongs to, from its nodes, names and sticky notes'''
+    
+    error = N8NTemplateCorpus.structure_error(template)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    await asyncio.to_thread(template_library.load)
+    template = N8NTemplateCorpus.parse_template(json.dumps(template))
+    category, score = template_library.classifier.classify_one(template)
+    return {"category": category, "score": score}
+
+@app.get("/api/workflows/generate/prompts")
+async def get_generation_prompt_metrics():
+    '''Prompt size, adaptive max_tokens and output token usage of grounded generations'''
+    
+    return generation_prompt_builder.metrics()
+
+@app.get("/api/workflows/generate/repairs")
+async def get_generation_repair_metrics():
+    '''How model output was recovered: clean, locally repaired, tail continuation or full retry'''
+    
+    return workflow_json_repair.metrics()
+
+@app.get("/api/llm/dispatcher")
+async def get_llm_dispatcher_metrics():
+    '''Queue depth, in-flight calls and rate budgets of the LLM dispatcher'''
+    
+    return llm_dispatcher.metrics()
+
+@app.get("/api/llm/providers")
+async def get_llm_provider_metrics():
+    '''Rolling latency/error EWMAs, health and hedge deadlines per LLM backend'''
+    
+    return provider_router.metrics()
+
+# K9X Optimization Endpoints
+@app.post("/api/k9x/conversation/start")
+async def start_k9x_conversation(request: Dict):
+    '''Start K9X Quantum Prompt Strategist conversation'''
+    
+    optimizer = K9XQuantumOptimizer()
+    result = await optimizer.start_conversation(
+        request["user_id"], 
+        request["initial_request"]
+    )
+    
+    return result
+
+@app.post("/api/k9x/conversation/continue")
+async def continue_k9x_conversation(request: Dict):
+    '''Continue K9X conversation with user responses'''
+    
+    optimizer = K9XQuantumOptimizer()
+    session_id = request["session_id"]
+    lease_token = await K9XLiveSession.acquire(optimizer.memory_store, session_id, AutoFlowConfig.K9X_SESSION_LEASE_SECONDS)
+    if lease_token is None:
+        raise HTTPException(status_code=409, detail="Conversation session is open on another connection")
+    try:
+        result = await optimizer.continue_conversation(
+            session_id,
+            request["responses"],
+            lease_token
+        )
+    finally:
+        await K9XLiveSession.release(optimizer.memory_store, session_id, lease_token)
+    
+    return result
+
+@app.websocket("/ws/k9x/conversation")
+async def k9x_conversation_socket(websocket: WebSocket):
+    '''K9X conversation over one connection, with the session state held in this worker
+    
+    The first message is {"user_id", "initial_request"} to start, or {"session_id"} to resume;
+    each later message is {"responses": {...}}. Follow-up questions stream as
+    {"type": "question"} events before the {"type": "turn"} result.
+    '''
+    
+    await websocket.accept()
+    optimizer = K9XQuantumOptimizer()
+    
+    async def reject(detail: str, code: int):
+        await websocket.send_json({"type": "error", "detail": detail})
+        await websocket.close(code=code)
+    
+    checkpoint_interval = AutoFlowConfig.K9X_CHECKPOINT_INTERVAL_SECONDS
+    lease_seconds = K9XLiveSession.lease_seconds_for(checkpoint_interval)
+    lease = None  # (session_id, token) of a lease taken here and not yet handed over to a K9XLiveSession
+    try:
+        try:
+            opening = await websocket.receive_json()
+        except (ValueError, KeyError):
+            return await reject("Opening message must be JSON", 4400)
+        if not isinstance(opening, dict):
+            return await reject("Opening message must be an object", 4400)
+        if opening.get("session_id"):
+            if not isinstance(opening["session_id"], str):
+                return await reject("session_id must be a string", 4400)
+            # Leased before loading, so no other writer can store a newer state in between
+            lease_token = await K9XLiveSession.acquire(optimizer.memory_store, opening["session_id"], lease_seconds)
+            if lease_token is None:
+                return await reject("Conversation session is open on another connection", 4409)
+            lease = (opening["session_id"], lease_token)
+            try:
+                conversation_state = await optimizer._load_conversation_state(opening["session_id"])
+            except HTTPException as e:
+                return await reject(e.detail, 4404)
+        elif isinstance(opening.get("user_id"), int) and isinstance(opening.get("initial_request"), str):
+            conversation_state = await optimizer.new_conversation_state(opening["user_id"], opening["initial_request"])
+            lease_token = await K9XLiveSession.acquire(optimizer.memory_store, conversation_state["session_id"], lease_seconds)
+            if lease_token is None:
+                return await reject("Conversation session is open on another connection", 4409)
+            lease = (conversation_state["session_id"], lease_token)
+        else:
+            return await reject("Opening message needs session_id, or user_id and initial_request", 4400)
+        
+        async with K9XLiveSession(optimizer, conversation_state, checkpoint_interval, lease_token) as session:
+            # From here the session releases the lease with its final write
+            lease = None
+            if not opening.get("session_id"):
+                session.mark_dirty()
+            await websocket.send_json({
+                "type": "session",
+                "session_id": session.session_id,
+                "questions": conversation_state["questions"],
+                "stage": conversation_state["stage"]
+            })
+            while True:
+                try:
+                    message = await websocket.receive_json()
+                except (ValueError, KeyError):
+                    message = None
+                if session.lease_lost:
+                    # Another writer owns the session now; turns here could no longer be saved
+                    return await reject("Conversation session was taken over by another connection", 4409)
+                if not isinstance(message, dict) or not isinstance(message.get("responses", {}), dict):
+                    await websocket.send_json({"type": "error", "detail": 'Each turn must be {"responses": {...}}'})
+                    continue
+                async for event in session.turn(message.get("responses") or {}):
+                    await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if lease is not None:
+            await asyncio.shield(K9XLiveSession.release(optimizer.memory_store, *lease))
+
+@app.get("/api/k9x/sessions/metrics")
+async def get_k9x_session_metrics():
+    '''Live WebSocket sessions, turns served from memory and write-behind checkpoints'''
+    
+    return {**K9XLiveSession.metrics_snapshot(), "store": k9x_session_store.metrics()}
+
+# ReactFlow Integration Endpoints
+def encode_workflow_cursor(workflow: Workflow) -> str:
+    return base64.urlsafe_b64encode(json.dumps([workflow.updated_at.isoformat(), workflow.id]).encode()).decode()
+
+def decode_workflow_cursor(cursor: str):
+    try:
+        updated_at, workflow_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(workflow_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/users/{user_id}/workflows")
+async def list_user_workflows(user_id: int, limit: int = AutoFlowConfig.WORKFLOW_LIST_DEFAULT_LIMIT,
+                              cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    '''A user's workflows, most recently updated first
+    
+    Keyset pagination on (user_id, updated_at, id): each page seeks past the last row of
+    the previous one through ix_workflows_user_updated, so page cost does not grow with
+    the page number. Only summary columns are loaded; nodes/connections stay in the table.
+    '''
+    
+    limit = max(1, min(limit, AutoFlowConfig.WORKFLOW_LIST_MAX_LIMIT))
+    query = db.query(Workflow).options(load_only(
+        Workflow.id, Workflow.name, Workflow.description, Workflow.ai_generated,
+        Workflow.k9x_optimized, Workflow.created_at, Workflow.updated_at
+    )).filter(Workflow.user_id == user_id)
+    if cursor:
+        updated_at, workflow_id = decode_workflow_cursor(cursor)
+        query = query.filter(or_(
+            Workflow.updated_at < updated_at,
+            and_(Workflow.updated_at == updated_at, Workflow.id < workflow_id)
+        ))
+    rows = query.order_by(Workflow.updated_at.desc(), Workflow.id.desc()).limit(limit + 1).all()
+    
+    page = rows[:limit]
+    return {
+        "workflows": [
+            {
+                "id": workflow.id,
+                "name": workflow.name,
+                "description": workflow.description,
+                "ai_generated": workflow.ai_generated,
+                "k9x_optimized": workflow.k9x_optimized,
+                "created_at": workflow.created_at,
+                "updated_at": workflow.updated_at
+            }
+            for workflow in page
+        ],
+        "next_cursor": encode_workflow_cursor(page[-1]) if len(rows) > limit else None
+    }
+
+WORKFLOW_EXPORT_COLUMNS = (
+    Workflow.id, Workflow.name, Workflow.description, Workflow.nodes, Workflow.connections,
+    Workflow.ai_generated, Workflow.k9x_optimized, Workflow.created_at, Workflow.updated_at
+)
+
+def workflow_export_line(row) -> str:
+    return json.dumps({
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "nodes": row.nodes,
+        "edges": row.connections,
+        "ai_generated": row.ai_generated,
+        "k9x_optimized": row.k9x_optimized,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None
+    }) + "\n"
+
+def workflow_import_row(user_id: int, record: Dict) -> Dict:
+    '''Workflows row for one exported record; raises ValueError when the record is not a workflow'''
+    
+    if not isinstance(record, dict) or not isinstance(record.get("nodes"), list):
+        raise ValueError("record needs a nodes list")
+    nodes = record["nodes"]
+    edges = record.get("edges", record.get("connections"))
+    edges = [] if edges is None else edges
+    # Checked here, not at INSERT or graph sync time, where one bad record would fail its whole batch
+    if not isinstance(edges, list) or not all(isinstance(item, dict) for item in nodes + edges):
+        raise ValueError("nodes and edges must be lists of objects")
+    if not all(isinstance(item.get(key), (dict, type(None))) for item in nodes + edges for key in ("data", "position")):
+        raise ValueError("data and position must be objects")
+    if not all(isinstance(node.get("id"), str) for node in nodes):
+        raise ValueError("every node needs a string id")
+    if not all(isinstance(record.get(key), (str, type(None))) for key in ("name", "description")):
+        raise ValueError("name and description must be strings")
+    now = datetime.utcnow()
+    return {
+        "user_id": user_id,
+        "name": record.get("name"),
+        "description": record.get("description"),
+        "nodes": nodes,
+        "connections": edges,
+        "ai_generated": bool(record.get("ai_generated")),
+        "k9x_optimized": bool(record.get("k9x_optimized")),
+        "created_at": datetime.fromisoformat(record["created_at"]) if record.get("created_at") else now,
+        "updated_at": datetime.fromisoformat(record["updated_at"]) if record.get("updated_at") else now
+    }
+
+@app.get("/api/workflows/export")
+async def export_workflows(user_id: int, db: Session = Depends(get_db)):
+    '''All of a user's workflows as NDJSON, one workflow per line, in id order
+    
+    Rows come from a server-side cursor a batch at a time and are written out as they
+    are decoded, so memory stays flat however many workflows the user has.
+    '''
+    
+    def lines():
+        result = db.execute(
+            select(*WORKFLOW_EXPORT_COLUMNS).where(Workflow.user_id == user_id).order_by(Workflow.id)
+            .execution_options(stream_results=True, yield_per=AutoFlowConfig.WORKFLOW_EXPORT_BATCH_SIZE)
+        )
+        for partition in result.partitions():
+            yield "".join(workflow_export_line(row) for row in partition)
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="workflows-user-{user_id}.ndjson"'}
+    )
+
+@app.post("/api/workflows/import")
+async def import_workflows(user_id: int, request: Request, db: Session = Depends(get_db)):
+    '''Load NDJSON (as written by /api/workflows/export) into a user's workflows
+    
+    The body is parsed line by line as it arrives. Rows go in as multi-row INSERTs of
+    WORKFLOW_IMPORT_BATCH_SIZE with a commit every WORKFLOW_IMPORT_COMMIT_ROWS, so a
+    failure part-way keeps what was committed; bad lines are skipped and reported.
+    '''
+    
+    batch, errors = [], []
+    counts = Counter()
+    
+    def insert_batch(rows: List[Dict], commit: bool):
+        ids = db.scalars(insert(Workflow).returning(Workflow.id, sort_by_parameter_order=True), rows).all()
+        sync_workflow_graph(db, [(workflow_id, row["nodes"], row["connections"]) for workflow_id, row in zip(ids, rows)])
+        if commit:
+            db.commit()
+    
+    async def flush(final: bool = False):
+        if batch:
+            counts["imported"] += len(batch)
+            commit = final or counts["imported"] - counts["committed"] >= AutoFlowConfig.WORKFLOW_IMPORT_COMMIT_ROWS
+            await asyncio.to_thread(insert_batch, batch[:], commit)
+            if commit:
+                counts["committed"] = counts["imported"]
+            batch.clear()
+        elif final:
+            await asyncio.to_thread(db.commit)
+    
+    async def reject_long_line(number: int):
+        await flush(final=True)
+        raise HTTPException(status_code=413, detail=f"Line {number} exceeds {AutoFlowConfig.WORKFLOW_IMPORT_MAX_LINE_BYTES} bytes; {counts['imported']} workflows were imported")
+    
+    async def take(line: bytes):
+        counts["lines"] += 1
+        if len(line) > AutoFlowConfig.WORKFLOW_IMPORT_MAX_LINE_BYTES:
+            await reject_long_line(counts["lines"])
+        if not line.strip():
+            return
+        try:
+            batch.append(workflow_import_row(user_id, json.loads(line)))
+        except (ValueError, TypeError, KeyError) as e:
+            counts["failed"] += 1
+            if len(errors) < 20:
+                errors.append({"line": counts["lines"], "error": str(e)})
+            return
+        if len(batch) >= AutoFlowConfig.WORKFLOW_IMPORT_BATCH_SIZE:
+            await flush()
     
-    raise HTTPException(status_code=400, detail=result["error"])
+    # Pieces of the current, unterminated line; joined once when its newline arrives
+    pending, pending_bytes = [], 0
+    async for chunk in request.stream():
+        if b"\n" in chunk:
+            head, *lines, tail = chunk.split(b"\n")
+            await take(b"".join(pending) + head)
+            for line in lines:
+                await take(line)
+            pending, pending_bytes = [tail], len(tail)
+        else:
+            pending.append(chunk)
+            pending_bytes += len(chunk)
+        if pending_bytes > AutoFlowConfig.WORKFLOW_IMPORT_MAX_LINE_BYTES:
+            await reject_long_line(counts["lines"] + 1)
+    await take(b"".join(pending))
+    await flush(final=True)
+    
+    return {"imported": counts["imported"], "failed": counts["failed"], "errors": errors}
 
-# K9X Optimization Endpoints
-@app.post("/api/k9x/conversation/start")
-async def start_k9x_conversation(request: Dict):
-    '''Start K9X Quantum Prompt Strategist conversation'''
+@app.get("/api/workflows/search/by-node-type")
+async def search_workflows_by_node_type(node_type: Optional[str] = None, n8n_type: Optional[str] = None,
+                                        user_id: Optional[int] = None, limit: int = AutoFlowConfig.WORKFLOW_LIST_DEFAULT_LIMIT,
+                                        db: Session = Depends(get_db)):
+    '''Workflows containing a node of the given type, answered from workflow_nodes'''
     
-    optimizer = K9XQuantumOptimizer()
-    result = await optimizer.start_conversation(
-        request["user_id"], 
-        request["initial_request"]
-    )
+    if not node_type and not n8n_type:
+        raise HTTPException(status_code=400, detail="node_type or n8n_type is required")
     
-    return result
+    matches = select(WorkflowNode.workflow_id, func.count().label("matching_nodes")).group_by(WorkflowNode.workflow_id)
+    if node_type:
+        matches = matches.where(WorkflowNode.node_type == node_type)
+    if n8n_type:
+        matches = matches.where(WorkflowNode.n8n_type == n8n_type)
+    matches = matches.subquery()
+    query = select(Workflow.id, Workflow.user_id, Workflow.name, matches.c.matching_nodes) \
+        .join(matches, matches.c.workflow_id == Workflow.id) \
+        .order_by(Workflow.id.desc()) \
+        .limit(max(1, min(limit, AutoFlowConfig.WORKFLOW_LIST_MAX_LIMIT)))
+    if user_id is not None:
+        query = query.where(Workflow.user_id == user_id)
+    
+    return {"workflows": [dict(row._mapping) for row in db.execute(query)]}
 
-@app.post("/api/k9x/conversation/continue")
-async def continue_k9x_conversation(request: Dict):
-    '''Continue K9X conversation with user responses'''
+@app.get("/api/analytics/node-types")
+async def node_type_usage(user_id: Optional[int] = None, db: Session = Depends(get_db)):
+    '''Node counts per type, and how many workflows use each type'''
     
-    optimizer = K9XQuantumOptimizer()
-    result = await optimizer.continue_conversation(
-        request["session_id"],
-        request["responses"]
-    )
+    query = select(
+        WorkflowNode.node_type,
+        func.count().label("nodes"),
+        func.count(func.distinct(WorkflowNode.workflow_id)).label("workflows")
+    ).group_by(WorkflowNode.node_type).order_by(func.count().desc())
+    if user_id is not None:
+        query = query.join(Workflow, Workflow.id == WorkflowNode.workflow_id).where(Workflow.user_id == user_id)
     
-    return result
+    return {"node_types": [dict(row._mapping) for row in db.execute(query)]}
+
+@app.get("/api/workflows/{workflow_id}/similar")
+async def get_similar_workflows(workflow_id: int, limit: int = AutoFlowConfig.SIMILAR_RESULTS_LIMIT, db: Session = Depends(get_db)):
+    '''Templates and the same user's workflows closest to this workflow by node types, names and description'''
+    
+    workflow = db.query(Workflow).options(load_only(
+        Workflow.id, Workflow.user_id, Workflow.name, Workflow.description
+    )).filter(Workflow.id == workflow_id).first()
+    if not workflow:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    
+    if similarity_service.templates is None:
+        await asyncio.to_thread(similarity_service.load)
+    limit = max(1, min(limit, AutoFlowConfig.WORKFLOW_LIST_MAX_LIMIT))
+    # A user's first lookup reads and embeds every workflow they own, so it stays off the event loop
+    return {"workflow_id": workflow_id, **await asyncio.to_thread(similarity_service.similar, db, workflow, limit)}
 
-# ReactFlow Integration Endpoints
 @app.get("/api/workflows/{workflow_id}/reactflow")
-async def get_workflow_reactflow_data(workflow_id: int, db: Session = Depends(get_db)):
+async def get_workflow_reactflow_data(workflow_id: int, request: Request, db: Session = Depends(get_db)):
     '''Get workflow in ReactFlow format'''
     
+    accept_encoding = request.headers.get("accept-encoding", "")
+    media_type = negotiate_media_type(request.headers.get("accept", ""), REACTFLOW_MEDIA_TYPES)
+    cached = reactflow_cache.get(workflow_id)
+    if cached is not None:
+        return cached.response(accept_encoding, media_type)
+    
+    generation = reactflow_cache.generation(workflow_id)
     workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    return {
+    payload = {
         "nodes": workflow.nodes,
         "edges": workflow.connections,
         "metadata": {
@@ -375,25 +5031,76 @@ async def get_workflow_reactflow_data(workflow_id: int, db: Session = Depends(ge
             "k9x_optimized": workflow.k9x_optimized
         }
     }
+    # The saved version is immutable until the next save evicts it, so its compressed forms are cached with it
+    cached = CompressedVariants(payload, response_compressor, REACTFLOW_SERIALIZERS)
+    reactflow_cache.put(workflow_id, cached, generation)
+    return cached.response(accept_encoding, media_type)
+
+@app.get("/api/cache/metrics")
+async def get_cache_metrics():
+    '''In-process cache hit rates and cross-worker invalidation traffic'''
+    
+    return {"invalidation": invalidation_bus.metrics(), "reactflow": reactflow_cache.metrics(), "compression": response_compressor.metrics()}
 
 @app.post("/api/workflows/{workflow_id}/save-reactflow")
-async def save_reactflow_workflow(workflow_id: int, reactflow_data: Dict, db: Session = Depends(get_db)):
-    '''Save ReactFlow workflow changes'''
+async def save_reactflow_workflow(workflow_id: int, request: Request, db: Session = Depends(get_db)):
+    '''Save ReactFlow workflow changes, sent as JSON or as columnar application/msgpack'''
+    
+    body = await request.body()
+    content_type = request.headers.get("content-type", "application/json").split(";", 1)[0].strip().lower()
+    try:
+        if content_type == "application/msgpack" and msgpack is not None:
+            reactflow_data = ReactFlowColumnarCodec.unpack(body)
+        elif content_type == "application/json":
+            reactflow_data = json.loads(body)
+        else:
+            raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+        nodes, edges = reactflow_data["nodes"], reactflow_data["edges"]
+        if type(nodes) is not list or type(edges) is not list or not all(type(item) is dict for item in nodes + edges):
+            raise ValueError("nodes and edges must be lists of objects")
+        if not all(type(item.get(key)) in (dict, type(None)) for item in nodes + edges for key in ("data", "position")):
+            raise ValueError("data and position must be objects")
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed ReactFlow payload: {e}")
     
     workflow = db.query(Workflow).filter(Workflow.id == workflow_id).first()
     if not workflow:
         raise HTTPException(status_code=404, detail="Workflow not found")
     
-    workflow.nodes = reactflow_data["nodes"]
-    workflow.connections = reactflow_data["edges"]
+    workflow.nodes = nodes
+    workflow.connections = edges
     workflow.updated_at = datetime.utcnow()
+    sync_workflow_graph(db, [(workflow_id, workflow.nodes, workflow.connections)])
     
     db.commit()
+    invalidation_bus.publish(f"workflow:{workflow_id}")
     
     return {"success": True, "message": "Workflow saved successfully"}
 
+@app.post("/api/workflows/{workflow_id}/execute")
+async def execute_workflow(workflow_id: int, payload: Optional[Dict] = None, memoize: bool = True, db: Session = Depends(get_db)):
+    '''Run a stored workflow once; the payload is what its trigger nodes emit
+    
+    With memoize (the default) unchanged nodes are answered from the node output cache.
+    '''
+    
+    version = db.query(Workflow.updated_at, Workflow.user_id).filter(Workflow.id == workflow_id).first()
+    if not version:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    
+    def load():
+        workflow = db.query(Workflow.nodes, Workflow.connections).filter(Workflow.id == workflow_id).first()
+        return workflow.nodes or [], workflow.connections or []
+    
+    try:
+        plan = workflow_engine.plan_for(workflow_id, version.updated_at, load)
+    except WorkflowCycleError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return {"workflow_id": workflow_id, **await workflow_engine.execute(plan, payload, memoize=memoize, scope=[version.user_id, workflow_id])}
+
 # ============================================================================
-# SECTION 7: FRONTEND REACT COMPONENTS SPECIFICATIONS
+# SECTION 9: FRONTEND REACT COMPONENTS SPECIFICATIONS
 # ============================================================================
 
 REACT_COMPONENTS_CONFIG = {
@@ -427,7 +5134,7 @@ REACT_COMPONENTS_CONFIG = {
 }
 
 # ============================================================================
-# SECTION 8: DEPLOYMENT AND INFRASTRUCTURE
+# SECTION 10: DEPLOYMENT AND INFRASTRUCTURE
 # ============================================================================
 
 DEPLOYMENT_CONFIG = {
@@ -462,7 +5169,7 @@ DEPLOYMENT_CONFIG = {
 }
 
 # ============================================================================
-# SECTION 9: ANALYTICS AND MONITORING
+# SECTION 11: ANALYTICS AND MONITORING
 # ============================================================================
 
 class AnalyticsTracker:
@@ -483,8 +5190,220 @@ class AnalyticsTracker:
         '''Track demo platform engagement'''
         pass
 
+# Sampling profiler: collapsed stacks ("root;caller;leaf count") load directly
+# into flamegraph.pl, speedscope or inferno.
+
+_SAMPLER_THREAD_IDS = set()
+
+def collapse_stack(frame) -> str:
+    '''Render a frame chain as a single collapsed-stack line, root first'''
+
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+class StackSampler:
+    '''Background thread that samples interpreter stacks at a fixed interval'''
+
+    def __init__(self, interval_ms: float, thread_id: Optional[int] = None, task: Optional[asyncio.Task] = None):
+        self.interval = interval_ms / 1000
+        self.thread_id = thread_id
+        self.task = task
+        self.loop = task.get_loop() if task else None
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="autoflow-profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self._thread.join()
+        return self.snapshot()
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.stacks)
+
+    def _run(self):
+        _SAMPLER_THREAD_IDS.add(threading.get_ident())
+        try:
+            while not self._stop_event.wait(self.interval):
+                self._sample(sys._current_frames())
+        finally:
+            _SAMPLER_THREAD_IDS.discard(threading.get_ident())
+
+    def _sample(self, frames: Dict):
+        if self.thread_id is None:
+            stacks = [collapse_stack(frame) for ident, frame in frames.items() if ident not in _SAMPLER_THREAD_IDS]
+        else:
+            frame = frames.get(self.thread_id)
+            # The event loop thread interleaves many requests; only count samples
+            # taken while the profiled request's task is the one running
+            if frame is None or (self.task is not None and asyncio.current_task(self.loop) is not self.task):
+                return
+            stacks = [collapse_stack(frame)]
+
+        with self._lock:
+            self.stacks.update(stacks)
+            self.sample_count += 1
+
+class ProfileRing:
+    '''Bounded on-disk ring of per-request collapsed-stack profiles'''
+
+    PROFILE_ID_PATTERN = re.compile(r"^[0-9]+_[0-9a-f]{8}$")
+
+    def __init__(self, directory: str, capacity: int):
+        self.directory = directory
+        self.capacity = capacity
+
+    @staticmethod
+    def new_profile_id() -> str:
+        return f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+
+    def write(self, profile_id: str, metadata: Dict, stacks: Counter):
+        os.makedirs(self.directory, exist_ok=True)
+
+        with open(os.path.join(self.directory, f"{profile_id}.folded"), "w") as folded:
+            for stack, count in stacks.most_common():
+                folded.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, f"{profile_id}.json"), "w") as meta:
+            json.dump({"profile_id": profile_id, **metadata}, meta)
+
+        for stale_id in self._profile_ids()[:-self.capacity]:
+            for suffix in (".folded", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, stale_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        profiles = []
+        for profile_id in reversed(self._profile_ids()):
+            try:
+                with open(os.path.join(self.directory, f"{profile_id}.json")) as meta:
+                    profiles.append(json.load(meta))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return profiles
+
+    def read(self, profile_id: str) -> Optional[str]:
+        if not self.PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.folded")) as folded:
+                return folded.read()
+        except FileNotFoundError:
+            return None
+
+    def _profile_ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        ids = [name[:-len(".folded")] for name in os.listdir(self.directory) if name.endswith(".folded")]
+        return sorted(ids, key=lambda profile_id: int(profile_id.split("_")[0]))
+
+class RequestProfilingMiddleware:
+    '''ASGI middleware that samples the request coroutine when opted in by header or config'''
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = ProfileRing.new_profile_id()
+        sampler = StackSampler(
+            AutoFlowConfig.PROFILING_INTERVAL_MS,
+            thread_id=threading.get_ident(),
+            task=asyncio.current_task()
+        ).start()
+        started = time.perf_counter()
+        status = {"code": None}
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-autoflow-profile-id", profile_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            stacks = await asyncio.to_thread(sampler.stop)
+            await asyncio.to_thread(profile_ring.write, profile_id, {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status_code": status["code"],
+                "duration_ms": round(duration_ms, 2),
+                "samples": sampler.sample_count,
+                "interval_ms": AutoFlowConfig.PROFILING_INTERVAL_MS,
+                "created_at": datetime.utcnow().isoformat()
+            }, stacks)
+
+    @staticmethod
+    def _should_profile(scope) -> bool:
+        if scope["path"].startswith("/debug/"):
+            return False
+        if AutoFlowConfig.PROFILE_ALL_REQUESTS:
+            return True
+        if not AutoFlowConfig.PROFILING_ENABLED:
+            return False
+        header = AutoFlowConfig.PROFILING_HEADER.lower().encode()
+        return any(name == header and value not in (b"", b"0", b"false") for name, value in scope.get("headers", []))
+
+profile_ring = ProfileRing(AutoFlowConfig.PROFILING_DIR, AutoFlowConfig.PROFILING_RING_SIZE)
+global_profiler: Optional[StackSampler] = None
+
+def start_global_profiler() -> StackSampler:
+    '''Start continuous low-rate sampling of every thread in the worker'''
+    global global_profiler
+    if global_profiler is None:
+        global_profiler = StackSampler(AutoFlowConfig.GLOBAL_PROFILING_INTERVAL_MS).start()
+    return global_profiler
+
+app.add_middleware(RequestProfilingMiddleware)
+
+# Profiling Endpoints
+@app.get("/debug/profiles")
+async def list_profiles():
+    '''List recorded per-request profiles, newest first'''
+
+    return {
+        "profiles": await asyncio.to_thread(profile_ring.list),
+        "global_profiling": global_profiler is not None
+    }
+
+@app.get("/debug/profiles/global", response_class=PlainTextResponse)
+async def get_global_profile():
+    '''Get the continuously aggregated profile as collapsed stacks'''
+
+    if global_profiler is None:
+        raise HTTPException(status_code=404, detail="Global profiling is not enabled")
+
+    stacks = global_profiler.snapshot()
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str):
+    '''Get a recorded profile as collapsed stacks'''
+
+    folded = await asyncio.to_thread(profile_ring.read, profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return folded
+
 # ============================================================================
-# SECTION 10: TESTING AND QUALITY ASSURANCE
+# SECTION 12: TESTING AND QUALITY ASSURANCE
 # ============================================================================
 
 import pytest
@@ -496,6 +5415,19 @@ class TestAutoFlowAI:
     def setup_method(self):
         self.client = TestClient(app)
     
+    @pytest.fixture
+    def db(self):
+        '''A session on a fresh in-memory SQLite database, also served to the app as get_db'''
+        from sqlalchemy.pool import StaticPool
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        app.dependency_overrides[get_db] = lambda: db
+        yield db
+        app.dependency_overrides.pop(get_db, None)
+        db.close()
+        engine.dispose()
+    
     def test_workflow_generation(self):
         '''Test AI workflow generation endpoint'''
         response = self.client.post("/api/workflows/generate", json={
@@ -515,29 +5447,1023 @@ class TestAutoFlowAI:
         assert response.status_code == 200
         assert "session_id" in response.json()
 
+    def test_k9x_websocket_session(self, monkeypatch):
+        '''Test WebSocket turns stay in memory, stream questions, and the state is checkpointed on close'''
+        import fakeredis
+        store = ShardedSessionStore({f"shard-{i}": fakeredis.FakeRedis(server=fakeredis.FakeServer()) for i in range(3)})
+        monkeypatch.setitem(globals(), "k9x_session_store", store)
+        monkeypatch.setattr(AutoFlowConfig, "K9X_CHECKPOINT_INTERVAL_SECONDS", 60)
+        
+        with self.client.websocket_connect("/ws/k9x/conversation") as socket:
+            socket.send_json({"user_id": 7, "initial_request": "Launch post"})
+            session = socket.receive_json()
+            assert session["stage"] == "clarification"
+            
+            socket.send_json({"responses": {"audience": "founders"}})
+            events = [socket.receive_json() for _ in range(3)]
+            assert [event["type"] for event in events] == ["question", "question", "turn"]
+            assert events[2]["result"]["progress"] == "refinement"
+            assert store.get(f"k9x_session:{session['session_id']}") is None
+            
+            held = self.client.post("/api/k9x/conversation/continue", json={"session_id": session["session_id"], "responses": {}})
+            assert held.status_code == 409
+            with self.client.websocket_connect("/ws/k9x/conversation") as second:
+                second.send_json({"session_id": session["session_id"]})
+                assert second.receive_json()["type"] == "error"
+                assert second.receive()["code"] == 4409
+            socket.send_text("not json")
+            assert socket.receive_json()["type"] == "error"
+        
+        # The client does not wait for the server's closing write, so give its thread a moment
+        deadline = time.monotonic() + 5
+        while store.get(K9XLiveSession.lease_key(session["session_id"])) is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert json.loads(store.get(f"k9x_session:{session['session_id']}"))["stage"] == "refinement"
+        response = self.client.post("/api/k9x/conversation/continue", json={"session_id": session["session_id"], "responses": {"where": "blog"}})
+        assert response.json()["progress"] == "ready_for_output"
+        
+        with self.client.websocket_connect("/ws/k9x/conversation") as socket:
+            socket.send_json({"session_id": session["session_id"]})
+            assert socket.receive_json()["stage"] == "ready_for_output"
+            socket.send_json({"responses": {"extra": "no"}})
+            assert socket.receive_json()["result"]["status"] == "complete"
+        
+        with self.client.websocket_connect("/ws/k9x/conversation") as socket:
+            socket.send_json({"user_id": 7})
+            assert socket.receive_json()["type"] == "error"
+
+        with self.client.websocket_connect("/ws/k9x/conversation") as socket:
+            socket.send_json({"session_id": "k9x_7_missing"})
+            assert socket.receive_json()["type"] == "error"
+            assert socket.receive()["code"] == 4404
+        assert store.get(K9XLiveSession.lease_key("k9x_7_missing")) is None
+        
+        # A socket whose lease lapsed and was re-taken neither writes its state nor touches the new owner's lease
+        with self.client.websocket_connect("/ws/k9x/conversation") as socket:
+            socket.send_json({"user_id": 8, "initial_request": "Launch post"})
+            lapsed = socket.receive_json()["session_id"]
+            store.delete(K9XLiveSession.lease_key(lapsed))
+            assert store.set(K9XLiveSession.lease_key(lapsed), "new-owner", nx=True, ex=30)
+        deadline = time.monotonic() + 5
+        while K9XLiveSession.metrics["leases_lost"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.get(f"k9x_session:{lapsed}") is None
+        assert store.get(K9XLiveSession.lease_key(lapsed)) == b"new-owner"
+        assert not store.expire_if_equal(K9XLiveSession.lease_key(lapsed), "stale-token", 30)
+    
+    def test_sharded_session_store(self):
+        '''Test users spread evenly over shards, co-locate their keys, and survive adding a shard online'''
+        import fakeredis
+        def shard():
+            return fakeredis.FakeRedis(server=fakeredis.FakeServer())
+        
+        store = ShardedSessionStore({f"shard-{i}": shard() for i in range(3)})
+        owners = Counter(store.ring.node_for(k9x_shard_key(f"k9x_vault:{user}")) for user in range(6000))
+        assert max(owners.values()) < 1.25 * 2000 and min(owners.values()) > 0.75 * 2000
+        assert store.client_for("k9x_vault:42") is store.client_for("k9x_session:k9x_42_1700000000.5")
+        assert store.client_for("k9x_vault:42") is store.client_for(K9XLiveSession.lease_key("k9x_42_1700000000.5"))
+        
+        for user in range(300):
+            store.setex(f"k9x_vault:{user}", 3600, f"vault-{user}")
+        store.add_shard("shard-3", shard())
+        assert all(store.get(f"k9x_vault:{user}") == f"vault-{user}".encode() for user in range(300))
+        store.setex("k9x_vault:7", 3600, "newer")
+        
+        moved = store.rebalance()["moved"]
+        assert 0 < moved < 300 * 0.4
+        assert store.previous_ring is None
+        for user in range(300):
+            key = f"k9x_vault:{user}"
+            assert sum(client.exists(key) for client in store.clients.values()) == 1
+            assert store.client_for(key).pttl(key) > 0
+        assert store.get("k9x_vault:7") == b"newer"
+    
+    def test_cache_invalidation_bus(self):
+        '''Test a burst of invalidations reaches another worker as one versioned message and evicts its cache'''
+        import fakeredis
+        server = fakeredis.FakeServer()
+        writer = RedisInvalidationBus(fakeredis.FakeRedis(server=server), "test:invalidate", coalesce_seconds=0.05)
+        reader = RedisInvalidationBus(fakeredis.FakeRedis(server=server), "test:invalidate")
+        cache = TTLCache(10, ttl_seconds=60, bus=reader, prefix="workflow:")
+        resyncs = []
+        reader.subscribe("", resyncs.append)
+        reader.start()
+        try:
+            deadline = time.monotonic() + 5
+            while not resyncs and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cache.put(1, "v1")
+            generation = cache.generation(2)
+            for _ in range(50):
+                writer.publish("workflow:1")
+            writer.publish("workflow:2")
+            while cache.get(1) is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            
+            assert writer.messages_sent == 1
+            assert reader.received == 1
+            assert cache.invalidations == 2
+            # A load that started before the invalidation must not repopulate the cache
+            cache.put(2, "stale", generation)
+            assert cache.get(2) is None
+            writer._on_message(json.dumps({"origin": "other", "keys": {"workflow:1": 1}}))
+            writer._on_message(json.dumps({"origin": "other", "keys": {"workflow:1": 1}}))
+            assert writer.received == 2 and writer.generation("workflow:1") == 51
+        finally:
+            reader.stop()
+            writer.stop()
+        
+        expiring = TTLCache(10, ttl_seconds=0)
+        expiring.put("k", "v")
+        assert expiring.get("k") is None
+        
+        bounded = LocalInvalidationBus(max_keys=2)
+        cache = TTLCache(10, ttl_seconds=60, bus=bounded, prefix="workflow:")
+        generation = cache.generation(1)
+        for key in (1, 2, 3):
+            bounded.publish(f"workflow:{key}")
+        assert len(bounded.generations) == 2 and "workflow:1" not in bounded.generations
+        # The dropped key still reads a newer generation than the in-flight load saw
+        cache.put(1, "stale", generation)
+        assert cache.get(1) is None
+    
+    def test_reactflow_cache_invalidated_on_save(self, db):
+        '''Test the cached ReactFlow payload is served until a save invalidates it'''
+        db.add(Workflow(user_id=1, name="cached", nodes=[], connections=[]))
+        db.commit()
+        reactflow_cache.clear()
+        
+        saved = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow({"nodes": [{"type": "trigger", "name": "Webhook"}], "connections": []})
+        try:
+            assert self.client.get("/api/workflows/1/reactflow").json()["nodes"] == []
+            hits = reactflow_cache.hits
+            assert self.client.get("/api/workflows/1/reactflow").json()["nodes"] == []
+            assert reactflow_cache.hits == hits + 1
+            self.client.post("/api/workflows/1/save-reactflow", json=saved)
+            assert len(self.client.get("/api/workflows/1/reactflow").json()["nodes"]) == 1
+        finally:
+            reactflow_cache.clear()
+    
+    def test_workflow_export_import(self, db, monkeypatch):
+        '''Test NDJSON export streams a user's workflows and import reloads them in batches, skipping bad lines'''
+        graph = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow({
+            "nodes": [{"type": "trigger", "name": "Webhook"}, {"type": "action", "name": "Slack"}], "connections": [{"from": 0, "to": 1}]
+        })
+        db.add_all([Workflow(user_id=1, name=f"flow {i}", nodes=graph["nodes"], connections=graph["edges"]) for i in range(7)])
+        db.add(Workflow(user_id=2, name="other", nodes=[], connections=[]))
+        db.commit()
+        monkeypatch.setattr(AutoFlowConfig, "WORKFLOW_EXPORT_BATCH_SIZE", 3)
+        monkeypatch.setattr(AutoFlowConfig, "WORKFLOW_IMPORT_BATCH_SIZE", 2)
+        monkeypatch.setattr(AutoFlowConfig, "WORKFLOW_IMPORT_COMMIT_ROWS", 4)
+        
+        exported = self.client.get("/api/workflows/export", params={"user_id": 1})
+        assert exported.headers["content-type"].startswith("application/x-ndjson")
+        records = [json.loads(line) for line in exported.text.splitlines()]
+        assert [record["name"] for record in records] == [f"flow {i}" for i in range(7)]
+        assert records[0]["edges"] == graph["edges"]
+        
+        malformed = [{"name": "no nodes"}, {"nodes": [1]}, {"name": {"x": 1}, "nodes": []}, {"nodes": [], "edges": 5},
+                     {"nodes": [{"data": {}}]}, {"nodes": [{"id": "a", "data": 5}]}]
+        body = exported.text + "not json\n" + "".join(json.dumps(record) + "\n" for record in malformed)
+        chunks = [body[i:i + 100].encode() for i in range(0, len(body), 100)]
+        imported = self.client.post("/api/workflows/import", params={"user_id": 3}, content=iter(chunks)).json()
+        assert imported["imported"] == 7 and imported["failed"] == 7
+        assert [error["line"] for error in imported["errors"]] == list(range(8, 15))
+        
+        copies = db.query(Workflow).filter(Workflow.user_id == 3).order_by(Workflow.id).all()
+        assert [copy.name for copy in copies] == [f"flow {i}" for i in range(7)]
+        assert copies[0].connections == graph["edges"]
+        assert db.query(WorkflowNode).filter(WorkflowNode.workflow_id == copies[-1].id).count() == 2
+        
+        # The line limit holds for complete lines inside a chunk and for a chunk's unterminated tail
+        monkeypatch.setattr(AutoFlowConfig, "WORKFLOW_IMPORT_MAX_LINE_BYTES", 2 * len(exported.text.splitlines()[0]))
+        long_line = json.dumps({**records[0], "description": "x" * 4 * len(exported.text)})
+        for body in (long_line + "\n" + long_line + "\n", exported.text + long_line):
+            response = self.client.post("/api/workflows/import", params={"user_id": 4}, content=[body.encode()])
+            assert response.status_code == 413
+        assert db.query(Workflow).filter(Workflow.user_id == 4).count() == 7
+    
+    def test_response_compression(self, db):
+        '''Test Accept-Encoding negotiation, the size threshold, streamed bodies, event streams and precompressed cache hits'''
+        encodings = ["zstd", "br", "gzip"]
+        assert negotiate_encoding("gzip;q=0.5, br;q=0, zstd", encodings) == "zstd"
+        assert negotiate_encoding("br;q=0, gzip", encodings) == "gzip"
+        assert negotiate_encoding("*", encodings) == "zstd"
+        assert negotiate_encoding("identity, *;q=0", encodings) is None
+        
+        small = self.client.get("/api/unknown", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers
+        
+        decoders = {
+            "gzip": lambda data: zlib.decompress(data, 47),
+            "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+            "br": lambda data: brotli.decompress(data)
+        }
+        
+        def fetch(path, encoding):
+            with self.client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+                raw = b"".join(response.iter_raw())
+                assert response.headers["content-encoding"] == encoding
+            return raw, json.loads(decoders[encoding](raw))
+        
+        for encoding in response_compressor.encodings:
+            _, first = fetch("/api/templates", encoding)
+            hits = response_compressor.stats[encoding]["precompressed_hits"]
+            raw, second = fetch("/api/templates", encoding)
+            assert first == second and first["templates"]
+            assert response_compressor.stats[encoding]["precompressed_hits"] == hits + 1
+            assert len(raw) * 3 < len(json.dumps(second))
+        
+        metrics = self.client.get("/api/cache/metrics").json()["compression"]
+        assert metrics["gzip"]["ratio"] > 3
+        
+        # Server-sent events stay uncompressed so each event reaches the client as it is sent
+        job = enqueue_generation_job(db, 1, "pro", {"description": "Email on form submit"})
+        db.execute(update(GenerationJob).values(status="succeeded"))
+        db.commit()
+        events = self.client.get(f"/api/workflows/generate/jobs/{job.id}/events", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in events.headers
+        assert events.text.startswith("event: succeeded")
+        
+        # Listings are cached per category, so only the taxonomy is accepted
+        assert self.client.get("/api/templates", params={"category": "no-such-category"}).status_code == 400
+        assert "no-such-category" not in template_listings
+        assert self.client.get("/api/templates", params={"category": "ai-chatbots"}).status_code == 200
+    
+    def test_reactflow_msgpack_negotiation(self, db):
+        '''Test the columnar msgpack form round-trips a large canvas losslessly and is smaller than JSON'''
+        media_types = ["application/msgpack", "application/json"]
+        assert negotiate_media_type("", media_types) == "application/json"
+        assert negotiate_media_type("*/*", media_types) == "application/json"
+        assert negotiate_media_type("application/msgpack, application/json;q=0.9", media_types) == "application/msgpack"
+        assert negotiate_media_type("application/json, application/msgpack;q=0.5", media_types) == "application/json"
+        
+        canvas = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow({
+            "nodes": [{"type": ["trigger", "action", "condition"][i % 3], "name": f"Step {i}", "config": {"index": i}} for i in range(3000)],
+            "connections": [{"from": i, "to": i + 1} for i in range(2999)]
+        })
+        canvas["nodes"][5]["position"] = None
+        canvas["nodes"][6]["selected"] = True
+        del canvas["nodes"][7]["data"]
+        canvas["edges"][0].update(id="custom", source="missing")
+        canvas["edges"].append({"id": "edge_node_1_node_2_main_1", "source": "node_1", "target": "node_2", "data": {"connection_type": "main", "output_index": 1}})
+        packed = ReactFlowColumnarCodec.pack(canvas)
+        assert ReactFlowColumnarCodec.unpack(packed) == canvas
+        assert len(packed) * 2 < len(json.dumps(canvas))
+        with pytest.raises(ValueError):
+            ReactFlowColumnarCodec.decode({"format": "reactflow-columnar/0"})
+        
+        db.add(Workflow(user_id=1, name="canvas", nodes=[], connections=[]))
+        db.commit()
+        reactflow_cache.clear()
+        
+        saved = self.client.post("/api/workflows/1/save-reactflow", content=packed, headers={"Content-Type": "application/msgpack"})
+        assert saved.status_code == 200
+        assert db.query(WorkflowNode).count() == 3000
+        
+        as_json = self.client.get("/api/workflows/1/reactflow", headers={"Accept-Encoding": "identity"})
+        assert as_json.headers["content-type"] == "application/json"
+        as_msgpack = self.client.get("/api/workflows/1/reactflow", headers={"Accept": "application/msgpack", "Accept-Encoding": "identity"})
+        assert as_msgpack.headers["content-type"] == "application/msgpack"
+        assert "Accept" in as_msgpack.headers["vary"]
+        assert ReactFlowColumnarCodec.unpack(as_msgpack.content) == as_json.json()
+        assert as_json.json()["edges"] == canvas["edges"]
+        
+        document = ReactFlowColumnarCodec.encode(canvas)
+        for malformed in (b"\xc1", msgpack.packb(5), msgpack.packb({**document, "nodes": {**document["nodes"], "absent": 5}}),
+                          msgpack.packb({**document, "edges": {**document["edges"], "source": [10**6] * len(canvas["edges"])}})):
+            bad = self.client.post("/api/workflows/1/save-reactflow", content=malformed, headers={"Content-Type": "application/msgpack"})
+            assert bad.status_code == 400
+        assert self.client.post("/api/workflows/1/save-reactflow", json={"nodes": [5], "edges": []}).status_code == 400
+        assert self.client.post("/api/workflows/1/save-reactflow", json={"nodes": [{"id": "a", "data": 5}], "edges": []}).status_code == 400
+        assert self.client.post("/api/workflows/1/save-reactflow", content=b"nodes", headers={"Content-Type": "text/plain"}).status_code == 415
+    
+    def test_llm_dispatcher_tier_priority(self):
+        '''Test an enterprise call overtakes a queued starter flood'''
+        dispatcher = LLMDispatcher(2, 10000, 10**7, AutoFlowConfig.LLM_TIER_WEIGHTS, 100)
+        completed = []
+        
+        async def call(name):
+            await asyncio.sleep(0.01)
+            completed.append(name)
+        
+        async def flood():
+            starters = [asyncio.create_task(dispatcher.submit("starter", lambda i=i: call(f"starter_{i}"), 10)) for i in range(20)]
+            await asyncio.sleep(0.005)
+            await dispatcher.submit("enterprise", lambda: call("enterprise"), 10)
+            await asyncio.gather(*starters)
+        
+        asyncio.run(flood())
+        assert completed.index("enterprise") <= 4
+    
+    def test_provider_router_hedges_slow_backend(self, monkeypatch):
+        '''Test a hedged call returns the fast backend's answer, cancels the slow one and is charged to the dispatcher'''
+        monkeypatch.setattr(AutoFlowConfig, "LLM_ROUTING_EXPLORATION_RATE", 0)
+        monkeypatch.setattr(AutoFlowConfig, "LLM_HEDGE_DEFAULT_DEADLINE_SECONDS", 0.02)
+        dispatcher = LLMDispatcher(2, 10000, 6000, AutoFlowConfig.LLM_TIER_WEIGHTS, 100)
+        router = ProviderRouter([{"provider": "slow", "model": "a"}, {"provider": "fast", "model": "b"}], dispatcher)
+        delays = {"slow": 1.0, "fast": 0.01}
+        
+        async def call_backend(backend):
+            await asyncio.sleep(delays[backend["provider"]])
+            return LLMCompletion("{}", 1, 1, backend["provider"], backend["model"])
+        
+        async def hedged():
+            completion = await router.complete("enterprise", call_backend, estimated_tokens=1000, prompt_tokens=200)
+            await asyncio.sleep(0)
+            return completion
+        
+        completion = asyncio.run(hedged())
+        assert completion.provider == "fast"
+        assert router.ranked_backends()[0]["provider"] == "fast"
+        assert dispatcher.in_flight == 0
+        # The cancelled loser stays charged for its prompt only
+        assert 6000 - 210 < dispatcher.token_bucket.tokens < 6000 - 180
+        
+        # With every slot taken the primary is left to finish on its own
+        delays["fast"] = 0.1
+        dispatcher.in_flight = dispatcher.max_concurrency
+        completion = asyncio.run(router.complete("enterprise", call_backend, estimated_tokens=1000, prompt_tokens=200))
+        assert completion.provider == "fast"
+        assert router.metrics()["fast:b"]["hedges_skipped"] == 1
+    
+    def test_generation_job_queue_idempotency_and_lease(self, db):
+        '''Test idempotent submits and that an expired lease is reclaimed by another worker'''
+        for malformed in ({"description": "Email on form submit"}, {"user_id": 1}, {"user_id": 1, "description": "  "},
+                          {"user_id": 1, "description": "Email", "context": "marketing"}):
+            assert self.client.post("/api/workflows/generate/jobs", json=malformed).status_code == 400
+        assert db.query(GenerationJob).count() == 0
+        
+        first = enqueue_generation_job(db, 1, "pro", {"description": "Email on form submit"}, idempotency_key="abc")
+        second = enqueue_generation_job(db, 1, "pro", {"description": "Email on form submit"}, idempotency_key="abc")
+        assert first.id == second.id
+        
+        crashed_worker, worker = GenerationJobWorker(1), GenerationJobWorker(1)
+        assert crashed_worker.claim(db).id == first.id
+        assert worker.claim(db) is None
+        
+        db.execute(update(GenerationJob).values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+        reclaimed = worker.claim(db)
+        assert reclaimed.id == first.id and reclaimed.attempts == 2
+        
+        # A job whose lease keeps expiring is failed once its attempts are used up, not reclaimed again
+        for attempts in (3, None):
+            db.execute(update(GenerationJob).values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+            db.commit()
+            reclaimed = worker.claim(db)
+            assert (reclaimed and reclaimed.attempts) == attempts
+        assert db.get(GenerationJob, first.id, populate_existing=True).status == "failed"
+        
+        # A job deleted after the stream opened ends it on a failed event
+        async def events_after_delete():
+            response = await stream_generation_job_events(first.id, db)
+            db.query(GenerationJob).delete()
+            db.commit()
+            return [event async for event in response.body_iterator]
+        events = asyncio.run(events_after_delete())
+        assert len(events) == 1 and events[0].startswith("event: failed")
+    
+    def test_batch_generation_item_errors(self, db, monkeypatch):
+        '''Test malformed batches are rejected before streaming and a failing item does not abort the rest'''
+        async def generate(self, description, context, tier="starter"):
+            if description == "boom":
+                raise RuntimeError("provider exploded")
+            return {"success": True, "workflow": {"nodes": [{"type": "trigger", "name": description}], "connections": []},
+                    "source": "model", "ai_confidence": 0.9, "suggestions": []}
+        monkeypatch.setattr(AIWorkflowGenerator, "__init__", lambda self: None)
+        monkeypatch.setattr(AIWorkflowGenerator, "generate_workflow_from_description", generate)
+        
+        assert self.client.post("/api/workflows/generate/batch", json={"user_id": 1, "items": [{"nope": 1}]}).status_code == 400
+        assert self.client.post("/api/workflows/generate/batch", json={"items": [{"description": "x"}]}).status_code == 400
+        
+        response = self.client.post("/api/workflows/generate/batch", json={"user_id": 1, "items": [{"description": "ok"}, {"description": "boom"}]})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert {line["index"]: line["status"] for line in lines[:-1]} == {0: "generated", 1: "error"}
+        assert "RuntimeError" in next(line["error"] for line in lines if line.get("index") == 1)
+        assert lines[-1]["generated"] == 1 and db.query(Workflow).count() == 1
+    
+    def test_generation_job_poison_result(self, db, monkeypatch):
+        '''Test a failure while storing a generated workflow is recorded on the job and the worker carries on'''
+        job = enqueue_generation_job(db, 1, "pro", {"description": "Email on form submit"})
+        
+        async def malformed(self, description, context, tier="starter"):
+            return {"success": True, "ai_confidence": 0.9, "suggestions": []}
+        monkeypatch.setattr(AIWorkflowGenerator, "__init__", lambda self: None)
+        monkeypatch.setattr(AIWorkflowGenerator, "generate_workflow_from_description", malformed)
+        
+        worker = GenerationJobWorker(1, session_factory=lambda: contextmanager(lambda: (yield sessionmaker(bind=db.get_bind())()))())
+        
+        async def run_once():
+            task = asyncio.create_task(worker.run())
+            await asyncio.sleep(0.2)
+            worker.stop()
+            await task
+        
+        asyncio.run(run_once())
+        failed = db.get(GenerationJob, job.id, populate_existing=True)
+        assert failed.status == "pending" and failed.attempts == 1 and "KeyError" in failed.error
+        assert db.query(Workflow).count() == 0
+    
+    def test_template_fast_path(self):
+        '''Test a close description is answered from the corpus and a vague one falls through'''
+        templates = [
+            {"name": "Gmail AI auto-responder", "category": "email-automation", "connections": {},
+             "nodes": [{"id": "1", "name": "Gmail Trigger", "type": "n8n-nodes-base.gmailTrigger", "position": [0, 0]}]},
+            {"name": "Slack daily digest", "category": "productivity", "connections": {},
+             "nodes": [{"id": "1", "name": "Schedule", "type": "n8n-nodes-base.scheduleTrigger", "position": [0, 0]}]}
+        ]
+        fast_path = TemplateFastPath(TemplateLibrary.from_templates(templates), min_confidence=0.8, min_terms=3)
+        
+        match = asyncio.run(fast_path.match("Gmail auto responder with AI"))
+        assert match["template"]["name"] == "Gmail AI auto-responder"
+        assert asyncio.run(fast_path.match("Send invoices to customers")) is None
+        assert fast_path.metrics()["hit_rate"] == 0.5
+    
+    def test_generation_prompt_grounding(self):
+        '''Test the prompt carries compact skeletons of similar templates and a sized max_tokens'''
+        templates = [
+            {"name": "Gmail AI auto-responder", "category": "email-automation",
+             "connections": {"Gmail Trigger": {"main": [[{"node": "Reply", "type": "main", "index": 0}]]}},
+             "nodes": [{"id": "1", "name": "Gmail Trigger", "type": "n8n-nodes-base.gmailTrigger", "position": [0, 0]},
+                       {"id": "2", "name": "Reply", "type": "n8n-nodes-base.gmail", "position": [200, 0]}]}
+        ]
+        builder = GenerationPromptBuilder(TemplateLibrary.from_templates(templates), examples=3, prompt_token_budget=1500,
+                                          tokens_per_node=60, min_output_tokens=512, max_output_tokens=2000)
+        
+        prompt = asyncio.run(builder.build("Reply to Gmail messages with AI"))
+        assert prompt["examples"] == ["Gmail AI auto-responder"]
+        assert '[["trigger","Gmail Trigger"],["action","Reply"]],"edges":[[0,1]]' in prompt["system"]
+        assert prompt["max_tokens"] == 512
+        assert asyncio.run(builder.build("Send invoices"))["max_tokens"] == 2000
+    
+    def test_workflow_json_repair(self, monkeypatch):
+        '''Test fenced and truncated output is repaired locally and only the tail is re-requested'''
+        workflow = '{"nodes":[{"type":"trigger","name":"Form"},{"type":"action","name":"Email"}],"connections":[{"from":0,"to":1}]}'
+        repair = WorkflowJSONRepair()
+        assert repair.parse("```json\n" + workflow.replace("}]", "},]") + "\n```")["status"] == "repaired"
+        truncated = repair.parse(workflow[:60])
+        assert truncated["status"] == "truncated" and truncated["workflow"]["connections"] == []
+        
+        monkeypatch.setattr(AutoFlowConfig, "TEMPLATE_FAST_PATH_ENABLED", False)
+        monkeypatch.setattr(AutoFlowConfig, "GENERATION_PROMPT_GROUNDING_ENABLED", False)
+        prefixes = []
+        
+        async def generate(tier, system_prompt, description, max_tokens, prefix=None):
+            prefixes.append(prefix)
+            return LLMCompletion(workflow[len(prefix):] if prefix else workflow[:60], 10, 10, "anthropic", "stub")
+        
+        generator = AIWorkflowGenerator()
+        monkeypatch.setattr(generator, "_generate", generate)
+        continued = workflow_json_repair.continued
+        result = asyncio.run(generator.generate_workflow_from_description("Email me form submissions"))
+        assert result["workflow"]["connections"] == [{"from": 0, "to": 1}]
+        assert prefixes == [None, workflow[:60]]
+        assert workflow_json_repair.continued == continued + 1
+    
+    def test_workflow_execution_engine(self):
+        '''Test fan-out runs at critical-path speed and conditions, failures and timeouts gate downstream nodes'''
+        engine = WorkflowExecutionEngine(stub_node_handlers(0.05), max_concurrency=16, node_timeout_seconds=1.0)
+        nodes = [{"id": "trigger", "type": "WorkflowTriggerNode", "data": {}}, {"id": "merge", "type": "WorkflowActionNode", "data": {}}]
+        edges = []
+        for i in range(6):
+            nodes.append({"id": f"branch_{i}", "type": "WorkflowActionNode", "data": {}})
+            edges += [{"source": "trigger", "target": f"branch_{i}"}, {"source": f"branch_{i}", "target": "merge"}]
+        
+        result = asyncio.run(engine.execute(engine.compile(nodes, edges)))
+        assert result["status"] == "succeeded"
+        assert len(result["nodes"]["merge"]["output"]["inputs"]) == 6
+        assert result["wall_ms"] < result["total_node_ms"] / 2
+        
+        nodes = [
+            {"id": "check", "type": "WorkflowConditionNode", "data": {"config": {"stub_result": False}}},
+            {"id": "on_true", "type": "WorkflowActionNode", "data": {}},
+            {"id": "on_false", "type": "WorkflowActionNode", "data": {"config": {"stub_error": "upstream down"}}},
+            {"id": "after_failure", "type": "WorkflowActionNode", "data": {}},
+            {"id": "slow", "type": "WorkflowActionNode", "data": {"config": {"stub_delay_seconds": 5, "timeout_seconds": 0.05}}}
+        ]
+        edges = [
+            {"source": "check", "target": "on_true"},
+            {"source": "check", "target": "on_false", "data": {"output_index": 1}},
+            {"source": "on_false", "target": "after_failure"}
+        ]
+        statuses = {node_id: node["status"] for node_id, node in asyncio.run(engine.execute(engine.compile(nodes, edges)))["nodes"].items()}
+        assert statuses == {"check": "succeeded", "on_true": "skipped", "on_false": "failed", "after_failure": "skipped", "slow": "timed_out"}
+        
+        with pytest.raises(WorkflowCycleError):
+            engine.compile(nodes[:2], [{"source": "check", "target": "on_true"}, {"source": "on_true", "target": "check"}])
+    
+    def test_timed_out_thread_keeps_its_slot(self):
+        '''Test a sync handler that times out holds its concurrency slot until its thread returns'''
+        engine = WorkflowExecutionEngine({"action": NodeHandler(lambda config, inputs, context: time.sleep(0.3))},
+                                         max_concurrency=1, node_timeout_seconds=0.05)
+        plan = engine.compile([{"id": "slow", "type": "WorkflowActionNode", "data": {}}], [])
+        
+        async def run():
+            assert (await engine.execute(plan))["nodes"]["slow"]["status"] == "timed_out"
+            assert engine._semaphore.locked()
+            await asyncio.sleep(0.5)
+            assert not engine._semaphore.locked()
+        
+        asyncio.run(run())
+    
+    def test_node_output_memoization(self, tmp_path):
+        '''Test a re-run after editing one node executes only that node and its descendants'''
+        cache = NodeOutputCache(100, directory=str(tmp_path), max_disk_entries=100)
+        engine = WorkflowExecutionEngine(stub_node_handlers(), max_concurrency=8, node_timeout_seconds=1.0, output_cache=cache)
+        nodes = [{"id": node_id, "type": "WorkflowActionNode", "data": {"config": {}}} for node_id in ("fetch", "left", "right", "send")]
+        nodes[3]["data"]["config"]["memoize"] = False
+        edges = [{"source": "fetch", "target": "left"}, {"source": "fetch", "target": "right"},
+                 {"source": "left", "target": "send"}, {"source": "right", "target": "send"}]
+        
+        assert asyncio.run(engine.execute(engine.compile(nodes, edges)))["cached_nodes"] == 0
+        nodes[1]["data"]["config"]["stub_result"] = {"edited": True}
+        rerun = asyncio.run(engine.execute(engine.compile(nodes, edges)))
+        assert {node_id for node_id, node in rerun["nodes"].items() if node.get("cached")} == {"fetch", "right"}
+        
+        cold = WorkflowExecutionEngine(stub_node_handlers(), max_concurrency=8, node_timeout_seconds=1.0,
+                                       output_cache=NodeOutputCache(100, directory=str(tmp_path), max_disk_entries=100))
+        assert asyncio.run(cold.execute(engine.compile(nodes, edges)))["cached_nodes"] == 3
+        assert asyncio.run(cold.execute(engine.compile(nodes, edges), scope=["another user", 1]))["cached_nodes"] == 0
+        
+        effectful = WorkflowExecutionEngine({"action": NodeHandler(lambda config, inputs, context: {"sent": True})}, max_concurrency=8,
+                                            node_timeout_seconds=1.0, output_cache=NodeOutputCache(100))
+        plan = effectful.compile(nodes[:1], [])
+        assert [asyncio.run(effectful.execute(plan))["cached_nodes"] for _ in range(2)] == [0, 0]
+    
+    def test_execution_plan_cache(self):
+        '''Test plans are compiled once per workflow version and recompiled after a save'''
+        engine = WorkflowExecutionEngine(stub_node_handlers(), max_concurrency=8, node_timeout_seconds=1.0)
+        loads = []
+        
+        def load():
+            loads.append(1)
+            return [{"id": "a", "type": "trigger"}, {"id": "b", "type": "action"}, {"id": "c", "type": "action"}], \
+                   [{"source": "b", "target": "c"}, {"source": "a", "target": "b"}]
+        
+        plan = engine.plan_for(7, "v1", load)
+        assert engine.plan_for(7, "v1", load) is plan and len(loads) == 1
+        assert plan.node_ids == ["a", "b", "c"] and plan.levels == [0, 1, 2] and plan.children[0] == ((1, 0),)
+        assert engine.plan_for(7, "v2", load) is not plan
+        engine.plan_cache.invalidate(7)
+        engine.plan_for(7, "v2", load)
+        assert len(loads) == 3
+    
+    def test_user_workflow_listing(self, db):
+        '''Test keyset pages cover every workflow exactly once, newest first, without node blobs'''
+        now = datetime.utcnow()
+        db.add_all([Workflow(user_id=1, name=f"wf {i}", nodes=[], connections=[], updated_at=now - timedelta(minutes=i // 2)) for i in range(7)])
+        db.add(Workflow(user_id=2, name="other", nodes=[], connections=[], updated_at=now))
+        db.commit()
+        
+        names, cursor = [], None
+        while True:
+            page = self.client.get("/api/users/1/workflows", params={"limit": 3, **({"cursor": cursor} if cursor else {})}).json()
+            names += [workflow["name"] for workflow in page["workflows"]]
+            assert all("nodes" not in workflow for workflow in page["workflows"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert names == ["wf 1", "wf 0", "wf 3", "wf 2", "wf 5", "wf 4", "wf 6"]
+    
+    def test_workflow_graph_side_tables(self, db):
+        '''Test saves rewrite workflow_nodes/workflow_edges and node-type queries run against them'''
+        db.add_all([Workflow(user_id=1, name="digest"), Workflow(user_id=2, name="router")])
+        db.commit()
+        
+        digest = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow({
+            "nodes": [{"type": "trigger", "name": "Schedule"}, {"type": "ai_generator", "name": "Summarize"}, {"type": "action", "name": "Post"}],
+            "connections": [{"from": 0, "to": 1}, {"from": 1, "to": 2}]
+        })
+        router = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow({"nodes": [{"type": "trigger", "name": "Webhook"}], "connections": []})
+        self.client.post("/api/workflows/1/save-reactflow", json=router)
+        self.client.post("/api/workflows/1/save-reactflow", json=digest)
+        self.client.post("/api/workflows/2/save-reactflow", json=router)
+        
+        assert db.query(WorkflowNode).filter(WorkflowNode.workflow_id == 1).count() == 3
+        assert db.query(WorkflowEdge).filter(WorkflowEdge.workflow_id == 1).count() == 2
+        found = self.client.get("/api/workflows/search/by-node-type", params={"node_type": "ai_generator"}).json()
+        assert [workflow["name"] for workflow in found["workflows"]] == ["digest"]
+        usage = self.client.get("/api/analytics/node-types").json()["node_types"]
+        assert {row["node_type"]: (row["nodes"], row["workflows"]) for row in usage}["trigger"] == (2, 2)
+    
+    def test_compressed_json_columns(self, db, tmp_path):
+        '''Test CompressedJSON round-trips and recompress_json_columns migrates legacy uncompressed rows'''
+        nodes = ReactFlowWorkflowEditor.convert_ai_workflow_to_reactflow(
+            {"nodes": [{"type": "trigger", "name": "Webhook"}, {"type": "action", "name": "Slack"}], "connections": [{"from": 0, "to": 1}]}
+        )["nodes"]
+        db.add(Workflow(user_id=1, name="new", nodes=nodes, connections=[]))
+        db.commit()
+        legacy = json.dumps(nodes)
+        db.execute(insert(Workflow.__table__).values(user_id=1, name="legacy", nodes=type_coerce(legacy, Text), connections=type_coerce("[]", Text)))
+        db.commit()
+        
+        assert db.query(Workflow).filter(Workflow.name == "legacy").one().nodes == nodes
+        assert recompress_json_columns(db.get_bind())["workflows.nodes"] == 1
+        raw = db.execute(select(type_coerce(Workflow.__table__.c.nodes, LargeBinary))).scalars().all()
+        assert [CompressedJSON.version(value) for value in raw] == [json_dictionaries.current_version] * 2
+        assert all(len(value) < len(legacy) for value in raw)
+        db.expire_all()
+        assert [workflow.nodes for workflow in db.query(Workflow).order_by(Workflow.id)] == [nodes, nodes]
+        assert recompress_json_columns(db.get_bind())["workflows.nodes"] == 0
+        
+        (tmp_path / f"workflow-json-v{JSONDictionaries.MAX_VERSION}.zdict").write_bytes(b"workflow" * 64)
+        with pytest.raises(ValueError):
+            JSONDictionaries(str(tmp_path), 3).install(b"next" * 64)
+    
+    def test_template_variant_detection(self):
+        '''Test re-exported copies group under one canonical template and a different structure stays apart'''
+        def template(name, path, types, id_offset=0):
+            nodes = [{"id": str(i + id_offset), "name": f"{name} step {i}", "type": node_type, "position": [i * 100 + id_offset, 0],
+                      "parameters": {"resource": "message"}} for i, node_type in enumerate(types)]
+            connections = {nodes[i]["name"]: {"main": [[{"node": nodes[i + 1]["name"], "type": "main", "index": 0}]]} for i in range(len(nodes) - 1)}
+            return {"name": name, "category": "ai", "path": path, "nodes": nodes, "connections": connections}
+        
+        pipeline = ["n8n-nodes-base.gmailTrigger", "@n8n/n8n-nodes-langchain.openAi", "n8n-nodes-base.if", "n8n-nodes-base.slack", "n8n-nodes-base.gmail"]
+        templates = [
+            template("Email triage", "ai/Email triage 2.txt", pipeline, id_offset=7),
+            template("Email triage", "ai/Email triage.txt", pipeline),
+            template("Invoice sync", "finance/Invoice sync.txt", ["n8n-nodes-base.scheduleTrigger", "n8n-nodes-base.stripe", "n8n-nodes-base.googleSheets"])
+        ]
+        variants = TemplateVariantIndex.deduplicate(templates)
+        
+        assert [template["path"] for template in variants.canonical_templates()] == ["ai/Email triage.txt", "finance/Invoice sync.txt"]
+        assert variants.variant_groups()[0]["variants"] == [{"name": "Email triage", "path": "ai/Email triage 2.txt"}]
+        assert variants.find_variant(template("Renamed copy", None, pipeline, id_offset=3))["path"] == "ai/Email triage.txt"
+        assert variants.find_variant(template("Other", None, pipeline[:2])) is None
+        
+        for malformed in ({"nodes": 5}, {"nodes": [5]}, {"nodes": [], "connections": {"A": {"main": [5]}}}):
+            assert self.client.post("/api/templates/check-duplicate", json=malformed).status_code == 400
+    
+    def test_n8n_template_layout_and_categories(self, tmp_path):
+        '''Test only unpositioned nodes are laid out and category folders label templates'''
+        template = {"name": "Partial", "connections": {"Start": {"main": [[{"node": "Fetch", "type": "main", "index": 0}]]},
+                                                       "Fetch": {"main": [[{"node": "Store", "type": "main", "index": 0}]]}},
+                    "nodes": [{"id": "1", "name": "Start", "type": "n8n-nodes-base.manualTrigger", "position": [40, 300]},
+                              {"id": "2", "name": "Fetch", "type": "n8n-nodes-base.httpRequest", "position": [400, 320]},
+                              {"id": "3", "name": "Store", "type": "n8n-nodes-base.postgres"}]}
+        positions = {node["id"]: node["position"] for node in ReactFlowWorkflowEditor.convert_n8n_template_to_reactflow(template)["nodes"]}
+        assert positions == {"1": {"x": 40, "y": 300}, "2": {"x": 400, "y": 320}, "3": {"x": 650, "y": 470}}
+        
+        for folder in ("email-automation", "uncategorized"):
+            (tmp_path / folder).mkdir()
+            (tmp_path / folder / "Partial.txt").write_text(json.dumps(template))
+        assert sorted(str(template["category"]) for template in N8NTemplateCorpus.load([str(tmp_path)])) == ["None", "email-automation"]
+    
+    def test_template_category_classifier(self):
+        '''Test templates are classified on node types and notes, in batch and one at a time, with ingest matching batch'''
+        def template(name, types, note=""):
+            nodes = [{"name": node_type.split(".")[-1], "type": node_type} for node_type in types]
+            return {"name": name, "description": note, "nodes": nodes, "category": None}
+        
+        templates = [
+            template("Inbox helper", ["n8n-nodes-base.gmailTrigger", "n8n-nodes-base.gmail"], "Drafts a reply to every email"),
+            template("Support desk", ["@n8n/n8n-nodes-langchain.chatTrigger", "@n8n/n8n-nodes-langchain.agent"], "A chatbot assistant"),
+            template("Knowledge base", ["@n8n/n8n-nodes-langchain.vectorStoreQdrant", "@n8n/n8n-nodes-langchain.embeddingsOpenAi"], "RAG over docs"),
+            template("Orders", ["n8n-nodes-base.shopifyTrigger", "n8n-nodes-base.stripe"], "Sync store payments"),
+            template("Untitled", ["n8n-nodes-base.noOp"])
+        ]
+        classifier = TemplateCategoryClassifier().fit(templates)
+        
+        labels = classifier.classify(templates)
+        assert [category for category, _ in labels] == ["email-automation", "ai-chatbots", "advanced-ai", "ecommerce", None]
+        assert [classifier.classify_one(template) for template in templates] == labels
+        
+        pinned = TemplateCategoryClassifier().fit([{**templates[0], "category": "productivity"}] + templates[1:])
+        assert pinned.classify_one(template("Mail", ["n8n-nodes-base.gmail"]))[0] == "productivity"
+        
+        response = self.client.post("/api/templates/classify", json={"name": "Outlook", "nodes": [
+            {"name": "Outlook", "type": "n8n-nodes-base.microsoftOutlookTrigger"},
+            {"name": "Note", "type": N8N_STICKY_NOTE_TYPE, "parameters": {"content": "Auto reply to customer email"}}
+        ]})
+        assert response.json()["category"] == "email-automation"
+        
+        for malformed in ({"nodes": 5}, {"nodes": [1]}, {"name": 5, "nodes": []}, {"nodes": [], "connections": {"A": {"main": [5]}}},
+                          {"nodes": [{"type": N8N_STICKY_NOTE_TYPE, "parameters": {"content": 5}}]}):
+            assert self.client.post("/api/templates/classify", json=malformed).status_code == 400
+    
+    def test_similar_workflows(self, db):
+        '''Test IVF search agrees with exact search and the endpoint ranks the same user's closest workflow first'''
+        rng = np.random.default_rng(1)
+        vectors = rng.standard_normal((2000, 64)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        exact, ivf = VectorIndex(64), VectorIndex(64, ivf_min_rows=1000, nprobe=16)
+        exact.upsert(list(range(2000)), vectors)
+        ivf.upsert(list(range(2000)), vectors)
+        assert ivf.centroids is not None
+        assert [key for key, _ in ivf.search(vectors[:5], 1)[0]] == [0]
+        assert exact.search(vectors[:1], 3, exclude=0)[0][0][0] != 0
+        
+        def workflow(user_id, name, types):
+            row = Workflow(user_id=user_id, name=name, description=name)
+            db.add(row)
+            db.flush()
+            sync_workflow_graph(db, [(row.id, [{"id": str(i), "data": {"label": t, "n8n_type": t}} for i, t in enumerate(types)], [])])
+            return row.id
+        email = ["n8n-nodes-base.gmailTrigger", "@n8n/n8n-nodes-langchain.openAi", "n8n-nodes-base.gmail"]
+        source = workflow(1, "Email reply drafts", email)
+        close = workflow(1, "Email auto reply", email)
+        workflow(1, "Invoice sheet sync", ["n8n-nodes-base.scheduleTrigger", "n8n-nodes-base.stripe", "n8n-nodes-base.googleSheets"])
+        workflow(2, "Email reply drafts", email)
+        db.commit()
+        
+        similar = self.client.get(f"/api/workflows/{source}/similar").json()
+        assert [row["workflow_id"] for row in similar["workflows"]][0] == close
+        assert source not in [row["workflow_id"] for row in similar["workflows"]]
+        assert len(similar["workflows"]) == 2
+        assert similar["templates"]
+        
+        # A deleted workflow leaves the index on its invalidation; a re-saved one comes back
+        db.query(Workflow).filter(Workflow.id == close).delete()
+        db.commit()
+        invalidation_bus.publish(f"workflow:{close}")
+        assert close not in [row["workflow_id"] for row in self.client.get(f"/api/workflows/{source}/similar").json()["workflows"]]
+        invalidation_bus.publish(f"workflow:{source}")
+        assert self.client.get(f"/api/workflows/{source}/similar").json()["workflows"]
+        assert source in similarity_service.workflows.positions
+        
+        index = VectorIndex(64, ivf_min_rows=1000, nprobe=16)
+        index.upsert(list(range(2000)), vectors, [key % 3 for key in range(2000)])
+        assert index.remove([0, 5, 1999]) == [0, 2, 1]
+        assert index.size == 1997 and sorted(np.concatenate(index.cells).tolist()) == list(range(1997))
+        assert [key for key, _ in index.search(vectors[1998:1999], 1)[0]] == [1998]
+        assert set(index.keys_of(2)) == {key for key in range(2000) if key % 3 == 2} - {5}
+        
+        service = SimilarityService(template_library, 64, max_users=1)
+        service.vectorizer, service.workflows = HashedTfidfVectorizer(64).fit([vector_document("Email reply", "", [])]), VectorIndex(64)
+        service.refresh_user(db, 1)
+        service.refresh_user(db, 2)
+        assert list(service.user_watermarks) == [2] and set(service.workflows.owners[:service.workflows.size]) == {2}
+        
+        # Invalidations landing while a refresh reads: a resync discards its result, a row invalidation leaves that row out
+        fitted = service.vectorizer
+        class InvalidatingVectorizer:
+            def __init__(self, bus_key):
+                self.bus_key = bus_key
+                self.dimensions = fitted.dimensions
+            def transform(self, documents):
+                service.on_invalidate(self.bus_key)
+                return fitted.transform(documents)
+        service.vectorizer = InvalidatingVectorizer(None)
+        service.refresh_user(db, 1)
+        assert not service.user_watermarks and service.workflows.size == 0
+        service.vectorizer = InvalidatingVectorizer(f"workflow:{source}")
+        service.refresh_user(db, 1)
+        assert source not in service.workflows.positions and service.stale[1] == {source}
+        service.vectorizer = fitted
+        service.refresh_user(db, 1)
+        assert source in service.workflows.positions and not service.stale.get(1)
+    
+    def test_request_profiling(self, tmp_path, monkeypatch):
+        '''Test header-triggered request profiling, the collapsed-stack format, the bounded ring and global mode'''
+        monkeypatch.setattr(AutoFlowConfig, "PROFILING_ENABLED", True)
+        monkeypatch.setattr(profile_ring, "directory", str(tmp_path))
+        collapsed_line = re.compile(r"^[^;\n]+ \([^()]+:\d+\)(;[^;\n]+ \([^()]+:\d+\))* \d+$")
+
+        def busy(seconds):
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+
+        response = self.client.get("/api/unknown", headers={AutoFlowConfig.PROFILING_HEADER: "1"})
+        profile_id = response.headers["x-autoflow-profile-id"]
+
+        listing = self.client.get("/debug/profiles").json()
+        assert listing["profiles"][0]["profile_id"] == profile_id
+        folded = self.client.get(f"/debug/profiles/{profile_id}").text
+        lines = folded.splitlines()
+        assert all(collapsed_line.match(line) for line in lines)
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == listing["profiles"][0]["samples"]
+
+        # Stored profiles are "root;...;leaf count" lines, most frequent first
+        sampler = StackSampler(1, thread_id=threading.get_ident()).start()
+        busy(0.1)
+        profile_ring.write("1_0000abcd", {"samples": sampler.sample_count}, sampler.stop())
+        lines = profile_ring.read("1_0000abcd").splitlines()
+        assert lines and all(collapsed_line.match(line) for line in lines)
+        # Root first: the test's own frame precedes the leaf it called
+        assert any(0 < line.find(";test_request_profiling (") < line.find(";busy (") for line in lines)
+        counts = [int(line.rsplit(" ", 1)[1]) for line in lines]
+        assert counts == sorted(counts, reverse=True)
+
+        # The ring keeps only the newest `capacity` profiles on disk
+        monkeypatch.setattr(profile_ring, "capacity", 3)
+        newest = []
+        for _ in range(5):
+            time.sleep(0.002)
+            newest.append(self.client.get("/api/unknown", headers={AutoFlowConfig.PROFILING_HEADER: "1"}).headers["x-autoflow-profile-id"])
+        assert sorted(os.listdir(tmp_path)) == sorted(f"{profile}{suffix}" for profile in newest[-3:] for suffix in (".folded", ".json"))
+        assert [profile["profile_id"] for profile in self.client.get("/debug/profiles").json()["profiles"]] == newest[:-4:-1]
+
+        # Global mode samples every thread except the sampler's own, aggregated until the worker exits
+        monkeypatch.setitem(globals(), "global_profiler", None)
+        monkeypatch.setattr(AutoFlowConfig, "GLOBAL_PROFILING_INTERVAL_MS", 1)
+        assert self.client.get("/debug/profiles/global").status_code == 404
+        profiler = start_global_profiler()
+        try:
+            assert start_global_profiler() is profiler
+            busy(0.1)
+            assert self.client.get("/debug/profiles").json()["global_profiling"] is True
+            lines = self.client.get("/debug/profiles/global").text.splitlines()
+            assert lines and all(collapsed_line.match(line) for line in lines)
+            assert any(";busy (" in line for line in lines)
+            assert not any(";_sample (" in line for line in lines)
+        finally:
+            profiler.stop()
+
 # ============================================================================
-# SECTION 11: MAIN APPLICATION STARTUP
+# SECTION 13: MAIN APPLICATION STARTUP
 # ============================================================================
 
 def create_tables():
     '''Create database tables'''
     engine = create_engine(AutoFlowConfig.DATABASE_URL)
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist; add indexes introduced since
+    for index in Workflow.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    migrate_json_columns_to_binary(engine)
+
+def migrate_json_columns_to_binary(engine):
+    '''Convert CompressedJSON columns still typed json to bytea in place (PostgreSQL only)
+    
+    Existing values become their JSON text as bytes, which CompressedJSON reads as legacy rows,
+    so this must run before the first write; recompress_json_columns rewrites the rows later.
+    '''
+    
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as connection:
+        quote = connection.dialect.identifier_preparer.quote
+        for model, column in COMPRESSED_JSON_COLUMNS:
+            existing = {info["name"]: info["type"] for info in inspect_schema(connection).get_columns(model.__tablename__)}
+            if column in existing and not isinstance(existing[column], LargeBinary):
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {quote(model.__tablename__)} ALTER COLUMN {quote(column)} TYPE bytea "
+                    f"USING convert_to({quote(column)}::text, 'UTF8')"
+                )
+
+def backfill_workflow_graph(batch_size: int = 500):
+    '''Populate workflow_nodes / workflow_edges for workflows saved before the side tables existed'''
+    db = SessionLocal()
+    try:
+        last_id = 0
+        while True:
+            missing = db.execute(
+                select(Workflow.id, Workflow.nodes, Workflow.connections)
+                .where(Workflow.id > last_id, ~select(WorkflowNode.id).where(WorkflowNode.workflow_id == Workflow.id).exists())
+                .order_by(Workflow.id)
+                .limit(batch_size)
+            ).all()
+            if not missing:
+                break
+            sync_workflow_graph(db, [(row.id, row.nodes, row.connections) for row in missing])
+            db.commit()
+            last_id = missing[-1].id
+    finally:
+        db.close()
+
+COMPRESSED_JSON_COLUMNS = [
+    (Workflow, "nodes"), (Workflow, "connections"),
+    (Template, "nodes"), (Template, "connections"),
+    (K9XConversation, "conversation_history")
+]
+
+def json_dictionary_samples(directories: List[str]) -> List[bytes]:
+    '''Training samples shaped like stored rows: n8n node lists plus their ReactFlow nodes and edges'''
+    samples = []
+    for template in N8NTemplateCorpus.load(directories):
+        reactflow_data = ReactFlowWorkflowEditor.convert_n8n_template_to_reactflow(template)
+        for value in (template["nodes"], template.get("connections", {}), reactflow_data["nodes"], reactflow_data["edges"]):
+            samples.append(json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode())
+    return samples
+
+def train_json_dictionary(directories: List[str] = AutoFlowConfig.TEMPLATE_DIRECTORIES) -> int:
+    '''Train a zstd dictionary on the template corpus and install it as the next version'''
+    dictionary = zstandard.train_dictionary(
+        AutoFlowConfig.JSON_DICTIONARY_SIZE,
+        json_dictionary_samples(directories),
+        level=AutoFlowConfig.JSON_COMPRESSION_LEVEL
+    )
+    return json_dictionaries.install(dictionary.as_bytes())
+
+def recompress_json_columns(engine, batch_size: int = 500) -> Dict[str, int]:
+    '''Rewrite CompressedJSON columns whose rows are legacy JSON or use an older dictionary
+    
+    Column types are migrated by create_tables at startup (repeated here for databases that
+    skipped it). Rows are walked in primary-key batches with one commit per batch, so the
+    rewrite can be stopped and rerun; rows already on the current dictionary are skipped.
+    '''
+    
+    migrate_json_columns_to_binary(engine)
+    
+    current = json_dictionaries.current_version
+    rewritten = {}
+    db = sessionmaker(bind=engine)()
+    try:
+        for model, column in COMPRESSED_JSON_COLUMNS:
+            table = model.__table__
+            key = f"{model.__tablename__}.{column}"
+            rewritten[key] = 0
+            last_id = 0
+            while True:
+                rows = db.execute(
+                    select(table.c.id, type_coerce(table.c[column], LargeBinary).label("raw"))
+                    .where(table.c.id > last_id)
+                    .order_by(table.c.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                stale = [
+                    {"row_id": row.id, "value": CompressedJSON.decode(row.raw)}
+                    for row in rows
+                    if row.raw is not None and CompressedJSON.version(row.raw) != current
+                ]
+                if stale:
+                    db.execute(
+                        update(table).where(table.c.id == bindparam("row_id")).values({column: bindparam("value")}),
+                        stale
+                    )
+                    db.commit()
+                    rewritten[key] += len(stale)
+    finally:
+        db.close()
+    return rewritten
 
 def initialize_template_dataset():
-    '''Load 192+ n8n templates into database'''
-    # Implementation loads template dataset (details in dataset_analysis.md)
-    pass
+    '''Load the n8n templates into the database, one row per near-duplicate group'''
+    template_library.load()
+    db = SessionLocal()
+    try:
+        existing = set(db.scalars(select(Template.name)))
+        rows = [
+            {
+                "name": template["name"],
+                "category": template["category"],
+                "description": template["description"],
+                "nodes": template["nodes"],
+                "connections": template["connections"]
+            }
+            for template in template_library.templates if template["name"] not in existing
+        ]
+        if rows:
+            db.execute(insert(Template), rows)
+        
+        # Rows stored before classification existed get their category in one vectorized pass
+        uncategorized = db.execute(
+            select(Template.id, Template.name, Template.description, Template.nodes).where(Template.category.is_(None))
+        ).all()
+        labels = template_library.classifier.classify([
+            {"name": row.name, "description": row.description, "nodes": row.nodes or []} for row in uncategorized
+        ]) if uncategorized else []
+        updates = [{"row_id": row.id, "new_category": category} for row, (category, _) in zip(uncategorized, labels) if category]
+        if updates:
+            db.execute(
+                update(Template.__table__).where(Template.__table__.c.id == bindparam("row_id")).values(category=bindparam("new_category")),
+                updates
+            )
+        db.commit()
+    finally:
+        db.close()
 
 def start_background_services():
     '''Start background services for K9X memory, analytics, etc.'''
-    pass
+    if AutoFlowConfig.GLOBAL_PROFILING_ENABLED:
+        start_global_profiler()
 
 if __name__ == "__main__":
     import uvicorn
     
+    # Subcommands run before the API startup below and set up only what they use: each
+    # worker or maintenance process would otherwise rerun the schema migration, the graph
+    # backfill and the template import, and start the global profiler
+    
+    # Storage maintenance: `train-dictionary` installs a new zstd dictionary version trained on the
+    # template corpus; `recompress` moves existing rows onto the current one (migrating column types first)
+    if sys.argv[1:2] == ["train-dictionary"]:
+        print(f"Installed zstd dictionary v{train_json_dictionary()}")
+        sys.exit(0)
+    if sys.argv[1:2] == ["recompress"]:
+        print(json.dumps(recompress_json_columns(create_engine(AutoFlowConfig.DATABASE_URL)), indent=2))
+        sys.exit(0)
+    # K9X resharding: deploy with the new K9X_REDIS_URLS and the old list in K9X_REDIS_PREVIOUS_URLS,
+    # run `rebalance-k9x` once, then drop K9X_REDIS_PREVIOUS_URLS
+    if sys.argv[1:2] == ["rebalance-k9x"]:
+        print(json.dumps(k9x_session_store.rebalance(), indent=2))
+        sys.exit(0)
+    
+    # Standalone generation worker: `python autoflow_ai_unified_implementation.py worker`
+    # (run API replicas with GENERATION_JOB_WORKERS=0 to scale workers independently; the
+    # API process owns the schema and the template import, templates load lazily here)
+    if sys.argv[1:2] == ["worker"]:
+        asyncio.run(GenerationJobWorker(max(1, AutoFlowConfig.GENERATION_JOB_WORKERS)).run())
+        sys.exit(0)
+    
     # Initialize platform
     create_tables()
+    backfill_workflow_graph()
     initialize_template_dataset()
     start_background_services()
     